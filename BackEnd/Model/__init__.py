@@ -3,8 +3,11 @@ Model package cho FastAPI Demo Application
 """
 
 from .item_models import Item, ItemCreate
-from .chat_models import ChatMessage, ChatRequest, AgentTestcaseRequest
-from .request_models import RequestCreate, RequestResponse, MessageResponse
+from .chat_models import ChatMessage, ChatRequest, AgentTestcaseRequest, BatchTestcaseItem, BatchTestcaseRequest
+from .request_models import RequestCreate, RequestResponse, MessageResponse, RequestPage, MessagePage, SimilarRequest
+from .request_models import TestcaseStep, TestcaseResponse, TestcasePage
+from .job_models import JobResponse
+from .search_models import SearchHit, SearchPage
 
 __all__ = [
     "Item",
@@ -12,7 +15,18 @@ __all__ = [
     "ChatMessage",
     "ChatRequest",
     "AgentTestcaseRequest",
+    "BatchTestcaseItem",
+    "BatchTestcaseRequest",
     "RequestCreate",
     "RequestResponse",
-    "MessageResponse"
+    "MessageResponse",
+    "RequestPage",
+    "MessagePage",
+    "SimilarRequest",
+    "TestcaseStep",
+    "TestcaseResponse",
+    "TestcasePage",
+    "JobResponse",
+    "SearchHit",
+    "SearchPage"
 ]
@@ -2,7 +2,7 @@
 Pydantic models cho Chat-related endpoints
 """
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from fastapi import UploadFile
 
@@ -52,3 +52,25 @@ class AgentTestcaseRequest(BaseModel):
                 "pbi_requirement": "Yêu cầu của màn hình đăng nhập"
             }
         }
+
+class BatchTestcaseItem(BaseModel):
+    """Một yêu cầu sinh testcase trong batch"""
+    title: str
+    pbi_requirement: str
+
+class BatchTestcaseRequest(BaseModel):
+    """Model cho request tới agent-testcase/batch endpoint"""
+    items: List[BatchTestcaseItem] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)  # None: dùng BATCH_MAX_CONCURRENCY
+    bypass_cache: bool = False
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "items": [
+                    {"title": "Màn hình đăng nhập", "pbi_requirement": "Yêu cầu của màn hình đăng nhập"},
+                    {"title": "Màn hình đăng ký", "pbi_requirement": "Yêu cầu của màn hình đăng ký"}
+                ],
+                "concurrency": 4
+            }
+        }
@@ -0,0 +1,32 @@
+"""
+Pydantic models cho background jobs
+"""
+
+from pydantic import BaseModel
+from typing import Optional
+
+class JobResponse(BaseModel):
+    """Model cho trạng thái của một job sinh testcase chạy nền"""
+    job_id: str
+    conversation_id: Optional[str] = None
+    status: str  # "queued", "running", "completed" hoặc "failed"
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    
+    class Config:
+        from_attributes = True
+        schema_extra = {
+            "example": {
+                "job_id": "job_123456",
+                "conversation_id": "conv_123456",
+                "status": "running",
+                "result": None,
+                "error": None,
+                "created_at": 1704067200.0,
+                "started_at": 1704067201.0,
+                "finished_at": None
+            }
+        }
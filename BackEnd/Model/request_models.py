@@ -41,6 +41,28 @@ class RequestResponse(BaseModel):
             }
         }
 
+class SimilarRequest(BaseModel):
+    """Model cho request cũ có yêu cầu PBI gần trùng"""
+    conversation_id: str
+    title: str
+    pbi_requirement: str
+    similarity: float  # Jaccard ước lượng (MinHash) trên shingle ký tự của PBI, 0..1
+    testcase_count: int  # Số testcase đã sinh cho request đó
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+        schema_extra = {
+            "example": {
+                "conversation_id": "conv_123456",
+                "title": "Màn hình đăng nhập",
+                "pbi_requirement": "Yêu cầu của màn hình đăng nhập...",
+                "similarity": 0.82,
+                "testcase_count": 12,
+                "updated_at": "2024-01-01T00:00:00"
+            }
+        }
+
 class MessageResponse(BaseModel):
     """Model cho response của message"""
     id: int
@@ -60,3 +82,39 @@ class MessageResponse(BaseModel):
                 "created_at": "2024-01-01T00:00:00"
             }
         }
+
+
+class RequestPage(BaseModel):
+    """Model cho một trang requests (keyset pagination)"""
+    items: List[RequestResponse]
+    next_cursor: Optional[str] = None  # None khi đã hết dữ liệu
+
+class MessagePage(BaseModel):
+    """Model cho một trang messages (keyset pagination)"""
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None  # None khi đã hết dữ liệu
+
+class TestcaseStep(BaseModel):
+    """Model cho một bước của testcase"""
+    step_no: int
+    action: str
+    expected_result: str
+
+class TestcaseResponse(BaseModel):
+    """Model cho testcase đã tách từ response của agent"""
+    id: int
+    conversation_id: str
+    message_id: int
+    ordinal: int  # Thứ tự trong message chứa testcase (bắt đầu từ 1)
+    title: str
+    steps: List[TestcaseStep]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class TestcasePage(BaseModel):
+    """Model cho một trang testcases (keyset pagination)"""
+    items: List[TestcaseResponse]
+    total: int  # Tổng số testcase của conversation
+    next_cursor: Optional[str] = None  # None khi đã hết dữ liệu
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""
+Pydantic models cho tìm kiếm full-text
+"""
+
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+class SearchHit(BaseModel):
+    """Model cho một kết quả tìm kiếm (request hoặc message)"""
+    kind: str  # "request" hoặc "message"
+    conversation_id: str
+    message_id: Optional[int] = None  # Chỉ có với kind "message"
+    role: Optional[str] = None  # Chỉ có với kind "message"
+    title: Optional[str] = None  # Title của request, đã HTML-escape (với kind "request": có đánh dấu từ khớp)
+    snippet: str  # Đoạn trích quanh từ khớp (đã HTML-escape), từ khớp nằm trong <mark>...</mark>
+    score: Optional[float] = None  # BM25, cao hơn = liên quan hơn (None khi xếp theo thời gian)
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+        schema_extra = {
+            "example": {
+                "kind": "message",
+                "conversation_id": "conv_123456",
+                "message_id": 42,
+                "role": "assistant",
+                "title": "Màn hình đăng nhập",
+                "snippet": "…Testcase 3: <mark>Khoá</mark> tài khoản sau 5 lần…",
+                "score": 7.31,
+                "created_at": "2024-01-01T00:00:00"
+            }
+        }
+
+class SearchPage(BaseModel):
+    """Model cho một trang kết quả tìm kiếm"""
+    items: List[SearchHit]
+    next_cursor: Optional[str] = None  # None khi đã hết kết quả
+    ranking: str = "bm25"  # "bm25" (độ liên quan) hoặc "recent" (mới nhất trước, với từ quá phổ biến)
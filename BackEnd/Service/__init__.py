@@ -2,5 +2,42 @@
 Service Package - Chứa các service logic của ứng dụng
 """
 from .chat_service import ChatService
+from .response_cache import ResponseCache, response_cache
+from .single_flight import SingleFlight, single_flight
+from .image_service import ImageNormalizer, image_normalizer
+from .attachment_service import AttachmentService, AttachmentTooLargeError
+from .retrieval_service import AttachmentRetriever, attachment_retriever
+from .batch_service import BatchService
+from .job_service import JobManager, job_manager
+from .stream_registry import StreamRegistry, StreamGapError, stream_registry
+from .admission_control import AdmissionController, AdmissionRejected, admission_controller
+from .testcase_parser import TestcaseStreamParser
+from .sse_encoder import ChunkFrameEncoder, SSEFrame, coalesce_text, format_event
 
-__all__ = ['ChatService']
+__all__ = [
+    'ChatService',
+    'ResponseCache',
+    'response_cache',
+    'SingleFlight',
+    'single_flight',
+    'ImageNormalizer',
+    'image_normalizer',
+    'AttachmentService',
+    'AttachmentTooLargeError',
+    'AttachmentRetriever',
+    'attachment_retriever',
+    'BatchService',
+    'JobManager',
+    'job_manager',
+    'StreamRegistry',
+    'StreamGapError',
+    'stream_registry',
+    'AdmissionController',
+    'AdmissionRejected',
+    'admission_controller',
+    'TestcaseStreamParser',
+    'ChunkFrameEncoder',
+    'SSEFrame',
+    'coalesce_text',
+    'format_event'
+]
@@ -0,0 +1,265 @@
+"""
+Admission Control - Giới hạn số lời gọi LLM đồng thời, hàng đợi có giới hạn và deadline
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from metrics import registry
+
+# Số lời gọi agent/LLM chạy đồng thời tối đa
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Số request tối đa được chờ trong hàng đợi, vượt quá sẽ bị từ chối ngay (429)
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+# Thời gian chờ tối đa trong hàng đợi (giây)
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Số mẫu thời gian chờ gần nhất giữ lại cho thống kê
+LLM_ADMISSION_STATS_WINDOW = int(os.getenv("LLM_ADMISSION_STATS_WINDOW", "1000"))
+
+# Thời gian giữ slot giả định trước khi có số liệu thực tế (giây)
+_DEFAULT_HOLD_SECONDS = 10.0
+
+ADMISSION_WAIT = registry.histogram(
+    "llm_admission_wait_seconds", "Thời gian chờ trong hàng đợi trước khi được gọi agent"
+)
+ADMISSION_REJECTED = registry.counter(
+    "llm_admission_rejected_total", "Số request bị từ chối bởi admission control", ("reason",)
+)
+
+
+class AdmissionRejected(Exception):
+    """Request bị từ chối vì vượt quá năng lực xử lý"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionTimeout(AdmissionRejected):
+    """Request chờ trong hàng đợi quá LLM_QUEUE_TIMEOUT"""
+
+
+class AdmissionTicket:
+    """
+    Vé của một request: đang chờ trong hàng đợi, đã được cấp slot, hoặc đã trả
+
+    Vé background (job, batch) chờ không giới hạn thời gian và không bị tính vào max_queue.
+    """
+
+    def __init__(self, controller: "AdmissionController", background: bool = False):
+        self._controller = controller
+        self.background = background
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    @property
+    def position(self) -> int:
+        """Vị trí trong hàng đợi (1 = tiếp theo), 0 nếu đã được cấp slot"""
+        return self._controller._position(self)
+
+    async def wait(self):
+        """
+        Chờ tới khi hàng đợi dịch chuyển hoặc được cấp slot
+
+        Raises:
+            AdmissionTimeout: Nếu đã chờ quá queue_timeout mà chưa được cấp slot (vé không phải background)
+        """
+        if self.admitted:
+            return
+        changed = self._controller._changed
+        if self.background:
+            await changed.wait()
+            return
+        remaining = self.enqueued_at + self._controller.queue_timeout - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(changed.wait(), remaining)
+        except asyncio.TimeoutError:
+            if not self.admitted:
+                self._controller._release(self, timed_out=True)
+                raise AdmissionTimeout(
+                    "Hết thời gian chờ trong hàng đợi, vui lòng thử lại sau",
+                    self._controller.retry_after()
+                )
+
+    def release(self):
+        """Trả slot (hoặc rời hàng đợi nếu chưa được cấp); gọi nhiều lần không ảnh hưởng"""
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """
+    Bộ điều phối các lời gọi agent tới LLM upstream
+
+    Tối đa max_concurrency lời gọi chạy cùng lúc, các request tiếp theo chờ theo thứ tự
+    trong hàng đợi tối đa max_queue phần tử. Hàng đợi đầy thì từ chối ngay kèm gợi ý
+    Retry-After (ước lượng từ thời gian giữ slot trung bình); chờ quá queue_timeout thì
+    hết hạn. Nhờ vậy khi tải tăng đột biến, request thừa thất bại nhanh ở phía server
+    thay vì tạo hàng loạt 429/timeout từ upstream cho mọi người.
+
+    Lời gọi background (job, batch) không có client chờ phản hồi nhanh: chúng luôn được xếp
+    vào cùng hàng đợi FIFO, chờ tới khi có slot và không bị tính vào giới hạn max_queue.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        stats_window: int = LLM_ADMISSION_STATS_WINDOW
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: deque = deque()
+        # Số vé background đang chờ trong _waiters
+        self._background_waiting = 0
+        self._changed = asyncio.Event()
+        self._avg_hold: Optional[float] = None
+        # Thời gian chờ (giây) của các request được cấp slot gần nhất
+        self.wait_samples: deque = deque(maxlen=stats_window)
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timeouts": 0, "abandoned": 0}
+
+    def _notify(self):
+        """Đánh thức các request đang chờ để cập nhật vị trí"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def retry_after(self) -> int:
+        """Số giây gợi ý client chờ trước khi thử lại"""
+        hold = self._avg_hold if self._avg_hold is not None else _DEFAULT_HOLD_SECONDS
+        return max(1, math.ceil(hold * (len(self._waiters) + 1) / self.max_concurrency))
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _full(self) -> bool:
+        return self.active >= self.max_concurrency and len(self._waiters) - self._background_waiting >= self.max_queue
+
+    def check(self):
+        """
+        Từ chối sớm (trước khi bắt đầu response) nếu hàng đợi đã đầy
+
+        Raises:
+            AdmissionRejected: Nếu không còn chỗ trong hàng đợi
+        """
+        if self._full():
+            self.stats["rejected"] += 1
+            ADMISSION_REJECTED.inc("queue_full")
+            raise AdmissionRejected("Server đang quá tải, vui lòng thử lại sau", self.retry_after())
+
+    def enqueue(self, background: bool = False) -> AdmissionTicket:
+        """
+        Xin slot: được cấp ngay nếu còn chỗ, ngược lại xếp vào hàng đợi
+
+        Args:
+            background: Lời gọi chạy nền (job, batch): không bị từ chối và chờ không giới hạn
+
+        Raises:
+            AdmissionRejected: Nếu hàng đợi đã đầy (chỉ với lời gọi không phải background)
+        """
+        if not background:
+            self.check()
+        ticket = AdmissionTicket(self, background)
+        if self.active < self.max_concurrency and not self._waiters:
+            self._admit(ticket)
+        else:
+            self._waiters.append(ticket)
+            self.stats["queued"] += 1
+            if background:
+                self._background_waiting += 1
+        return ticket
+
+    @asynccontextmanager
+    async def slot(self, background: bool = False) -> AsyncIterator[AdmissionTicket]:
+        """Giữ một slot trong phạm vi `async with` (chờ trong hàng đợi nếu cần)"""
+        ticket = self.enqueue(background)
+        try:
+            while not ticket.admitted:
+                await ticket.wait()
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def hold(self, ticket: AdmissionTicket, source: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """Phát lại source và trả slot của ticket khi source kết thúc, lỗi hoặc bị đóng"""
+        try:
+            async for item in source:
+                yield item
+        finally:
+            ticket.release()
+
+    def _position(self, ticket: AdmissionTicket) -> int:
+        if ticket.admitted or ticket.released:
+            return 0
+        return self._waiters.index(ticket) + 1
+
+    def _admit(self, ticket: AdmissionTicket):
+        ticket.admitted_at = time.monotonic()
+        self.active += 1
+        self.stats["admitted"] += 1
+        self.wait_samples.append(ticket.admitted_at - ticket.enqueued_at)
+        ADMISSION_WAIT.observe(ticket.admitted_at - ticket.enqueued_at)
+
+    def _admit_waiters(self):
+        while self.active < self.max_concurrency and self._waiters:
+            ticket = self._waiters.popleft()
+            if ticket.background:
+                self._background_waiting -= 1
+            self._admit(ticket)
+
+    def _release(self, ticket: AdmissionTicket, timed_out: bool = False):
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.admitted:
+            self.active -= 1
+            # Trung bình trượt thời gian giữ slot, dùng cho Retry-After
+            hold = time.monotonic() - ticket.admitted_at
+            self._avg_hold = hold if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * hold
+            self._admit_waiters()
+        else:
+            self._waiters.remove(ticket)
+            if ticket.background:
+                self._background_waiting -= 1
+            self.stats["timeouts" if timed_out else "abandoned"] += 1
+            if timed_out:
+                ADMISSION_REJECTED.inc("timeout")
+        self._notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê slot đang dùng, độ sâu hàng đợi và thời gian chờ"""
+        waits = sorted(self.wait_samples)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1)
+
+        return {
+            **self.stats,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "background_waiting": self._background_waiting,
+            "wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)},
+            "avg_hold_seconds": round(self._avg_hold, 3) if self._avg_hold is not None else None,
+        }
+
+
+# Singleton instance
+admission_controller = AdmissionController()
@@ -0,0 +1,250 @@
+"""
+Attachment Service - Pipeline đọc file đính kèm theo từng chunk với giới hạn dung lượng
+"""
+import codecs
+import hashlib
+import os
+from typing import List, Optional
+
+from fastapi import UploadFile
+
+from attachment_store import AttachmentStore, attachment_store
+from .image_service import ImageNormalizer, image_normalizer
+
+# Dung lượng tối đa của một file đính kèm (bytes)
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(20 * 1024 * 1024)))
+# Số ký tự text tối đa được decode từ file text (phần đưa vào prompt do AttachmentRetriever chọn từ đây).
+# Phần còn lại của file vẫn được đọc để tính SHA-256 và kiểm tra dung lượng nhưng không được decode/giữ lại
+ATTACHMENT_TEXT_MAX_CHARS = int(os.getenv("ATTACHMENT_TEXT_MAX_CHARS", str(1_000_000)))
+# Kích thước mỗi lần đọc từ upload stream
+ATTACHMENT_READ_CHUNK_SIZE = 64 * 1024
+# Content của file không phải text (ảnh, file rỗng, lỗi đọc) bắt đầu bằng các prefix này
+_PLACEHOLDER_PREFIXES = ("[IMAGE:", "[EMPTY FILE:", "[ERROR READING FILE:")
+
+
+class AttachmentTooLargeError(Exception):
+    """File đính kèm vượt quá ATTACHMENT_MAX_BYTES"""
+
+    def __init__(self, file_name: str, max_bytes: int):
+        super().__init__(f"File {file_name} vượt quá dung lượng cho phép ({max_bytes} bytes)")
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+
+
+class IngestedAttachment:
+    """Kết quả ingest một file đính kèm"""
+
+    def __init__(
+        self,
+        file_name: str,
+        mime_type: Optional[str],
+        size: int,
+        sha256: Optional[str],
+        content: str,
+        attachment_id: Optional[str] = None,
+        original_size: Optional[int] = None
+    ):
+        self.file_name = file_name
+        self.mime_type = mime_type
+        self.size = size
+        # Dung lượng file gốc (khác size nếu ảnh đã được chuẩn hóa)
+        self.original_size = original_size if original_size is not None else size
+        self.sha256 = sha256
+        # Mô tả/nội dung text dùng trong prompt
+        self.content = content
+        # Handle của file ảnh trong AttachmentStore (None với file text)
+        self.attachment_id = attachment_id
+
+    @property
+    def is_image(self) -> bool:
+        return self.attachment_id is not None
+
+
+class _TextBudgetDecoder:
+    """
+    Decode UTF-8 tăng dần và dừng khi đủ ngân sách ký tự
+
+    Không giữ bản sao bytes gốc: chỉ khi gặp lỗi decode (file không phải UTF-8) mới dựng lại
+    tối đa max_chars bytes đầu từ phần đã decode (encode lại UTF-8 cho đúng bytes gốc) cộng phần
+    đang chờ trong decoder, rồi tiếp tục gom bytes tới đủ ngân sách để fallback sang latin-1.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._parts: List[str] = []
+        self._length = 0
+        # Bytes đầu của file cho fallback latin-1 (chỉ tạo khi gặp lỗi decode)
+        self._head: Optional[bytearray] = None
+        self._total_bytes = 0
+        self.truncated = False
+
+    @property
+    def utf8(self) -> bool:
+        return self._head is None
+
+    @property
+    def full(self) -> bool:
+        return self._length >= self.max_chars
+
+    def _fallback(self, data: bytes = b"", pending: Optional[bytes] = None):
+        """Chuyển sang latin-1: dựng lại bytes đầu của file từ phần đã decode"""
+        if pending is None:
+            pending = self._decoder.getstate()[0]
+        self._head = bytearray("".join(self._parts).encode("utf-8"))
+        self._head += pending
+        self._head += data
+        del self._head[self.max_chars:]
+        self._parts = []
+
+    def update(self, data: bytes):
+        self._total_bytes += len(data)
+        if not self.utf8:
+            if len(self._head) < self.max_chars:
+                self._head += data[:self.max_chars - len(self._head)]
+            return
+        if self.full:
+            self.truncated = True
+            return
+        try:
+            text = self._decoder.decode(data)
+        except UnicodeDecodeError:
+            self._fallback(data)
+            return
+        self._parts.append(text)
+        self._length += len(text)
+
+    def _latin1_head(self) -> str:
+        # latin-1 map 1 byte -> 1 ký tự nên head đủ cho ngân sách
+        self.truncated = self._total_bytes > self.max_chars
+        return self._head.decode("latin-1")
+
+    def finish(self) -> str:
+        if not self.utf8:
+            return self._latin1_head()
+        if not self.full:
+            # Bytes còn chờ trong decoder (decode lỗi sẽ xoá trạng thái)
+            pending = self._decoder.getstate()[0]
+            try:
+                self._parts.append(self._decoder.decode(b"", final=True))
+            except UnicodeDecodeError:
+                self._fallback(pending=pending)
+                return self._latin1_head()
+        text = "".join(self._parts)
+        if len(text) > self.max_chars:
+            text = text[:self.max_chars]
+            self.truncated = True
+        return text
+
+
+class AttachmentService:
+    """
+    Service ingest file đính kèm dùng chung cho endpoint và ChatService
+
+    File được đọc theo từng chunk: giới hạn dung lượng được kiểm tra trước và trong khi đọc,
+    file text chỉ được decode tới ngân sách ký tự. File ảnh được lưu một lần trong AttachmentStore
+    theo SHA-256 của file gốc: upload trùng dùng lại bản đã lưu, upload mới được chuẩn hóa
+    (resize, bỏ metadata, encode lại) qua ImageNormalizer trước khi lưu.
+    """
+
+    @staticmethod
+    def is_text_content(content: Optional[str]) -> bool:
+        """Content là nội dung text thật của file (không phải mô tả ảnh/placeholder)"""
+        return bool(content) and not content.startswith(_PLACEHOLDER_PREFIXES)
+
+    @staticmethod
+    async def ingest(
+        upload: UploadFile,
+        max_bytes: int = ATTACHMENT_MAX_BYTES,
+        text_max_chars: int = ATTACHMENT_TEXT_MAX_CHARS,
+        normalizer: ImageNormalizer = image_normalizer,
+        store: AttachmentStore = attachment_store
+    ) -> IngestedAttachment:
+        """
+        Đọc và xử lý một file upload
+
+        Args:
+            upload: File upload từ FastAPI
+            max_bytes: Dung lượng tối đa cho phép
+            text_max_chars: Số ký tự text tối đa được giữ lại
+            normalizer: Bộ chuẩn hóa ảnh
+            store: Kho lưu file ảnh
+
+        Returns:
+            IngestedAttachment: Thông tin và nội dung đã xử lý của file
+
+        Raises:
+            AttachmentTooLargeError: Nếu file vượt quá max_bytes
+        """
+        file_name = upload.filename or "unknown_file"
+        mime_type = upload.content_type
+
+        # Kiểm tra sớm bằng size do framework cung cấp, trước khi đọc bất kỳ byte nào
+        if upload.size is not None and upload.size > max_bytes:
+            raise AttachmentTooLargeError(file_name, max_bytes)
+
+        try:
+            try:
+                await upload.seek(0)
+            except Exception:
+                pass
+
+            is_image = bool(mime_type and mime_type.startswith("image/"))
+            digest = hashlib.sha256()
+            # Ảnh chỉ được hash khi đọc, không giữ lại: base64 chỉ được tạo từ bản đã lưu khi gọi model
+            decoder = None if is_image else _TextBudgetDecoder(text_max_chars)
+            size = 0
+
+            while True:
+                chunk = await upload.read(ATTACHMENT_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise AttachmentTooLargeError(file_name, max_bytes)
+                digest.update(chunk)
+                if decoder is not None:
+                    decoder.update(chunk)
+        except AttachmentTooLargeError:
+            raise
+        except Exception as read_error:
+            return IngestedAttachment(
+                file_name, mime_type, 0, None,
+                f"[ERROR READING FILE: {file_name}] - {str(read_error)}"
+            )
+
+        if size == 0:
+            return IngestedAttachment(file_name, mime_type, 0, None, f"[EMPTY FILE: {file_name}]")
+
+        if decoder is None:
+            attachment_id = digest.hexdigest()
+            # Upload trùng nội dung: dùng lại bản đã chuẩn hóa, không đọc lại và không xử lý lại ảnh
+            stored = await store.find(attachment_id)
+            if stored is None:
+                # Chỉ ảnh mới được đọc lại (đã kiểm tra dung lượng) để giải mã/chuẩn hóa
+                try:
+                    await upload.seek(0)
+                    data = await upload.read()
+                except Exception as read_error:
+                    return IngestedAttachment(
+                        file_name, mime_type, 0, None,
+                        f"[ERROR READING FILE: {file_name}] - {str(read_error)}"
+                    )
+                image = await normalizer.normalize(data, mime_type)
+                del data
+                stored = await store.put(attachment_id, image.mime_type, image.data, image.original_bytes)
+
+            size_info = f"{stored['size_bytes']} bytes"
+            if stored["size_bytes"] != stored["original_size"]:
+                size_info += f" (gốc {stored['original_size']} bytes)"
+            return IngestedAttachment(
+                file_name, stored["mime_type"], stored["size_bytes"], attachment_id,
+                f"[IMAGE: {file_name}] - Size: {size_info}, Content-Type: {stored['mime_type']}",
+                attachment_id=attachment_id,
+                original_size=stored["original_size"]
+            )
+
+        text_content = decoder.finish()
+        if decoder.truncated:
+            text_content += "... (truncated)"
+        return IngestedAttachment(file_name, mime_type, size, digest.hexdigest(), text_content)
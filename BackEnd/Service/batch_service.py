@@ -0,0 +1,141 @@
+"""
+Batch Service - Sinh testcase cho nhiều yêu cầu cùng lúc với giới hạn concurrency
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from Model import BatchTestcaseItem
+from database import async_db_manager
+from .chat_service import ChatService
+from .sse_encoder import dumps
+
+# Số generation chạy đồng thời tối đa của một batch
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+# Số item tối đa trong một batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+
+
+class BatchService:
+    """
+    Service chạy batch các yêu cầu sinh testcase
+
+    Mỗi item có một request/conversation riêng (tạo chung trong một transaction) và được
+    xử lý qua ChatService.process_agent_testcase_stream, nên dùng chung response cache,
+    single-flight và lưu messages như /agent-testcase. Kết quả được trả về theo thứ tự
+    hoàn thành; lỗi của một item không ảnh hưởng các item khác.
+    """
+
+    @staticmethod
+    def format_event(data: Dict[str, Any], output_format: str) -> str:
+        """Format event thành SSE frame hoặc một dòng NDJSON"""
+        if output_format == "ndjson":
+            return dumps(data) + "\n"
+        return ChatService._format_sse(data)
+
+    @staticmethod
+    async def _run_item(
+        index: int,
+        request: Dict[str, Any],
+        bypass_cache: bool
+    ) -> Dict[str, Any]:
+        """Chạy một item tới khi xong, trả về event kết quả (không raise)"""
+        conversation_id = request["conversation_id"]
+        start = time.perf_counter()
+        content_parts: List[str] = []
+        result: Dict[str, Any] = {
+            "type": "item",
+            "index": index,
+            "conversation_id": conversation_id,
+            "title": request["title"],
+        }
+        try:
+            async for frame in ChatService.process_agent_testcase_stream(
+                conversation_id=conversation_id,
+                title=request["title"],
+                pbi_requirement=request["pbi_requirement"],
+                bypass_cache=bypass_cache,
+                background=True
+            ):
+                data = json.loads(frame[len("data: "):])
+                if data["type"] == "chunk":
+                    content_parts.append(data["content"])
+                elif data["type"] == "error":
+                    raise RuntimeError(data.get("message", "Lỗi không xác định"))
+                elif data["type"] == "end":
+                    result["cached"] = bool(data.get("cached"))
+            result.update(status="completed", content="".join(content_parts))
+        except Exception as e:
+            result.update(status="error", message=str(e))
+        result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    @staticmethod
+    async def process_batch_stream(
+        items: List[BatchTestcaseItem],
+        concurrency: Optional[int] = None,
+        bypass_cache: bool = False,
+        output_format: str = "sse"
+    ) -> AsyncGenerator[str, None]:
+        """
+        Xử lý batch với streaming kết quả theo từng item
+
+        Args:
+            items: Danh sách yêu cầu {title, pbi_requirement}
+            concurrency: Số generation chạy đồng thời (tối đa BATCH_MAX_CONCURRENCY)
+            bypass_cache: Bỏ qua response cache cho mọi item
+            output_format: "sse" hoặc "ndjson"
+
+        Yields:
+            str: Event batch_start, một event item cho mỗi item khi hoàn thành, event batch_end
+        """
+        limit = min(concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+        try:
+            requests = await async_db_manager.create_requests(
+                [(item.title, item.pbi_requirement) for item in items]
+            )
+        except Exception as e:
+            yield BatchService.format_event({"type": "error", "message": str(e)}, output_format)
+            return
+
+        yield BatchService.format_event({
+            "type": "batch_start",
+            "total": len(requests),
+            "concurrency": limit,
+            "items": [
+                {"index": i, "conversation_id": request["conversation_id"], "title": request["title"]}
+                for i, request in enumerate(requests)
+            ]
+        }, output_format)
+
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run_limited(index: int, request: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await BatchService._run_item(index, request, bypass_cache)
+
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(run_limited(i, request)) for i, request in enumerate(requests)]
+        completed = failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result["status"] == "completed":
+                    completed += 1
+                else:
+                    failed += 1
+                yield BatchService.format_event(result, output_format)
+        finally:
+            # Client ngắt kết nối: hủy các item chưa xong
+            for task in tasks:
+                task.cancel()
+
+        yield BatchService.format_event({
+            "type": "batch_end",
+            "total": len(requests),
+            "completed": completed,
+            "failed": failed,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1)
+        }, output_format)
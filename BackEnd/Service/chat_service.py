@@ -2,14 +2,25 @@
 Chat Service - Xử lý logic chat và streaming
 """
 from typing import List, AsyncGenerator, Dict, Any, Optional
-import json
-import base64
 import asyncio
+import os
 import time
+import uuid
 from Model import ChatMessage
-from agent import agent, AgentManager
+from agent import aget_agent, pin_thread, AgentManager, PROMPT_VERSION
 from fastapi import UploadFile
-from database import db_manager
+from database import async_db_manager
+from attachment_store import AttachmentStore
+from metrics import record_agent_call
+from similarity import SIMILAR_REQUESTS_ENABLED, SIMILAR_REQUESTS_LIMIT, SIMILAR_SEED_MAX_TESTCASES
+from tracing import NOOP_TRACE, tracer
+from .response_cache import response_cache
+from .single_flight import single_flight
+from .admission_control import AdmissionRejected, AdmissionTicket, admission_controller
+from .attachment_service import AttachmentService
+from .retrieval_service import attachment_retriever
+from .testcase_parser import TestcaseStreamParser
+from .sse_encoder import ChunkFrameEncoder, coalesce_text, format_event, group_text
 
 
 class ChatService:
@@ -17,6 +28,147 @@ class ChatService:
     Service class để xử lý các chức năng chat
     """
     
+    # "messages": forward token ngay khi model sinh ra (LangGraph stream_mode="messages")
+    # "updates": hành vi cũ - chờ trọn message của node agent rồi chia thành từng đoạn 50 ký tự
+    stream_mode: str = os.getenv("AGENT_STREAM_MODE", "messages")
+    
+    @staticmethod
+    def _format_sse(data: Dict[str, Any]) -> str:
+        """Format một event thành Server-Sent Events frame"""
+        return format_event(data)
+    
+    @staticmethod
+    def _testcase_event(testcase: Dict[str, Any], conversation_id: Optional[str]) -> str:
+        """Event "testcase": một testcase đã hoàn chỉnh trong response đang stream"""
+        return ChatService._format_sse({"type": "testcase", **testcase, "conversation_id": conversation_id})
+    
+    @staticmethod
+    def _extract_text(content: Any) -> str:
+        """Lấy phần text từ content của message (string hoặc list content blocks)"""
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            parts = []
+            for block in content:
+                if isinstance(block, str):
+                    parts.append(block)
+                elif isinstance(block, dict) and block.get("type") == "text":
+                    parts.append(block.get("text", ""))
+            return "".join(parts)
+        return ""
+    
+    @staticmethod
+    async def _stream_agent_text(
+        agent_input: Dict[str, Any],
+        config: Optional[Dict[str, Any]] = None,
+        trace=NOOP_TRACE
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream text do node agent sinh ra
+        
+        Args:
+            agent_input: Input cho agent ({"messages": [...]})
+            config: Config của agent (thread_id,...)
+            trace: Trace của request; các bước graph, lời gọi LLM và tool được ghi thành span con
+            
+        Yields:
+            str: Từng đoạn text theo thứ tự sinh ra
+        """
+        with trace.span("agent.build"):
+            agent = await aget_agent()
+        span = trace.start_span("agent.stream", mode=ChatService.stream_mode)
+        if trace.enabled:
+            from trace_callback import AgentTraceCallback
+            config = {**(config or {}), "callbacks": [AgentTraceCallback(trace, span)]}
+        error = None
+        start = time.perf_counter()
+        outcome = "error"
+        # Thread không bị evict khỏi hot tier của checkpointer giữa các bước của lần chạy này
+        with pin_thread((config or {}).get("configurable", {}).get("thread_id")):
+            try:
+                if ChatService.stream_mode == "updates":
+                    # Hành vi cũ: nhận trọn message rồi chia nhỏ với delay giả lập
+                    async for chunk in agent.astream(agent_input, config=config):
+                        # Langgraph agent trả về structure: {'agent': {'messages': [...]}}
+                        if isinstance(chunk, dict) and isinstance(chunk.get('agent'), dict):
+                            for message in chunk['agent'].get('messages', []):
+                                content = ChatService._extract_text(getattr(message, 'content', None))
+                                chunk_size = 50  # Chia nhỏ content
+                                for i in range(0, len(content), chunk_size):
+                                    yield content[i:i + chunk_size]
+                                    # Thêm delay nhỏ để tạo streaming effect
+                                    await asyncio.sleep(0.05)
+                else:
+                    from langchain_core.messages import AIMessageChunk
+                    # Token-level: mỗi item là (message chunk, metadata) ngay khi model sinh token
+                    async for message, metadata in agent.astream(agent_input, config=config, stream_mode="messages"):
+                        # Bỏ qua output của tool node, chỉ forward token của model
+                        if metadata.get("langgraph_node") != "agent" or not isinstance(message, AIMessageChunk):
+                            continue
+                        text = ChatService._extract_text(message.content)
+                        if text:
+                            yield text
+                outcome = "ok"
+            except (GeneratorExit, asyncio.CancelledError) as e:
+                outcome = "cancelled"
+                error = e
+                raise
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                record_agent_call("stream", start, outcome)
+                span.end(error=error)
+    
+    @staticmethod
+    async def traced_stream(trace, stream: AsyncGenerator[str, None], debug: bool = False) -> AsyncGenerator[str, None]:
+        """
+        Phát lại stream SSE, kết thúc và xuất trace khi stream xong
+        
+        Args:
+            trace: Trace của request
+            stream: Stream SSE được trace
+            debug: Gửi thêm event "timing" (thời gian từng giai đoạn) sau cùng
+        """
+        error = None
+        try:
+            async for frame in stream:
+                yield frame
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            tracer.finish(trace, error=error)
+        if debug and trace.enabled:
+            yield ChatService._format_sse({"type": "timing", **trace.breakdown()})
+    
+    @staticmethod
+    def _ephemeral_config() -> Dict[str, Any]:
+        """Config cho lời gọi /chat: thread tạm riêng (checkpointer yêu cầu thread_id, thread temp_* chỉ giữ trong bộ nhớ)"""
+        return {"configurable": {"thread_id": f"temp_chat_{uuid.uuid4().hex}"}}
+    
+    @staticmethod
+    async def _wait_for_slot(ticket: AdmissionTicket, conversation_id: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """
+        Chờ tới khi ticket được cấp slot gọi agent
+        
+        Yields:
+            str: Event "queued" với vị trí trong hàng đợi mỗi khi vị trí thay đổi
+            
+        Raises:
+            AdmissionTimeout: Nếu chờ quá thời gian cho phép
+        """
+        last_position = None
+        while not ticket.admitted:
+            position = ticket.position
+            if position != last_position:
+                last_position = position
+                data = {"type": "queued", "position": position}
+                if conversation_id:
+                    data["conversation_id"] = conversation_id
+                yield ChatService._format_sse(data)
+            await ticket.wait()
+    
     @staticmethod
     async def generate_stream_response(messages: List[ChatMessage]) -> AsyncGenerator[str, None]:
         """
@@ -37,56 +189,57 @@ class ChatService:
                     "content": msg.content
                 })
             
-            # Gọi agent với streaming
-            response = agent.astream({"messages": agent_messages})
+            # Chờ slot gọi agent (báo vị trí hàng đợi cho client)
+            ticket = admission_controller.enqueue()
+            try:
+                async for event in ChatService._wait_for_slot(ticket):
+                    yield event
+            except BaseException:
+                ticket.release()
+                raise
             
-            # Stream từng chunk của response
-            async for chunk in response:
-                # Langgraph agent trả về structure: {'agent': {'messages': [...]}}
-                if isinstance(chunk, dict):
-                    # Kiểm tra structure của langgraph
-                    if 'agent' in chunk and isinstance(chunk['agent'], dict):
-                        agent_data = chunk['agent']
-                        if 'messages' in agent_data:
-                            for message in agent_data['messages']:
-                                if hasattr(message, 'content') and message.content:
-                                    # Split content thành chunks nhỏ để tạo streaming effect
-                                    content = message.content
-                                    chunk_size = 50  # Chia nhỏ content
-                                    
-                                    for i in range(0, len(content), chunk_size):
-                                        chunk_content = content[i:i + chunk_size]
-                                        data = {
-                                            "type": "chunk",
-                                            "content": chunk_content,
-                                            "role": "assistant"
-                                        }
-                                        yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-                                        
-                                        # Thêm delay nhỏ để tạo streaming effect
-                                        await asyncio.sleep(0.05)
-                    
-                    # Fallback cho structure cũ
-                    elif 'messages' in chunk:
-                        for message in chunk['messages']:
-                            if hasattr(message, 'content') and message.content:
-                                data = {
-                                    "type": "message",
-                                    "content": message.content,
-                                    "role": "assistant"
-                                }
-                                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            # Gọi agent với streaming và forward text (các token sát nhau được gộp thành một frame)
+            encoder = ChunkFrameEncoder()
+            async for text in coalesce_text(admission_controller.hold(
+                ticket, ChatService._stream_agent_text({"messages": agent_messages}, ChatService._ephemeral_config())
+            )):
+                yield encoder.encode(text)
             
             # Gửi signal kết thúc stream
-            yield f"data: {json.dumps({'type': 'end'}, ensure_ascii=False)}\n\n"
+            yield ChatService._format_sse({'type': 'end'})
             
+        except AdmissionRejected as e:
+            yield ChatService._format_sse({"type": "error", "message": str(e), "retry_after": e.retry_after})
         except Exception as e:
             # Gửi lỗi qua stream
             error_data = {
                 "type": "error",
                 "message": str(e)
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield ChatService._format_sse(error_data)
+    
+    @staticmethod
+    async def _thread_version(config: Dict[str, Any]) -> Optional[str]:
+        """checkpoint_id hiện tại của thread (None nếu thread chưa có lịch sử hội thoại)"""
+        agent = await aget_agent()
+        state = await agent.aget_state(config)
+        if not state.values.get("messages"):
+            return None
+        return (state.config or {}).get("configurable", {}).get("checkpoint_id") or ""
+    
+    @staticmethod
+    async def _record_turn(config: Dict[str, Any], user_message: Dict[str, Any], assistant_content: str):
+        """
+        Ghi một lượt hỏi/đáp không đi qua model (ví dụ cache hit) vào memory của agent,
+        để các lượt sau của conversation vẫn có đầy đủ ngữ cảnh
+        """
+        from langchain_core.messages import AIMessage
+        agent = await aget_agent()
+        await agent.aupdate_state(
+            config,
+            {"messages": [user_message, AIMessage(content=assistant_content)]},
+            as_node="agent"
+        )
     
     @staticmethod
     async def process_chat_request(messages: List[ChatMessage]) -> Dict[str, Any]:
@@ -111,8 +264,18 @@ class ChatService:
                     "content": msg.content
                 })
             
-            # Gọi agent
-            result = agent.invoke({"messages": agent_messages})
+            # Gọi agent (chờ slot nếu đang đủ số lời gọi đồng thời)
+            agent = await aget_agent()
+            async with admission_controller.slot():
+                start = time.perf_counter()
+                config = ChatService._ephemeral_config()
+                try:
+                    with pin_thread(config["configurable"]["thread_id"]):
+                        result = await agent.ainvoke({"messages": agent_messages}, config)
+                except Exception:
+                    record_agent_call("invoke", start, "error")
+                    raise
+                record_agent_call("invoke", start, "ok")
             
             # Extract response content
             if 'messages' in result and len(result['messages']) > 0:
@@ -127,79 +290,24 @@ class ChatService:
                     "content": "Xin lỗi, tôi không thể xử lý yêu cầu của bạn."
                 }
                 
+        except AdmissionRejected:
+            raise
         except Exception as e:
             raise Exception(f"Lỗi xử lý chat: {str(e)}")
     
     @staticmethod
     async def _process_file_attachment(file_attachment: Optional[UploadFile]) -> tuple[Optional[str], Optional[str]]:
         """
-        Xử lý file attachment riêng biệt để tránh lỗi I/O
+        Xử lý file attachment qua pipeline ingest dùng chung với endpoint
         
         Returns:
             tuple: (file_name, file_content)
         """
         if not file_attachment:
             return None, None
-            
-        file_name = file_attachment.filename or "unknown_file"
-        file_content = None
         
-        try:
-            # Luôn cố gắng reset file pointer về đầu file và đọc ngay
-            try:
-                await file_attachment.seek(0)
-            except Exception:
-                pass
-            
-            try:
-                file_bytes = await file_attachment.read()
-            except Exception as read_error:
-                # Thử seek rồi đọc lại một lần
-                try:
-                    await file_attachment.seek(0)
-                    file_bytes = await file_attachment.read()
-                except Exception:
-                    file_content = f"[ERROR READING FILE: {file_name}] - {str(read_error)}"
-                    return file_name, file_content
-            
-            # Đảm bảo file_bytes không rỗng
-            if not file_bytes or len(file_bytes) == 0:
-                file_content = f"[EMPTY FILE: {file_name}]"
-            else:
-                # Nếu là file ảnh
-                if file_attachment.content_type and file_attachment.content_type.startswith('image/'):
-                    # Tạo base64 string từ bytes cho future use
-                    try:
-                        base64_string = base64.b64encode(file_bytes).decode('utf-8')
-                        file_content = f"[IMAGE: {file_name}] - Size: {len(file_bytes)} bytes, Content-Type: {file_attachment.content_type}"
-                    except Exception as b64_error:
-                        file_content = f"[IMAGE PROCESSING ERROR: {file_name}] - {str(b64_error)}"
-                else:
-                    # Nếu là text file, đọc content
-                    try:
-                        file_content = file_bytes.decode('utf-8')
-                        # Giới hạn độ dài content để tránh message quá dài
-                        if len(file_content) > 2000:
-                            file_content = file_content[:2000] + "... (truncated)"
-                    except UnicodeDecodeError:
-                        # Thử với các encoding khác
-                        try:
-                            file_content = file_bytes.decode('latin-1')
-                            if len(file_content) > 2000:
-                                file_content = file_content[:2000] + "... (truncated)"
-                        except Exception:
-                            file_content = f"[BINARY FILE: {file_name}] - Size: {len(file_bytes)} bytes"
-                        
-        except Exception as file_error:
-            # Log chi tiết lỗi để debug
-            error_details = f"Type: {type(file_error).__name__}, Message: {str(file_error)}"
-            file_content = f"[CRITICAL ERROR READING FILE: {file_name}] - {error_details}"
-            
-        finally:
-            # Không đóng file tại đây để tránh ảnh hưởng tới lifecycle của framework
-            pass
-            
-        return file_name, file_content
+        attachment = await AttachmentService.ingest(file_attachment)
+        return attachment.file_name, attachment.content
 
     @staticmethod
     async def process_agent_testcase_stream(
@@ -209,8 +317,13 @@ class ChatService:
         file_attachment: Optional[UploadFile] = None,
         preloaded_file_name: Optional[str] = None,
         preloaded_file_content: Optional[str] = None,
-        preloaded_base64_data: Optional[str] = None,
-        preloaded_mime_type: Optional[str] = None
+        preloaded_attachment_id: Optional[str] = None,
+        preloaded_mime_type: Optional[str] = None,
+        attachment_digest: Optional[str] = None,
+        bypass_cache: bool = False,
+        reuse_similar: bool = False,
+        background: bool = False,
+        trace=NOOP_TRACE
     ) -> AsyncGenerator[str, None]:
         """
         Xử lý agent testcase request với streaming response
@@ -220,6 +333,12 @@ class ChatService:
             title: Tiêu đề của testcase
             pbi_requirement: Yêu cầu PBI
             file_attachment: File đính kèm (nếu có)
+            preloaded_attachment_id: Handle của ảnh trong AttachmentStore (nếu có)
+            attachment_digest: SHA-256 của file đính kèm, dùng cho cache key
+            bypass_cache: Bỏ qua response cache và luôn gọi agent
+            reuse_similar: Đưa testcase của request cũ gần trùng nhất vào prompt để agent chỉ sửa phần khác biệt
+            background: Chạy nền (job, batch): chờ slot gọi agent tới khi có thay vì bị từ chối/hết hạn
+            trace: Trace của request (tracing.Trace), mặc định không trace
             
         Yields:
             str: Server-Sent Events formatted strings
@@ -230,24 +349,68 @@ class ChatService:
                 file_name, file_content = preloaded_file_name, preloaded_file_content
             else:
                 # Nếu chưa preload, xử lý ngay đầu stream
-                file_name, file_content = await ChatService._process_file_attachment(file_attachment)
+                with trace.span("attachment.preload"):
+                    file_name, file_content = await ChatService._process_file_attachment(file_attachment)
+            
+            # File text: chỉ đưa các đoạn liên quan tới title + PBI (trong ngân sách token) vào prompt
+            file_excerpt = None
+            if AttachmentService.is_text_content(file_content):
+                with trace.span("retrieval.select", chars=len(file_content)):
+                    file_excerpt = await attachment_retriever.select(
+                        file_content,
+                        f"{title}\n{pbi_requirement}",
+                        digest=attachment_digest
+                    )
             
-            # Tạo message với context đầy đủ (không truyền file content)
+            # Tạo message với context đầy đủ
             message_content = AgentManager.create_message_with_context(
                 title=title,
                 pbi_requirement=pbi_requirement,
                 has_file=file_content is not None,
-                file_name=file_name
+                file_name=file_name,
+                file_excerpt=file_excerpt
             )
             
             # Lưu user message vào database nếu có conversation_id
             if conversation_id:
-                db_manager.add_message(conversation_id, "user", message_content)
+                with trace.span("db.add_message", role="user"):
+                    await async_db_manager.add_message(conversation_id, "user", message_content)
             
             # Tạo config cho agent với thread_id
             # Luôn cần thread_id để sử dụng memory checkpointer
-            thread_id = conversation_id or f"temp_{int(time.time())}"
+            thread_id = conversation_id or f"temp_{uuid.uuid4().hex}"
             config = {"configurable": {"thread_id": thread_id}}
+            # Lượt đầu của thread: dùng cho response cache và tra request gần trùng
+            thread_version = await ChatService._thread_version(config)
+            new_thread = thread_version is None
+            
+            # Request cũ có PBI gần trùng: báo cho client (event "similar") và, khi reuse_similar,
+            # đưa testcase của request đó vào prompt thay vì sinh lại từ đầu
+            agent_text = message_content
+            cache_version = PROMPT_VERSION
+            if new_thread and SIMILAR_REQUESTS_ENABLED:
+                with trace.span("similarity.lookup") as span:
+                    similar = await async_db_manager.find_similar_requests(
+                        pbi_requirement, exclude_conversation_id=conversation_id, limit=SIMILAR_REQUESTS_LIMIT
+                    )
+                    span.attributes["matches"] = len(similar)
+                if similar:
+                    yield ChatService._format_sse({
+                        "type": "similar",
+                        "items": [
+                            {key: item[key] for key in ("conversation_id", "title", "similarity", "testcase_count")}
+                            for item in similar
+                        ],
+                        "conversation_id": conversation_id
+                    })
+                seed = next((item for item in similar if item["testcase_count"]), None) if reuse_similar else None
+                if seed:
+                    seed_testcases = await async_db_manager.get_latest_testcases(
+                        seed["conversation_id"], SIMILAR_SEED_MAX_TESTCASES
+                    )
+                    agent_text = AgentManager.add_similar_testcases(message_content, seed, seed_testcases)
+                    # Response phụ thuộc testcase được đưa vào prompt: cache riêng theo request nguồn
+                    cache_version = f"{PROMPT_VERSION}:similar:{seed['conversation_id']}"
             
             # Tạo message content cho agent (multimodal nếu có ảnh)
             agent_message = {"role": "user"}
@@ -257,90 +420,151 @@ class ChatService:
                 (file_content.startswith("[IMAGE:") or 
                  (preloaded_file_content and preloaded_file_content.startswith("[IMAGE:")))):
                 
-                # Sử dụng preloaded base64 data và mime type
-                base64_data = preloaded_base64_data
+                # Message/checkpoint chỉ giữ handle, ảnh được resolve thành base64 khi gọi model
+                attachment_id = preloaded_attachment_id
                 mime_type = preloaded_mime_type or "image/jpeg"  # default
                 
-                # Nếu có base64 data thì tạo multimodal message
-                if base64_data:
+                if attachment_id:
                     agent_message["content"] = [
                         {
                             "type": "text",
-                            "text": message_content,
-                        },
-                        {
-                            "type": "image",
-                            "source_type": "base64",
-                            "data": base64_data,
-                            "mime_type": mime_type,
+                            "text": agent_text,
                         },
+                        AttachmentStore.make_ref(attachment_id, mime_type),
                     ]
                 else:
-                    # Fallback to text only nếu không lấy được base64
-                    agent_message["content"] = message_content
+                    # Fallback to text only nếu không có ảnh trong kho
+                    agent_message["content"] = agent_text
             else:
                 # Message text thông thường nếu không có ảnh
-                agent_message["content"] = message_content
+                agent_message["content"] = agent_text
             
-            # Gọi agent với streaming và thread_id
-            response = agent.astream(
-                {"messages": [agent_message]},
-                config=config
+            # Tra response cache (chỉ áp dụng cho lượt đầu tiên của thread,
+            # vì các lượt sau phụ thuộc vào lịch sử hội thoại)
+            cache_key = None
+            if response_cache.enabled:
+                if bypass_cache:
+                    response_cache.record_bypass()
+                else:
+                    with trace.span("cache.lookup") as span:
+                        cached_chunks = None
+                        if new_thread:
+                            cache_key = response_cache.make_key(title, pbi_requirement, attachment_digest, cache_version)
+                            cached_chunks = await response_cache.get(cache_key)
+                        span.attributes["hit"] = cached_chunks is not None
+                    if cached_chunks is not None:
+                        parser = TestcaseStreamParser()
+                        testcases = []
+                        encoder = ChunkFrameEncoder(conversation_id=conversation_id)
+                        for text in group_text(cached_chunks):
+                            yield encoder.encode(text)
+                            for testcase in parser.feed(text):
+                                testcases.append(testcase)
+                                yield ChatService._testcase_event(testcase, conversation_id)
+                        for testcase in parser.finish():
+                            testcases.append(testcase)
+                            yield ChatService._testcase_event(testcase, conversation_id)
+                        full_response_content = "".join(cached_chunks)
+                        with trace.span("agent.record_turn"):
+                            await ChatService._record_turn(config, agent_message, full_response_content)
+                        if conversation_id and full_response_content:
+                            with trace.span("db.add_message", role="assistant", testcases=len(testcases)):
+                                await async_db_manager.add_message(
+                                    conversation_id, "assistant", full_response_content, testcases
+                                )
+                        yield ChatService._format_sse({'type': 'end', 'conversation_id': conversation_id, 'cached': True})
+                        return
+            
+            agent_input = {"messages": [agent_message]}
+            # Key single-flight lấy từ chính input của agent, không phụ thuộc response cache (tắt,
+            # bypass hay lượt sau): prompt + handle ảnh, phiên bản model/prompt và trạng thái thread.
+            # Lượt đầu gộp được giữa các thread; lượt sau chỉ gộp với request cùng thread, cùng checkpoint
+            flight_key = single_flight.make_key(
+                PROMPT_VERSION,
+                agent_message["content"],
+                None if new_thread else [thread_id, thread_version]
             )
+            # Request giống hệt đang được generate: subscribe vào stream đó thay vì gọi lại agent
+            flight = single_flight.join(flight_key)
+            if flight is None:
+                # Chỉ lời gọi agent thực sự mới cần slot (cache hit và follower thì không)
+                ticket = admission_controller.enqueue(background)
+                wait_span = trace.start_span("admission.wait", position=ticket.position)
+                try:
+                    async for event in ChatService._wait_for_slot(ticket, conversation_id):
+                        yield event
+                except BaseException as e:
+                    ticket.release()
+                    wait_span.end(error=e)
+                    raise
+                wait_span.end()
+                # Trong lúc chờ, một request giống hệt có thể đã bắt đầu generate
+                flight = single_flight.join(flight_key)
+                if flight is not None:
+                    ticket.release()
+            
+            follower = flight is not None
+            if follower:
+                text_stream = flight.subscribe()
+            else:
+                # Slot được giữ tới khi generation kết thúc (kể cả khi client ngắt kết nối)
+                source = admission_controller.hold(ticket, ChatService._stream_agent_text(agent_input, config, trace))
+                flight = single_flight.start(
+                    flight_key,
+                    source,
+                    on_complete=(lambda chunks: response_cache.put(cache_key, chunks)) if cache_key else None,
+                    owner=thread_id
+                )
+                text_stream = flight.subscribe()
             
             # Biến để lưu full response content
             full_response_content = ""
+            # Tổng thời gian serialize các event chunk (ghi thành một span tổng hợp)
+            serialize_seconds = 0.0
+            chunks = 0
+            # Tách testcase ngay trong lúc stream: event "testcase" được gửi khi mỗi testcase hoàn chỉnh
+            parser = TestcaseStreamParser()
+            testcases = []
+            encoder = ChunkFrameEncoder(conversation_id=conversation_id)
             
-            # Stream từng chunk của response
-            async for chunk in response:
-                # Langgraph agent trả về structure: {'agent': {'messages': [...]}}
-                if isinstance(chunk, dict):
-                    # Kiểm tra structure của langgraph
-                    if 'agent' in chunk and isinstance(chunk['agent'], dict):
-                        agent_data = chunk['agent']
-                        if 'messages' in agent_data:
-                            for message in agent_data['messages']:
-                                if hasattr(message, 'content') and message.content:
-                                    # Lưu full content để save vào database sau
-                                    full_response_content = message.content
-                                    
-                                    # Split content thành chunks nhỏ để tạo streaming effect
-                                    content = message.content
-                                    chunk_size = 50  # Chia nhỏ content
-                                    
-                                    for i in range(0, len(content), chunk_size):
-                                        chunk_content = content[i:i + chunk_size]
-                                        data = {
-                                            "type": "chunk",
-                                            "content": chunk_content,
-                                            "role": "assistant",
-                                            "conversation_id": conversation_id
-                                        }
-                                        yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-                                        
-                                        # Thêm delay nhỏ để tạo streaming effect
-                                        await asyncio.sleep(0.05)
-                    
-                    # Fallback cho structure cũ
-                    elif 'messages' in chunk:
-                        for message in chunk['messages']:
-                            if hasattr(message, 'content') and message.content:
-                                full_response_content = message.content
-                                data = {
-                                    "type": "message",
-                                    "content": message.content,
-                                    "role": "assistant",
-                                    "conversation_id": conversation_id
-                                }
-                                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            # Gọi agent với streaming và thread_id; các token sát nhau được gộp thành một frame chunk
+            async for text in coalesce_text(text_stream):
+                # Lưu full content để save vào database sau
+                full_response_content += text
+                serialize_start = time.perf_counter()
+                frame = encoder.encode(text)
+                serialize_seconds += time.perf_counter() - serialize_start
+                chunks += 1
+                yield frame
+                for testcase in parser.feed(text):
+                    testcases.append(testcase)
+                    yield ChatService._testcase_event(testcase, conversation_id)
+            for testcase in parser.finish():
+                testcases.append(testcase)
+                yield ChatService._testcase_event(testcase, conversation_id)
+            trace.add_span("sse.serialize", serialize_seconds, events=chunks, follower=follower)
             
-            # Lưu assistant response vào database nếu có conversation_id
+            # Generation chạy trên thread của request khởi tạo, nên follower thuộc thread khác
+            # tự ghi lượt này vào memory (cùng thread thì agent đã ghi)
+            if follower and flight.owner != thread_id and full_response_content:
+                with trace.span("agent.record_turn"):
+                    await ChatService._record_turn(config, agent_message, full_response_content)
+            
+            # Lưu assistant response (kèm testcase đã tách) vào database nếu có conversation_id
             if conversation_id and full_response_content:
-                db_manager.add_message(conversation_id, "assistant", full_response_content)
+                with trace.span("db.add_message", role="assistant", testcases=len(testcases)):
+                    await async_db_manager.add_message(conversation_id, "assistant", full_response_content, testcases)
             
             # Gửi signal kết thúc stream
-            yield f"data: {json.dumps({'type': 'end', 'conversation_id': conversation_id}, ensure_ascii=False)}\n\n"
+            yield ChatService._format_sse({'type': 'end', 'conversation_id': conversation_id})
             
+        except AdmissionRejected as e:
+            yield ChatService._format_sse({
+                "type": "error",
+                "message": str(e),
+                "retry_after": e.retry_after,
+                "conversation_id": conversation_id
+            })
         except Exception as e:
             # Gửi lỗi qua stream
             error_data = {
@@ -348,4 +572,4 @@ class ChatService:
                 "message": str(e),
                 "conversation_id": conversation_id
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield ChatService._format_sse(error_data)
@@ -0,0 +1,133 @@
+"""
+Image Service - Chuẩn hóa ảnh đính kèm trước khi gửi tới model multimodal
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow là optional: không có thì gửi ảnh gốc
+    Image = None
+    ImageOps = None
+
+IMAGE_NORMALIZE_ENABLED = os.getenv("IMAGE_NORMALIZE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Cạnh dài nhất sau khi resize (pixel)
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1568"))
+# Định dạng và chất lượng khi encode lại: WEBP, JPEG hoặc PNG
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "WEBP").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+# Số worker thread xử lý ảnh
+IMAGE_NORMALIZE_WORKERS = int(os.getenv("IMAGE_NORMALIZE_WORKERS", "2"))
+
+_MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+
+
+class NormalizedImage:
+    """Kết quả chuẩn hóa một ảnh"""
+
+    def __init__(self, data: bytes, mime_type: str, original_bytes: int, width: int = 0, height: int = 0):
+        self.data = data
+        self.mime_type = mime_type
+        self.original_bytes = original_bytes
+        self.width = width
+        self.height = height
+
+    @property
+    def output_bytes(self) -> int:
+        return len(self.data)
+
+
+class ImageNormalizer:
+    """
+    Resize ảnh về kích thước tối đa, bỏ metadata (EXIF,...) và encode lại với định dạng gọn hơn
+
+    Việc xử lý chạy trên ThreadPoolExecutor riêng (Pillow nhả GIL khi decode/resize/encode),
+    không chạy trên event loop.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = IMAGE_NORMALIZE_ENABLED,
+        max_dimension: int = IMAGE_MAX_DIMENSION,
+        output_format: str = IMAGE_OUTPUT_FORMAT,
+        quality: int = IMAGE_QUALITY,
+        workers: int = IMAGE_NORMALIZE_WORKERS
+    ):
+        self.enabled = enabled and Image is not None
+        self.max_dimension = max_dimension
+        self.output_format = output_format if output_format in _MIME_TYPES else "WEBP"
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image")
+        self.stats = {"images": 0, "bytes_in": 0, "bytes_out": 0, "failures": 0}
+
+    def normalize_sync(self, data: bytes, mime_type: Optional[str]) -> NormalizedImage:
+        """
+        Chuẩn hóa ảnh (blocking)
+
+        Trả về ảnh gốc nếu không decode được, hoặc nếu ảnh không cần resize
+        và bản encode lại không nhỏ hơn bản gốc.
+        """
+        original = NormalizedImage(data, mime_type or "image/jpeg", len(data))
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                img.load()
+                # Áp dụng orientation từ EXIF trước khi bỏ metadata
+                img = ImageOps.exif_transpose(img)
+                resized = max(img.size) > self.max_dimension
+                if resized:
+                    img.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+
+                has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+                if self.output_format == "JPEG":
+                    if has_alpha:
+                        background = Image.new("RGB", img.size, (255, 255, 255))
+                        background.paste(img.convert("RGBA"), mask=img.convert("RGBA").split()[-1])
+                        img = background
+                    elif img.mode != "RGB":
+                        img = img.convert("RGB")
+                elif img.mode not in ("RGB", "RGBA"):
+                    img = img.convert("RGBA" if has_alpha else "RGB")
+
+                output = io.BytesIO()
+                save_kwargs: Dict[str, Any] = {"optimize": True}
+                if self.output_format in ("WEBP", "JPEG"):
+                    save_kwargs["quality"] = self.quality
+                # Không truyền exif/icc_profile => metadata bị loại bỏ
+                img.save(output, format=self.output_format, **save_kwargs)
+                encoded = output.getvalue()
+                width, height = img.size
+        except Exception:
+            self.stats["failures"] += 1
+            return original
+
+        if not resized and len(encoded) >= len(data):
+            return original
+        return NormalizedImage(encoded, _MIME_TYPES[self.output_format], len(data), width, height)
+
+    async def normalize(self, data: bytes, mime_type: Optional[str]) -> NormalizedImage:
+        """Chuẩn hóa ảnh trên worker pool, ghi nhận số bytes trước/sau"""
+        if not self.enabled:
+            return NormalizedImage(data, mime_type or "image/jpeg", len(data))
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, self.normalize_sync, data, mime_type)
+        self.stats["images"] += 1
+        self.stats["bytes_in"] += result.original_bytes
+        self.stats["bytes_out"] += result.output_bytes
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê bytes trước/sau chuẩn hóa"""
+        bytes_in = self.stats["bytes_in"]
+        return {
+            "enabled": self.enabled,
+            **self.stats,
+            "reduction_ratio": 1 - self.stats["bytes_out"] / bytes_in if bytes_in else 0.0
+        }
+
+
+# Singleton instance
+image_normalizer = ImageNormalizer()
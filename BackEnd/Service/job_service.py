@@ -0,0 +1,307 @@
+"""
+Job Service - Chạy generation dài dưới dạng job nền, client attach/detach event stream bất kỳ lúc nào
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from attachment_store import AttachmentStore, attachment_store
+from database import AsyncDatabaseManager, async_db_manager
+from .attachment_service import AttachmentService
+from .chat_service import ChatService
+from .single_flight import BroadcastStream
+from .sse_encoder import format_event, with_event_id
+
+# Số worker xử lý job đồng thời
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Chu kỳ kiểm tra lại trạng thái job trong DB khi client đang chờ job queued (giây)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Chu kỳ gia hạn lease của job đang chạy và quét job queued/hết lease trong DB (giây)
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+# Job running không được gia hạn quá thời gian này coi như worker đã chết và được chạy lại (giây)
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+
+class JobManager:
+    """
+    Hàng đợi job sinh testcase
+
+    Job được lưu trong bảng jobs (tham số, trạng thái, kết quả) và xử lý bởi một pool
+    asyncio worker. Khi đang chạy, event stream của job được phát qua BroadcastStream nên
+    client attach muộn nhận lại từ đầu, client ngắt kết nối không làm dừng job. Sau khi
+    xong, kết quả và danh sách event của job được đọc lại từ DB, nên client vẫn phát lại
+    được toàn bộ stream (hoặc phần sau Last-Event-ID) với cùng seq.
+
+    Nhiều process (uvicorn worker) dùng chung bảng jobs: job được nhận bằng một UPDATE atomic
+    (queued -> running kèm owner), nên mỗi job chỉ chạy ở một process. Process định kỳ gia hạn
+    lease (heartbeat_at) của job mình đang chạy; job có lease hết hạn (process đã chết) được đưa
+    về queued và process nào còn sống sẽ chạy lại. Khi dừng có kiểm soát, job đang chạy được
+    trả về queued ngay.
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabaseManager,
+        store: AttachmentStore = attachment_store,
+        workers: int = JOB_WORKERS,
+        heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL,
+        lease_seconds: float = JOB_LEASE_SECONDS
+    ):
+        self.db = db
+        self.store = store
+        self.workers = max(1, workers)
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: Optional[asyncio.Queue] = None
+        # job_id đang nằm trong _queue của process này (tránh đưa vào hai lần)
+        self._pending: set = set()
+        self._tasks: List[asyncio.Task] = []
+        self._live: Dict[str, BroadcastStream] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "requeued": 0, "lost": 0}
+
+    async def start(self):
+        """Khởi động worker pool và nạp các job queued (kể cả job hết lease) từ DB"""
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Event()
+        await self._sync()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        """Dừng worker; job đang chạy được trả về queued để process khác (hoặc lần khởi động sau) chạy lại"""
+        for task in self._tasks:
+            task.cancel()
+        for stream in self._live.values():
+            stream.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.db.release_jobs(self.owner)
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._pending:
+            self._pending.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _sync(self):
+        """Đưa job hết lease về queued và nhận các job queued chưa có trong hàng đợi của process này"""
+        requeued = await self.db.requeue_expired_jobs(self.lease_seconds)
+        self.stats["requeued"] += len(requeued)
+        for job_id in await self.db.list_queued_jobs():
+            self._enqueue(job_id)
+
+    async def _maintain(self):
+        """Định kỳ gia hạn lease của job đang chạy và quét lại job queued/hết lease"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                if self._live:
+                    await self.db.heartbeat_jobs(self.owner)
+                await self._sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Lỗi DB tạm thời: thử lại ở chu kỳ sau
+                pass
+
+    def _notify(self):
+        """Đánh thức các client đang chờ job đổi trạng thái"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Tạo job mới và đưa vào hàng đợi
+
+        Nội dung text của file đính kèm được lưu trong AttachmentStore, tham số của job chỉ giữ handle.
+
+        Args:
+            params: Tham số cho ChatService.process_agent_testcase_stream (JSON-serializable)
+
+        Returns:
+            Dict: Row của job vừa tạo
+        """
+        if self._queue is None:
+            raise RuntimeError("Job worker chưa được khởi động")
+        content = params.get("preloaded_file_content")
+        if AttachmentService.is_text_content(content):
+            params = {**params, "preloaded_file_content": None, "preloaded_text_id": await self.store.put_text(content)}
+        job = await self.db.create_job(params.get("conversation_id"), json.dumps(params, ensure_ascii=False))
+        self._enqueue(job["job_id"])
+        self.stats["submitted"] += 1
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._pending.discard(job_id)
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self.db.update_job(job_id, owner=self.owner, status="failed", error=str(e), finished_at=time.time())
+                self.stats["failed"] += 1
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        # Nhận job atomic: job đã được process khác nhận (hoặc đã xong) thì bỏ qua
+        job = await self.db.claim_job(job_id, self.owner)
+        if job is None:
+            return
+
+        params = json.loads(job["params"])
+        text_id = params.pop("preloaded_text_id", None)
+        if text_id is not None:
+            params["preloaded_file_content"] = await self.store.get_text(text_id)
+            if params["preloaded_file_content"] is None:
+                raise RuntimeError("Không tìm thấy nội dung file đính kèm của job")
+        stream = BroadcastStream(ChatService.process_agent_testcase_stream(**params, background=True))
+        self._live[job_id] = stream
+        self._notify()
+
+        content: List[str] = []
+        # Event của stream theo đúng thứ tự phát (seq = vị trí + 1), lưu cùng kết quả để phát lại
+        events: List[Dict[str, Any]] = []
+        error = None
+        try:
+            async for frame in stream.subscribe():
+                data = frame.data
+                events.append(data)
+                if frame.event_type == "chunk":
+                    content.append(data["content"])
+                elif frame.event_type == "error":
+                    error = data.get("message")
+        except Exception as e:
+            error = str(e)
+
+        # Ghi kết quả trước khi gỡ stream để client attach sau đó đọc được từ DB.
+        # Chỉ ghi nếu job vẫn thuộc process này (lease chưa hết hạn và bị chạy lại ở nơi khác)
+        events_json = json.dumps(events, ensure_ascii=False)
+        if error is None:
+            saved = await self.db.update_job(
+                job_id, owner=self.owner, status="completed", result="".join(content),
+                events=events_json, finished_at=time.time()
+            )
+            self.stats["completed" if saved else "lost"] += 1
+        else:
+            saved = await self.db.update_job(
+                job_id, owner=self.owner, status="failed", error=error, events=events_json, finished_at=time.time()
+            )
+            self.stats["failed" if saved else "lost"] += 1
+        del self._live[job_id]
+        self._notify()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Trạng thái job (không kèm tham số và event log)"""
+        job = await self.db.get_job(job_id)
+        if job is not None:
+            job.pop("params", None)
+            job.pop("events", None)
+        return job
+
+    @staticmethod
+    def _replay(job: Dict[str, Any], after_seq: int) -> List[str]:
+        """
+        Các frame của job đã xong, sau after_seq, với cùng id "<job_id>:<seq>" như lúc chạy
+
+        Job xong trước khi có event log chỉ còn kết quả đã ghép: phát thành một chunk
+        (không phát tiếp được từ giữa stream).
+        """
+        job_id, conversation_id = job["job_id"], job["conversation_id"]
+        if job["events"] is None:
+            if job["status"] == "failed":
+                return [ChatService._format_sse({
+                    "type": "error", "message": job["error"], "conversation_id": conversation_id
+                })]
+            if after_seq:
+                return [ChatService._format_sse({
+                    "type": "error",
+                    "message": f"Job đã hoàn thành, lấy kết quả qua GET /jobs/{job_id}",
+                    "job_id": job_id,
+                    "conversation_id": conversation_id
+                })]
+            return [
+                ChatService._format_sse({
+                    "type": "chunk",
+                    "content": job["result"] or "",
+                    "role": "assistant",
+                    "conversation_id": conversation_id
+                }),
+                ChatService._format_sse({"type": "end", "conversation_id": conversation_id}),
+            ]
+
+        events = json.loads(job["events"])
+        frames = [
+            with_event_id(format_event(data), f"{job_id}:{seq}")
+            for seq, data in enumerate(events[after_seq:], start=after_seq + 1)
+        ]
+        # Stream nguồn lỗi bằng exception (không phát event error): báo lỗi đã lưu ở cuối
+        if job["status"] == "failed" and not (events and events[-1].get("type") == "error"):
+            frames.append(ChatService._format_sse({
+                "type": "error", "message": job["error"], "conversation_id": conversation_id
+            }))
+        return frames
+
+    async def subscribe(self, job_id: str, after_seq: int = 0) -> AsyncGenerator[str, None]:
+        """
+        Event stream của job dưới dạng SSE
+
+        Job đang chạy: phát lại các event sau after_seq rồi tiếp tục live, mỗi event có id
+        "<job_id>:<seq>". Job đã xong: phát lại event log lưu trong DB từ sau after_seq, cùng id.
+        Job đang chờ: gửi event trạng thái (không có id) rồi chờ tới khi job bắt đầu.
+
+        Args:
+            job_id: ID của job
+            after_seq: seq của event cuối client đã nhận (Last-Event-ID khi kết nối lại)
+        """
+        last_status = None
+        while True:
+            stream = self._live.get(job_id)
+            if stream is not None:
+                seq = after_seq
+                async for frame in stream.subscribe(after_seq):
+                    seq += 1
+                    yield with_event_id(frame, f"{job_id}:{seq}")
+                return
+
+            job = await self.db.get_job(job_id)
+            if job is None:
+                yield ChatService._format_sse({"type": "error", "message": "Job not found", "job_id": job_id})
+                return
+            if job["status"] in ("completed", "failed"):
+                for frame in self._replay(job, after_seq):
+                    yield frame
+                return
+
+            # queued, hoặc running ở process khác: báo trạng thái rồi chờ
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield ChatService._format_sse({"type": "job", "job_id": job_id, "status": job["status"]})
+            if self._changed is None:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            try:
+                await asyncio.wait_for(self._changed.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê hàng đợi job"""
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "owner": self.owner,
+            "queued": len(self._pending),
+            "running": len(self._live)
+        }
+
+
+# Singleton instance
+job_manager = JobManager(async_db_manager)
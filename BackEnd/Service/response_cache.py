@@ -0,0 +1,145 @@
+"""
+Response Cache - Cache kết quả agent testcase theo nội dung request
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from database import AsyncDatabaseManager, async_db_manager
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Số entry tối đa giữ trong bộ nhớ (LRU)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+# Thời gian sống của một entry (giây), mặc định 7 ngày
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+# Tổng dung lượng tối đa của bảng response_cache trong SQLite (bytes)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Chuẩn hóa text trước khi hash: NFC, gộp khoảng trắng, bỏ khoảng trắng đầu/cuối"""
+    if not text:
+        return ""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class ResponseCache:
+    """
+    Cache content-addressed cho response của agent
+
+    Hai tầng: LRU trong bộ nhớ và bảng response_cache trong SQLite (TTL + giới hạn dung lượng).
+    Giá trị được cache là danh sách các đoạn text đã stream, để replay lại đúng
+    chuỗi SSE chunk events.
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabaseManager,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES
+    ):
+        self.db = db
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    @staticmethod
+    def make_key(
+        title: str,
+        pbi_requirement: str,
+        attachment_digest: Optional[str],
+        version: str
+    ) -> str:
+        """
+        Tạo cache key từ nội dung request
+
+        Args:
+            title: Tiêu đề testcase
+            pbi_requirement: Yêu cầu PBI
+            attachment_digest: SHA-256 của file đính kèm (None nếu không có)
+            version: Phiên bản model/prompt
+
+        Returns:
+            str: SHA-256 hex digest
+        """
+        material = json.dumps(
+            [version, normalize_text(title), normalize_text(pbi_requirement), attachment_digest or ""],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _memory_get(self, key: str) -> Optional[List[str]]:
+        item = self._memory.get(key)
+        if item is None:
+            return None
+        created_at, chunks = item
+        if time.time() - created_at > self.ttl_seconds:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return chunks
+
+    def _memory_put(self, key: str, chunks: List[str], created_at: Optional[float] = None):
+        self._memory[key] = (created_at or time.time(), chunks)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """Lấy các chunk đã cache, tìm trong bộ nhớ trước rồi tới SQLite"""
+        chunks = self._memory_get(key)
+        if chunks is not None:
+            self.stats["memory_hits"] += 1
+            return chunks
+
+        payload = await self.db.get_cached_response(key, self.ttl_seconds)
+        if payload is not None:
+            chunks = json.loads(payload)
+            self._memory_put(key, chunks)
+            self.stats["disk_hits"] += 1
+            return chunks
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, chunks: List[str]):
+        """Lưu các chunk của một response hoàn chỉnh vào cả hai tầng"""
+        self._memory_put(key, chunks)
+        await self.db.put_cached_response(
+            key,
+            json.dumps(chunks, ensure_ascii=False),
+            self.ttl_seconds,
+            self.max_bytes
+        )
+        self.stats["stores"] += 1
+
+    def record_bypass(self):
+        """Đếm request yêu cầu bỏ qua cache"""
+        self.stats["bypassed"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê hit/miss hiện tại"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            **self.stats,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory)
+        }
+
+
+# Singleton instance
+response_cache = ResponseCache(async_db_manager)
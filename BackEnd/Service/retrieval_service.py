@@ -0,0 +1,210 @@
+"""
+Retrieval Service - Chọn các đoạn liên quan nhất của file đính kèm text theo ngân sách token
+"""
+import asyncio
+import math
+import os
+import re
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+# Ngân sách token cho phần trích từ file đính kèm trong prompt
+ATTACHMENT_TOKEN_BUDGET = int(os.getenv("ATTACHMENT_TOKEN_BUDGET", "1500"))
+# Kích thước mục tiêu của mỗi đoạn (ký tự)
+ATTACHMENT_CHUNK_CHARS = int(os.getenv("ATTACHMENT_CHUNK_CHARS", "1200"))
+# Số index giữ lại theo SHA-256 của file (upload lại cùng file không phải build lại)
+ATTACHMENT_INDEX_CACHE_SIZE = int(os.getenv("ATTACHMENT_INDEX_CACHE_SIZE", "8"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_HEADING_RE = re.compile(r"^\s*(#{1,6}\s|\d+(\.\d+)*[.)]?\s)")
+_SEPARATOR = "\n\n...\n\n"
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ cho index: chữ thường, bỏ token 1 ký tự không phải số"""
+    return [token for token in _TOKEN_RE.findall(text.casefold()) if len(token) > 1 or token.isdigit()]
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (~4 ký tự/token)"""
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _split_long(paragraph: str, chunk_chars: int) -> List[str]:
+    """Cắt đoạn quá dài tại khoảng trắng gần giới hạn nhất"""
+    parts = []
+    while len(paragraph) > chunk_chars:
+        cut = paragraph.rfind(" ", 0, chunk_chars)
+        if cut <= chunk_chars // 2:
+            cut = chunk_chars
+        parts.append(paragraph[:cut].strip())
+        paragraph = paragraph[cut:].strip()
+    if paragraph:
+        parts.append(paragraph)
+    return parts
+
+
+def split_chunks(text: str, chunk_chars: int = ATTACHMENT_CHUNK_CHARS) -> List[str]:
+    """
+    Chia văn bản thành các đoạn ~chunk_chars ký tự
+
+    Gộp các paragraph liên tiếp; heading (markdown hoặc đánh số) luôn mở đoạn mới
+    để mỗi đoạn gắn với một section.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        is_heading = bool(_HEADING_RE.match(paragraph))
+        if current and (is_heading or current_len + len(paragraph) > chunk_chars):
+            chunks.append("\n\n".join(current))
+            current, current_len = [], 0
+        for part in _split_long(paragraph, chunk_chars):
+            if current and current_len + len(part) > chunk_chars:
+                chunks.append("\n\n".join(current))
+                current, current_len = [], 0
+            current.append(part)
+            current_len += len(part) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class BM25Index:
+    """Index lexical BM25 (Okapi) trên danh sách đoạn văn bản"""
+
+    def __init__(self, chunks: List[str], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths: List[int] = []
+        # term -> [(chỉ số đoạn, tần suất)]
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                self.postings[term].append((doc_id, freq))
+        self.avg_length = (sum(self.doc_lengths) / len(chunks)) if chunks else 0.0
+
+    def search(self, query: str) -> List[Tuple[int, float]]:
+        """Trả về (chỉ số đoạn, điểm) của các đoạn khớp query, điểm giảm dần"""
+        total = len(self.chunks)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, freq in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1)
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + self.k1 * length_norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class AttachmentRetriever:
+    """
+    Chọn các đoạn của file đính kèm liên quan nhất tới title + PBI trong ngân sách token
+
+    Build index chạy trên ThreadPoolExecutor riêng (file lớn tốn CPU vài trăm ms),
+    index được giữ trong LRU theo SHA-256 của file.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = ATTACHMENT_TOKEN_BUDGET,
+        chunk_chars: int = ATTACHMENT_CHUNK_CHARS,
+        cache_size: int = ATTACHMENT_INDEX_CACHE_SIZE
+    ):
+        self.token_budget = token_budget
+        self.chunk_chars = chunk_chars
+        self.cache_size = max(1, cache_size)
+        self._indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval")
+        self.stats = {"selections": 0, "index_builds": 0, "index_cache_hits": 0}
+
+    def build_index(self, text: str) -> BM25Index:
+        """Chia đoạn và build index (blocking)"""
+        return BM25Index(split_chunks(text, self.chunk_chars))
+
+    def _get_index(self, text: str, digest: Optional[str]) -> BM25Index:
+        if digest and digest in self._indexes:
+            self._indexes.move_to_end(digest)
+            self.stats["index_cache_hits"] += 1
+            return self._indexes[digest]
+        index = self.build_index(text)
+        self.stats["index_builds"] += 1
+        if digest:
+            self._indexes[digest] = index
+            while len(self._indexes) > self.cache_size:
+                self._indexes.popitem(last=False)
+        return index
+
+    def select_sync(
+        self,
+        text: str,
+        query: str,
+        digest: Optional[str] = None,
+        token_budget: Optional[int] = None
+    ) -> str:
+        """
+        Trích các đoạn liên quan (blocking)
+
+        Args:
+            text: Toàn bộ nội dung file
+            query: Title + PBI requirement
+            digest: SHA-256 của file, dùng làm key cache index
+            token_budget: Ngân sách token (mặc định ATTACHMENT_TOKEN_BUDGET)
+
+        Returns:
+            str: Nội dung file nếu vừa ngân sách, ngược lại là các đoạn được chọn theo thứ tự trong file
+        """
+        budget = token_budget or self.token_budget
+        if estimate_tokens(text) <= budget:
+            return text
+
+        index = self._get_index(text, digest)
+        ranked = [doc_id for doc_id, _ in index.search(query)]
+        if not ranked:
+            # Không đoạn nào khớp query: giữ phần đầu tài liệu
+            ranked = list(range(len(index.chunks)))
+
+        parts: Dict[int, str] = {}
+        used = 0
+        for doc_id in ranked:
+            # Tính cả header và dấu phân cách vào chi phí của đoạn
+            part = f"[Đoạn {doc_id + 1}/{len(index.chunks)}]\n{index.chunks[doc_id]}"
+            cost = estimate_tokens(part + _SEPARATOR)
+            if used + cost > budget:
+                continue
+            parts[doc_id] = part
+            used += cost
+            if budget - used < 16:
+                break
+
+        return _SEPARATOR.join(parts[doc_id] for doc_id in sorted(parts))
+
+    async def select(
+        self,
+        text: str,
+        query: str,
+        digest: Optional[str] = None,
+        token_budget: Optional[int] = None
+    ) -> str:
+        """Trích các đoạn liên quan trên worker thread"""
+        self.stats["selections"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.select_sync, text, query, digest, token_budget)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê build/cache index"""
+        return {**self.stats, "cached_indexes": len(self._indexes)}
+
+
+# Singleton instance
+attachment_retriever = AttachmentRetriever()
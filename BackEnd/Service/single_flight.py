@@ -0,0 +1,129 @@
+"""
+Single-flight - Gộp các generation giống hệt nhau đang chạy đồng thời
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class BroadcastStream:
+    """
+    Chạy một async stream text đúng một lần và phát lại cho nhiều subscriber
+
+    Stream nguồn được bơm trong một task riêng, nên vẫn chạy tới khi xong kể cả khi
+    client khởi tạo nó ngắt kết nối. Subscriber tham gia muộn nhận lại các chunk đã
+    phát trước đó rồi tiếp tục nhận chunk mới.
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[str],
+        on_complete: Optional[Callable[[List[str]], Awaitable[Any]]] = None,
+        owner: Optional[str] = None
+    ):
+        # Thread (hoặc request) đã khởi tạo generation
+        self.owner = owner
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_complete = on_complete
+        self._task = asyncio.create_task(self._pump(source))
+
+    def _notify(self):
+        """Đánh thức tất cả subscriber đang chờ chunk mới"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for text in source:
+                self.chunks.append(text)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+        if self.error is None and self._on_complete and self.chunks:
+            try:
+                await self._on_complete(self.chunks)
+            except Exception:
+                # Lỗi của callback (ví dụ ghi cache) không ảnh hưởng tới subscriber
+                pass
+
+    async def subscribe(self, start: int = 0) -> AsyncGenerator[str, None]:
+        """
+        Nhận các chunk từ vị trí start (mặc định từ đầu stream)
+
+        Raises:
+            Exception: Lỗi của stream nguồn (nếu có) sau khi đã phát hết các chunk trước đó
+        """
+        self.subscribers += 1
+        index = start
+        while True:
+            if index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            event = self._changed
+            await event.wait()
+
+    def cancel(self):
+        """Huỷ stream nguồn; subscriber nhận CancelledError như khi task bị huỷ"""
+        self._task.cancel()
+
+
+class SingleFlight:
+    """Registry các generation đang chạy, theo key nội dung request"""
+
+    def __init__(self):
+        self._inflight: Dict[str, BroadcastStream] = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Key của generation: SHA-256 của các thành phần quyết định output (prompt, attachment, trạng thái thread)"""
+        material = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def join(self, key: str) -> Optional[BroadcastStream]:
+        """Tham gia generation đang chạy với cùng key (None nếu chưa có)"""
+        flight = self._inflight.get(key)
+        if flight is not None and not flight.done:
+            self.stats["followers"] += 1
+            return flight
+        return None
+
+    def start(
+        self,
+        key: str,
+        source: AsyncIterator[str],
+        on_complete: Optional[Callable[[List[str]], Awaitable[Any]]] = None,
+        owner: Optional[str] = None
+    ) -> BroadcastStream:
+        """Bắt đầu generation mới và đăng ký cho các request giống hệt tham gia"""
+        flight = BroadcastStream(source, on_complete=on_complete, owner=owner)
+        self._inflight[key] = flight
+        self.stats["leaders"] += 1
+        flight._task.add_done_callback(lambda _: self._release(key, flight))
+        return flight
+
+    def _release(self, key: str, flight: BroadcastStream):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê số generation đang chạy và số request đã được gộp"""
+        return {**self.stats, "inflight": len(self._inflight)}
+
+
+# Singleton instance
+single_flight = SingleFlight()
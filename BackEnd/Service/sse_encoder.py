@@ -0,0 +1,218 @@
+"""
+SSE Encoder - Serialize event, gộp các đoạn text nhỏ thành ít frame hơn và nén gzip stream SSE
+"""
+import asyncio
+import json
+import os
+import time
+import zlib
+from json.encoder import encode_basestring
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Iterable, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson là optional: không có thì dùng json của thư viện chuẩn
+    orjson = None
+
+# Thời gian tối đa (ms) một đoạn text được giữ lại chờ gộp với đoạn sau; 0 = mỗi đoạn một frame như trước
+SSE_COALESCE_MAX_LATENCY_MS = float(os.getenv("SSE_COALESCE_MAX_LATENCY_MS", "50"))
+# Số ký tự tối đa của một frame chunk: đủ thì gửi ngay không chờ hết thời gian
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "2048"))
+# Nén gzip response SSE khi client gửi Accept-Encoding: gzip
+SSE_GZIP_ENABLED = os.getenv("SSE_GZIP_ENABLED", "true").lower() in ("1", "true", "yes")
+SSE_GZIP_LEVEL = int(os.getenv("SSE_GZIP_LEVEL", "6"))
+
+
+def dumps(data: Any) -> str:
+    """JSON gọn (không khoảng trắng, giữ nguyên Unicode)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode("utf-8")
+        except TypeError:  # kiểu orjson không hỗ trợ (vd. int > 64 bit): để json xử lý/báo lỗi
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class SSEFrame(str):
+    """
+    Frame SSE kèm loại event (field type của data) và event gốc, để tầng metrics và job
+    không phải đọc lại nội dung frame
+    """
+
+    event_type: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def of(cls, text: str, event_type: Optional[str], data: Optional[Dict[str, Any]] = None) -> "SSEFrame":
+        frame = cls(text)
+        frame.event_type = event_type
+        frame.data = data
+        return frame
+
+
+def with_event_id(frame: str, event_id: str) -> SSEFrame:
+    """Thêm dòng "id:" vào đầu frame, giữ nguyên loại event và event gốc"""
+    return SSEFrame.of(f"id: {event_id}\n{frame}", getattr(frame, "event_type", None), getattr(frame, "data", None))
+
+
+def format_event(data: Dict[str, Any]) -> SSEFrame:
+    """Format một event thành Server-Sent Events frame"""
+    return SSEFrame.of(f"data: {dumps(data)}\n\n", data.get("type"), data)
+
+
+class ChunkFrameEncoder:
+    """
+    Encoder cho event "chunk" của một response
+
+    Phần cố định của frame (type, role, conversation_id,...) được serialize một lần;
+    mỗi frame chỉ còn escape content rồi nối chuỗi.
+    """
+
+    _PREFIX = 'data: {"type":"chunk","content":'
+
+    def __init__(self, **fields: Any):
+        self._fields = {"role": "assistant", **fields}
+        suffix = dumps(self._fields)
+        self._suffix = "," + suffix[1:] + "\n\n"
+
+    def encode(self, content: str) -> SSEFrame:
+        data = {"type": "chunk", "content": content, **self._fields}
+        return SSEFrame.of(self._PREFIX + encode_basestring(content) + self._suffix, "chunk", data)
+
+
+async def coalesce_text(
+    source: AsyncIterator[str],
+    max_chars: int = SSE_COALESCE_MAX_CHARS,
+    max_latency_ms: float = SSE_COALESCE_MAX_LATENCY_MS
+) -> AsyncGenerator[str, None]:
+    """
+    Gộp các đoạn text liên tiếp của source
+
+    Đoạn đầu tiên được gửi ngay (không làm chậm time-to-first-chunk). Sau đó text được gom lại và
+    gửi khi đủ max_chars, khi đoạn cũ nhất đã chờ max_latency_ms (kể cả khi source đang im lặng)
+    hoặc khi source kết thúc.
+
+    Source được đọc trong một task riêng để có thể flush theo thời gian; đóng generator này
+    sẽ huỷ task đó (source nhận CancelledError như khi client ngắt kết nối).
+    """
+    if max_latency_ms <= 0:
+        async for text in source:
+            yield text
+        return
+
+    max_latency = max_latency_ms / 1000
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for text in source:
+                queue.put_nowait(text)
+            queue.put_nowait(done)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    task = asyncio.create_task(pump())
+    try:
+        first = True
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if first:
+                first = False
+                yield item
+                continue
+
+            parts: List[str] = [item]
+            size = len(item)
+            deadline = time.monotonic() + max_latency
+            finished: Optional[object] = None
+            while size < max_chars:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is done or isinstance(item, Exception):
+                    finished = item
+                    break
+                parts.append(item)
+                size += len(item)
+            yield "".join(parts)
+            if finished is done:
+                return
+            if finished is not None:
+                raise finished
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def group_text(pieces: Iterable[str], max_chars: int = SSE_COALESCE_MAX_CHARS) -> List[str]:
+    """Gộp các đoạn text đã có sẵn (vd. phát lại từ cache) thành các đoạn tối đa max_chars ký tự"""
+    groups: List[str] = []
+    parts: List[str] = []
+    size = 0
+    for piece in pieces:
+        parts.append(piece)
+        size += len(piece)
+        if size >= max_chars:
+            groups.append("".join(parts))
+            parts, size = [], 0
+    if parts:
+        groups.append("".join(parts))
+    return groups
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Client chấp nhận gzip theo header Accept-Encoding (tính cả q-value)"""
+    if not SSE_GZIP_ENABLED or not accept_encoding:
+        return False
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+
+async def gzip_stream(frames: AsyncIterator[bytes], level: int = SSE_GZIP_LEVEL) -> AsyncGenerator[bytes, None]:
+    """
+    Nén stream SSE thành một body gzip
+
+    Mỗi frame được sync flush nên client giải nén được ngay từng event (không bị giữ trong buffer
+    của compressor); dictionary dùng chung cho cả stream nên phần lặp lại giữa các event
+    (type, role, conversation_id) chỉ tốn vài byte.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        async for frame in frames:
+            yield compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush(zlib.Z_FINISH)
+    finally:
+        aclose = getattr(frames, "aclose", None)
+        if aclose is not None:
+            await aclose()
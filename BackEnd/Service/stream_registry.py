@@ -0,0 +1,202 @@
+"""
+Stream Registry - SSE stream có id, ring buffer và replay theo Last-Event-ID
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional, Tuple
+
+from .sse_encoder import with_event_id
+
+# Số event tối đa giữ lại cho mỗi stream
+SSE_BUFFER_EVENTS = int(os.getenv("SSE_BUFFER_EVENTS", "2000"))
+# Tổng dung lượng tối đa của tất cả buffer (bytes)
+SSE_BUFFER_MAX_BYTES = int(os.getenv("SSE_BUFFER_MAX_BYTES", str(16 * 1024 * 1024)))
+# Thời gian giữ buffer sau khi stream kết thúc để client kịp kết nối lại (giây)
+SSE_RESUME_GRACE_SECONDS = float(os.getenv("SSE_RESUME_GRACE_SECONDS", "120"))
+
+
+class StreamGapError(Exception):
+    """Các event client còn thiếu đã bị loại khỏi ring buffer"""
+
+
+class ResumableStream:
+    """
+    Một SSE stream có thể nối lại
+
+    Stream nguồn (các frame "data: ...\\n\\n") được bơm trong task riêng, mỗi frame được gán
+    id "<stream_id>:<seq>" với seq tăng dần và lưu vào ring buffer. Client ngắt kết nối
+    không làm dừng stream nguồn; khi kết nối lại với Last-Event-ID, chỉ các event sau id đó
+    được phát lại rồi tiếp tục live.
+    """
+
+    def __init__(self, registry: "StreamRegistry", stream_id: str, source: AsyncIterator[str], max_events: int):
+        self.registry = registry
+        self.stream_id = stream_id
+        self.events: deque = deque()
+        self.max_events = max_events
+        self.buffered_bytes = 0
+        self.last_seq = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(source))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _append(self, frame: str):
+        self.last_seq += 1
+        framed = with_event_id(frame, f"{self.stream_id}:{self.last_seq}")
+        self.events.append((self.last_seq, framed))
+        self.buffered_bytes += len(framed)
+        self.registry._on_append(self, len(framed))
+        while len(self.events) > self.max_events:
+            self.drop_oldest()
+            self.registry.stats["evicted_events"] += 1
+        self._notify()
+
+    def drop_oldest(self) -> int:
+        """Bỏ event cũ nhất khỏi buffer, trả về số bytes được giải phóng"""
+        _, framed = self.events.popleft()
+        self.buffered_bytes -= len(framed)
+        self.registry._on_drop(len(framed))
+        return len(framed)
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for frame in source:
+                self._append(frame)
+        finally:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncGenerator[str, None]:
+        """
+        Phát các event có seq > after_seq rồi tiếp tục live tới khi stream kết thúc
+
+        Raises:
+            StreamGapError: Nếu event ngay sau after_seq đã bị loại khỏi buffer (kể cả khi buffer
+                đã bị xoá hết), hoặc client đọc chậm hơn tốc độ buffer bị cắt
+        """
+        if after_seq:
+            self.registry.stats["resumes"] += 1
+        seq = after_seq
+        while True:
+            if seq < self.last_seq:
+                # Buffer chứa các seq liên tiếp nên event seq + 1 nằm ở vị trí seq + 1 - first_seq
+                first_seq = self.events[0][0] if self.events else self.last_seq + 1
+                if first_seq > seq + 1:
+                    raise StreamGapError(self.stream_id)
+                seq += 1
+                yield self.events[seq - first_seq][1]
+                continue
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class StreamRegistry:
+    """
+    Quản lý các ResumableStream đang sống
+
+    Tổng dung lượng buffer bị giới hạn bởi SSE_BUFFER_MAX_BYTES: khi vượt, stream đã kết thúc
+    cũ nhất bị bỏ trước, sau đó tới event cũ nhất của stream cũ nhất. Stream đã kết thúc
+    bị xóa sau SSE_RESUME_GRACE_SECONDS.
+    """
+
+    def __init__(
+        self,
+        max_events: int = SSE_BUFFER_EVENTS,
+        max_bytes: int = SSE_BUFFER_MAX_BYTES,
+        grace_seconds: float = SSE_RESUME_GRACE_SECONDS
+    ):
+        self.max_events = max(1, max_events)
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self._streams: "OrderedDict[str, ResumableStream]" = OrderedDict()
+        self.buffered_bytes = 0
+        self.stats = {"streams": 0, "resumes": 0, "evicted_events": 0, "evicted_streams": 0}
+
+    @staticmethod
+    def parse_event_id(event_id: str) -> Tuple[str, int]:
+        """
+        Tách Last-Event-ID thành (stream_id, seq)
+
+        Raises:
+            ValueError: Nếu id không đúng định dạng "<stream_id>:<seq>"
+        """
+        stream_id, _, seq = event_id.strip().rpartition(":")
+        if not stream_id or not seq.isdigit():
+            raise ValueError("Invalid Last-Event-ID")
+        return stream_id, int(seq)
+
+    def create(self, source: AsyncIterator[str]) -> ResumableStream:
+        """Bắt đầu bơm stream nguồn vào một ResumableStream mới"""
+        self._expire()
+        stream = ResumableStream(self, f"s{uuid.uuid4().hex[:12]}", source, self.max_events)
+        self._streams[stream.stream_id] = stream
+        self.stats["streams"] += 1
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ResumableStream]:
+        """Stream còn trong registry (None nếu không có hoặc đã hết hạn)"""
+        self._expire()
+        return self._streams.get(stream_id)
+
+    def _remove(self, stream_id: str):
+        stream = self._streams.pop(stream_id)
+        self.buffered_bytes -= stream.buffered_bytes
+        stream.events.clear()
+        stream.buffered_bytes = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.done and now - stream.finished_at > self.grace_seconds
+        ]
+        for stream_id in expired:
+            self._remove(stream_id)
+
+    def _on_append(self, stream: ResumableStream, size: int):
+        self.buffered_bytes += size
+        if self.buffered_bytes <= self.max_bytes:
+            return
+        # Ưu tiên bỏ các stream đã kết thúc, cũ nhất trước
+        for stream_id in [sid for sid, s in self._streams.items() if s.done]:
+            self._remove(stream_id)
+            self.stats["evicted_streams"] += 1
+            if self.buffered_bytes <= self.max_bytes:
+                return
+        # Sau đó bỏ event cũ nhất của các stream đang chạy (cũ nhất trước), giữ event vừa thêm
+        for other in list(self._streams.values()):
+            while self.buffered_bytes > self.max_bytes and len(other.events) > (1 if other is stream else 0):
+                other.drop_oldest()
+                self.stats["evicted_events"] += 1
+            if self.buffered_bytes <= self.max_bytes:
+                return
+
+    def _on_drop(self, size: int):
+        self.buffered_bytes -= size
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê số stream, số event và dung lượng buffer hiện tại"""
+        self._expire()
+        return {
+            **self.stats,
+            "active_streams": sum(1 for stream in self._streams.values() if not stream.done),
+            "retained_streams": len(self._streams),
+            "buffered_events": sum(len(stream.events) for stream in self._streams.values()),
+            "buffered_bytes": self.buffered_bytes,
+            "max_bytes": self.max_bytes,
+            "max_events_per_stream": self.max_events
+        }
+
+
+# Singleton instance
+stream_registry = StreamRegistry()
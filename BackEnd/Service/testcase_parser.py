@@ -0,0 +1,178 @@
+"""
+Testcase Parser - Tách testcase (title, steps gồm action/expected_result) từ markdown của agent theo từng đoạn stream
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+# Tiêu đề testcase: "### Testcase 1: ...", "**TC-01 - ...**", "Test case 2. ..."
+_HEADING_RE = re.compile(
+    r"^(?:\d+[.)]\s*)?(?:test\s*-?\s*case|tc)\s*[-#_]?\s*(\d+)?\s*(?:[:.)\-–—]\s*|\s+|$)(.*)$",
+    re.IGNORECASE
+)
+# Các trường theo format trong SYSTEM_PROMPT (tiếng Anh hoặc tiếng Việt)
+_TITLE_RE = re.compile(r"^(?:title|tiêu đề)\s*:\s*(.*)$", re.IGNORECASE)
+_STEPS_RE = re.compile(r"^(?:steps|các bước(?: thực hiện)?)\s*:?\s*$", re.IGNORECASE)
+_ACTION_RE = re.compile(r"^(?:action|hành động|thao tác)\s*:\s*(.+)$", re.IGNORECASE)
+_EXPECTED_RE = re.compile(
+    r"^(?:expected[_ ]?results?|expected|kết quả mong đợi|kết quả mong muốn)\s*:\s*(.+)$",
+    re.IGNORECASE
+)
+# Bước đánh số: "Bước 1: ...", "Step 2 - ..."
+_STEP_PREFIX_RE = re.compile(r"^(?:bước|step)\s*\d+\s*[:.)\-–]\s*(.*)$", re.IGNORECASE)
+# Bước có kết quả trên cùng dòng: "<action> -> Kết quả mong đợi: <expected>"
+_ARROW_RE = re.compile(
+    r"^(.+?)\s*(?:->|→|=>)\s*(?:(?:kết quả mong đợi|kết quả|expected(?:[_ ]result)?)\s*:\s*)?(.+)$",
+    re.IGNORECASE
+)
+_BULLET_RE = re.compile(r"^(?:[-*+•]\s+|\d+[.)]\s+)")
+_NUMBERED_RE = re.compile(r"^\d+[.)]\s+")
+_TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{2,}")
+_ACTION_HEADERS = ("action", "hành động", "thao tác")
+_EXPECTED_HEADERS = ("expected", "kết quả")
+
+
+def _clean(line: str) -> str:
+    """Bỏ ký hiệu heading/nhấn mạnh của markdown"""
+    line = line.strip().lstrip("#").strip()
+    return line.replace("**", "").replace("__", "").strip()
+
+
+class TestcaseStreamParser:
+    """
+    Parser tăng dần: nhận từng đoạn text của stream, trả về testcase ngay khi nó hoàn chỉnh
+
+    Một testcase hoàn chỉnh khi testcase tiếp theo bắt đầu (hoặc khi stream kết thúc),
+    và chỉ được trả về nếu có title và ít nhất một bước.
+    Mỗi testcase: {"ordinal", "title", "steps": [{"step_no", "action", "expected_result"}]}
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._current: Optional[Dict[str, Any]] = None
+        self._in_steps = False
+        # Chỉ số cột (action, expected_result) của bảng markdown đang đọc
+        self._table: Optional[tuple] = None
+        self.count = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Thêm một đoạn text, trả về các testcase vừa hoàn chỉnh"""
+        self._buffer += text
+        if "\n" not in text:
+            return []
+        *lines, self._buffer = self._buffer.split("\n")
+        completed = []
+        for line in lines:
+            testcase = self._process_line(line)
+            if testcase is not None:
+                completed.append(testcase)
+        return completed
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Kết thúc stream: xử lý dòng cuối và trả về testcase còn lại"""
+        completed = []
+        if self._buffer:
+            testcase = self._process_line(self._buffer)
+            self._buffer = ""
+            if testcase is not None:
+                completed.append(testcase)
+        testcase = self._close()
+        if testcase is not None:
+            completed.append(testcase)
+        return completed
+
+    @staticmethod
+    def parse(text: str) -> List[Dict[str, Any]]:
+        """Tách toàn bộ testcase của một response hoàn chỉnh"""
+        parser = TestcaseStreamParser()
+        return parser.feed(text) + parser.finish()
+
+    def _start(self, title: str) -> Optional[Dict[str, Any]]:
+        completed = self._close()
+        self._current = {"title": title.strip(), "steps": []}
+        self._in_steps = False
+        self._table = None
+        return completed
+
+    def _close(self) -> Optional[Dict[str, Any]]:
+        current, self._current = self._current, None
+        if not current or not current["title"] or not current["steps"]:
+            return None
+        self.count += 1
+        steps = [
+            {"step_no": index, "action": step["action"], "expected_result": step["expected_result"]}
+            for index, step in enumerate(current["steps"], start=1)
+        ]
+        return {"ordinal": self.count, "title": current["title"], "steps": steps}
+
+    def _add_step(self, action: str, expected_result: str = ""):
+        self._current["steps"].append({"action": action.strip(), "expected_result": expected_result.strip()})
+
+    def _process_line(self, raw: str) -> Optional[Dict[str, Any]]:
+        line = _clean(raw)
+        if not line:
+            return None
+
+        if line.startswith("|"):
+            if self._current is not None:
+                self._table_row(line)
+            return None
+        self._table = None
+
+        heading = _HEADING_RE.match(line)
+        if heading and (heading.group(1) or heading.group(2)):
+            return self._start(heading.group(2))
+
+        text = _BULLET_RE.sub("", line)
+        title = _TITLE_RE.match(text)
+        if title:
+            # Format theo trường: "title:" mở testcase mới nếu testcase hiện tại đã có bước
+            if self._current is None or self._current["steps"]:
+                return self._start(title.group(1))
+            if not self._current["title"]:
+                self._current["title"] = title.group(1).strip()
+            return None
+
+        if self._current is None:
+            return None
+
+        if _STEPS_RE.match(text):
+            self._in_steps = True
+            return None
+        action = _ACTION_RE.match(text)
+        if action:
+            self._add_step(action.group(1))
+            return None
+        expected = _EXPECTED_RE.match(text)
+        if expected:
+            steps = self._current["steps"]
+            if steps and not steps[-1]["expected_result"]:
+                steps[-1]["expected_result"] = expected.group(1).strip()
+            return None
+
+        prefixed = _STEP_PREFIX_RE.match(text)
+        if prefixed or (self._in_steps and _NUMBERED_RE.match(line)):
+            body = prefixed.group(1) if prefixed else text
+            arrow = _ARROW_RE.match(body)
+            if arrow:
+                self._add_step(arrow.group(1), arrow.group(2))
+            else:
+                self._add_step(body)
+        return None
+
+    def _table_row(self, line: str):
+        cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+        if _TABLE_SEPARATOR_RE.match(line) or len(cells) < 2:
+            return
+        if self._table is None:
+            # Dòng đầu của bảng là header: tìm cột hành động và kết quả mong đợi
+            lowered = [cell.casefold() for cell in cells]
+            expected_col = next((i for i, c in enumerate(lowered) if c.startswith(_EXPECTED_HEADERS)), len(cells) - 1)
+            action_col = next(
+                (i for i, c in enumerate(lowered) if i != expected_col and any(h in c for h in _ACTION_HEADERS)),
+                expected_col - 1
+            )
+            self._table = (action_col, expected_col)
+            return
+        action_col, expected_col = self._table
+        if max(action_col, expected_col) < len(cells) and cells[action_col]:
+            self._add_step(cells[action_col], cells[expected_col])
@@ -1,13 +1,18 @@
-from langgraph.prebuilt import create_react_agent
-from langchain_openai import ChatOpenAI
-from langgraph.checkpoint.memory import MemorySaver
 from dotenv import load_dotenv
 import os
+import asyncio
 import base64
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
 from typing import Dict, Any, Optional
 
 load_dotenv()
 
+# langchain_core/langgraph/langchain_openai, checkpointer, history và attachment store chỉ được
+# import khi dựng agent (get_agent) hoặc khi agent dựng prompt, sau load_dotenv
+
 def get_weather(city: str) -> str:  
     """Get weather for a given city."""
     return f"It's always sunny in {city}!"
@@ -16,23 +21,7 @@ def analyze_image(image_data: str, description: str = "") -> str:
     """Analyze an image and provide description."""
     return f"Đây là một hình ảnh được tải lên. {description if description else 'Không có mô tả thêm.'}"
 
-# Tạo model với streaming support
-model = ChatOpenAI(
-    model=os.getenv('MODEL'), 
-    openai_api_key=os.getenv('OPENAI_API_KEY'),
-    streaming=True,  # Enable streaming
-    temperature=0.7
-)
-
-# Tạo memory saver cho persistent memory
-memory = MemorySaver()
-
-# Tạo agent với streaming support và memory
-agent = create_react_agent(
-    model=model,
-    tools=[get_weather, analyze_image],  
-    checkpointer=memory,  # Thêm memory support
-    prompt="""<default_system_instruction>
+SYSTEM_PROMPT = """<default_system_instruction>
 Bạn là một chuyên gia Kiểm thử phần mềm (QA/Test Engineer) có kinh nghiệm.  
 Nhiệm vụ của bạn là chuyển đổi yêu cầu nghiệp vụ được cung cấp thành danh sách Testcase chi tiết.  
 
@@ -52,7 +41,167 @@ Nhiệm vụ của bạn là chuyển đổi yêu cầu nghiệp vụ được c
 - Bao phủ nhiều tình huống: dữ liệu hợp lệ, không hợp lệ, ngoại lệ.  
 - Sử dụng ngôn ngữ chuẩn nghiệp vụ, không mơ hồ.  
 </default_system_instruction>"""
-)
+
+MODEL_NAME = os.getenv('MODEL')
+
+# Phiên bản model + prompt: thay đổi khi đổi MODEL hoặc sửa SYSTEM_PROMPT (dùng cho cache key)
+PROMPT_VERSION = f"{MODEL_NAME}:{hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:12]}"
+
+_system_message = None
+
+def _get_system_message():
+    global _system_message
+    if _system_message is None:
+        from langchain_core.messages import SystemMessage
+        _system_message = SystemMessage(content=SYSTEM_PROMPT)
+    return _system_message
+
+def _build_prompt(state: Dict[str, Any]) -> list:
+    """System prompt + lịch sử hội thoại, với handle attachment được resolve thành ảnh base64"""
+    from attachment_store import attachment_store
+    return [_get_system_message()] + attachment_store.resolve_messages_sync(state["messages"])
+
+async def _abuild_prompt(state: Dict[str, Any]) -> list:
+    from attachment_store import attachment_store
+    return [_get_system_message()] + await attachment_store.resolve_messages(state["messages"])
+
+# Các thành phần của agent được dựng lần đầu khi cần (request đầu tiên hoặc warm-up lúc khởi động),
+# để import ứng dụng và các route không dùng agent không phải chờ langgraph/langchain_openai
+_lock = threading.RLock()
+_model = None
+_checkpointer = None
+_history_manager = None
+_agent = None
+_agent_status: Dict[str, Any] = {"error": None, "build_ms": None}
+
+def get_model():
+    """ChatOpenAI dùng chung, dùng HTTP client có connection pool (cấu hình OPENAI_* trong llm_client)"""
+    global _model
+    with _lock:
+        if _model is None:
+            from langchain_openai import ChatOpenAI
+            from llm_client import llm_http_clients, OPENAI_MAX_RETRIES
+            # Tạo model với streaming support
+            _model = ChatOpenAI(
+                model=MODEL_NAME, 
+                openai_api_key=os.getenv('OPENAI_API_KEY'),
+                streaming=True,  # Enable streaming
+                temperature=0.7,
+                http_client=llm_http_clients.sync_client,
+                http_async_client=llm_http_clients.async_client,
+                timeout=llm_http_clients.timeout,
+                max_retries=OPENAI_MAX_RETRIES
+            )
+        return _model
+
+def get_checkpointer():
+    """Checkpointer bền vững: SQLite + LRU hot tier (thread temp_* chỉ giữ trong bộ nhớ)"""
+    global _checkpointer
+    with _lock:
+        if _checkpointer is None:
+            from checkpointer import SQLiteTieredSaver
+            _checkpointer = SQLiteTieredSaver()
+        return _checkpointer
+
+def get_history_manager():
+    """Giữ prompt mỗi lượt trong ngân sách token: lượt cũ được gộp vào running summary"""
+    global _history_manager
+    with _lock:
+        if _history_manager is None:
+            from history import HistoryManager
+            _history_manager = HistoryManager(get_model())
+        return _history_manager
+
+def get_agent():
+    """
+    Agent dùng chung, dựng ở lần gọi đầu tiên
+    
+    Raises:
+        Exception: Lỗi cấu hình (thiếu MODEL/OPENAI_API_KEY,...); lần gọi sau sẽ thử dựng lại
+    """
+    global _agent
+    if _agent is not None:
+        return _agent
+    with _lock:
+        if _agent is None:
+            start = time.perf_counter()
+            try:
+                from langgraph.prebuilt import create_react_agent
+                from langchain_core.runnables import RunnableLambda
+                from history import TestcaseAgentState
+                history_manager = get_history_manager()
+                # Tạo agent với streaming support và memory
+                _agent = create_react_agent(
+                    model=get_model(),
+                    tools=[get_weather, analyze_image],  
+                    checkpointer=get_checkpointer(),  # Thêm memory support
+                    state_schema=TestcaseAgentState,
+                    pre_model_hook=RunnableLambda(history_manager.compact_sync, afunc=history_manager.compact, name="HistoryCompaction"),
+                    # State/checkpoint chỉ giữ handle attachment, dữ liệu ảnh được nạp khi dựng request tới model
+                    prompt=RunnableLambda(_build_prompt, afunc=_abuild_prompt, name="Prompt")
+                )
+            except Exception as e:
+                _agent_status["error"] = str(e)
+                raise
+            _agent_status.update(error=None, build_ms=round((time.perf_counter() - start) * 1000, 1))
+        return _agent
+
+async def aget_agent():
+    """get_agent cho code async: dựng agent trong thread pool để không chặn event loop"""
+    if _agent is not None:
+        return _agent
+    return await asyncio.get_running_loop().run_in_executor(None, get_agent)
+
+def set_agent(agent):
+    """Thay agent dùng chung (ví dụ fake model trong benchmark)"""
+    global _agent
+    with _lock:
+        _agent = agent
+
+def set_model(model):
+    """Thay model dùng chung (ví dụ fake model trong load test); agent được dựng lại với model này ở lần gọi sau"""
+    global _model, _history_manager, _agent
+    with _lock:
+        _model = model
+        _history_manager = None
+        _agent = None
+
+def warm_up() -> bool:
+    """Dựng agent trước khi có request; lỗi được ghi lại trong agent_status thay vì raise"""
+    try:
+        get_agent()
+        return True
+    except Exception:
+        return False
+
+def agent_status() -> Dict[str, Any]:
+    """Trạng thái agent cho readiness check"""
+    return {"ready": _agent is not None, **_agent_status}
+
+def history_stats() -> Dict[str, Any]:
+    """Thống kê nén lịch sử (rỗng nếu agent chưa được dựng)"""
+    if _history_manager is None:
+        return {"ready": False}
+    return _history_manager.snapshot()
+
+def forget_thread(thread_id: str):
+    """Bỏ thread khỏi hot tier của checkpointer (nếu đã được dựng) sau khi checkpoint bị xóa trong DB"""
+    if _checkpointer is not None:
+        _checkpointer.evict(thread_id)
+
+@contextmanager
+def pin_thread(thread_id: Optional[str]):
+    """Giữ thread trong hot tier của checkpointer (không bị evict) trong lúc agent đang chạy trên thread đó"""
+    if not thread_id or _checkpointer is None:
+        yield
+        return
+    with _checkpointer.pinned(thread_id):
+        yield
+
+def close():
+    """Đóng checkpointer nếu đã được mở"""
+    if _checkpointer is not None:
+        _checkpointer.close()
 
 class AgentManager:
     """Manager class để xử lý agent với thread_id và file attachments"""
@@ -62,9 +211,10 @@ class AgentManager:
         title: str,
         pbi_requirement: str,
         has_file: bool = False,
-        file_name: Optional[str] = None
+        file_name: Optional[str] = None,
+        file_excerpt: Optional[str] = None
     ) -> str:
-        """Tạo message với context đầy đủ cho agent"""
+        """Tạo message với context đầy đủ cho agent (kèm các đoạn liên quan của file text nếu có)"""
         
         message_parts = [
             f"**Tiêu đề:** {title}",
@@ -74,4 +224,32 @@ class AgentManager:
         if has_file and file_name:
             message_parts.append(f"**File đính kèm:** {file_name}")
         
-        return "\n\n".join(message_parts)
\ No newline at end of file
+        if file_excerpt:
+            message_parts.append(f"**Nội dung liên quan trong file đính kèm:**\n{file_excerpt}")
+        
+        return "\n\n".join(message_parts)
+    
+    @staticmethod
+    def add_similar_testcases(message_content: str, similar: Dict[str, Any], testcases: list) -> str:
+        """
+        Thêm testcase của một request cũ gần trùng vào message, để agent chỉ sửa theo phần khác biệt
+        
+        Args:
+            message_content: Message đã tạo bởi create_message_with_context
+            similar: Request gần trùng (kết quả find_similar_requests)
+            testcases: Testcase của request đó ({"ordinal", "title", "steps": [...]})
+        """
+        lines = []
+        for testcase in testcases:
+            lines.append(f"### Testcase {testcase['ordinal']}: {testcase['title']}")
+            for step in testcase["steps"]:
+                lines.append(f"- Bước {step['step_no']}: {step['action']} -> Kết quả mong đợi: {step['expected_result']}")
+        
+        return "\n\n".join([
+            message_content,
+            f"**Yêu cầu PBI tương tự đã có testcase (độ tương đồng {similar['similarity']:.0%}):** "
+            f"{similar['pbi_requirement']}",
+            "**Testcase đã sinh cho yêu cầu tương tự:**\n" + "\n".join(lines),
+            "Hãy dùng lại các testcase trên: chỉ sửa, thêm hoặc bỏ những testcase bị ảnh hưởng bởi phần khác nhau "
+            "giữa hai yêu cầu, rồi trả về danh sách testcase đầy đủ cho yêu cầu hiện tại."
+        ])
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Attachment store: lưu file đính kèm theo SHA-256 và resolve handle thành dữ liệu khi gọi model
+"""
+
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from database import AsyncDatabaseManager, DatabaseManager, async_db_manager, db_manager
+
+if TYPE_CHECKING:
+    # Chỉ dùng cho type hint: import attachment_store lúc khởi động không kéo theo langchain_core
+    from langchain_core.messages import BaseMessage
+
+# Loại content block dùng làm handle trong message/checkpoint
+ATTACHMENT_REF_TYPE = "attachment_ref"
+# mime_type của nội dung text đã decode lưu bằng put_text
+TEXT_MIME_TYPE = "text/plain; charset=utf-8"
+# Tổng dung lượng base64 giữ trong bộ nhớ (bytes)
+ATTACHMENT_CACHE_BYTES = int(os.getenv("ATTACHMENT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+class AttachmentStore:
+    """
+    Kho attachment content-addressed
+
+    Dữ liệu (ảnh đã chuẩn hóa) được lưu một lần trong bảng attachments theo SHA-256 của
+    file upload gốc. Message của agent và checkpoint chỉ giữ một block handle nhỏ:
+    {"type": "attachment_ref", "attachment_id": ..., "mime_type": ...}; handle được thay
+    bằng block ảnh base64 ngay trước khi gửi request tới model. Bản base64 được giữ trong
+    LRU theo dung lượng để không encode lại ở các lượt sau.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        async_db: AsyncDatabaseManager,
+        cache_bytes: int = ATTACHMENT_CACHE_BYTES
+    ):
+        self.db = db
+        self.async_db = async_db
+        self.cache_bytes = cache_bytes
+        self._cache: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._cached_bytes = 0
+        # Resolve sync (agent.invoke) chạy trên thread khác event loop
+        self._lock = threading.Lock()
+        self.stats = {"stored": 0, "dedup_hits": 0, "encode_cache_hits": 0, "encodes": 0, "missing": 0}
+
+    @staticmethod
+    def make_ref(attachment_id: str, mime_type: str) -> Dict[str, Any]:
+        """Tạo content block handle cho một attachment"""
+        return {"type": ATTACHMENT_REF_TYPE, "attachment_id": attachment_id, "mime_type": mime_type}
+
+    async def find(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        """Thông tin attachment đã lưu (None nếu chưa có)"""
+        meta = await self.async_db.get_attachment_meta(attachment_id)
+        if meta is not None:
+            self.stats["dedup_hits"] += 1
+        return meta
+
+    async def put(self, attachment_id: str, mime_type: str, data: bytes, original_size: int) -> Dict[str, Any]:
+        """Lưu attachment (bỏ qua nếu đã có) và trả về thông tin bản đang lưu"""
+        meta = await self.async_db.put_attachment(attachment_id, mime_type, data, original_size)
+        self.stats["stored"] += 1
+        return meta
+
+    async def put_text(self, content: str) -> str:
+        """Lưu nội dung text đã decode của file đính kèm, trả về handle (SHA-256 của text)"""
+        data = content.encode("utf-8")
+        attachment_id = f"text:{hashlib.sha256(data).hexdigest()}"
+        await self.put(attachment_id, TEXT_MIME_TYPE, data, len(data))
+        return attachment_id
+
+    async def get_text(self, attachment_id: str) -> Optional[str]:
+        """Nội dung text đã lưu bằng put_text (None nếu không còn)"""
+        row = await self.async_db.get_attachment(attachment_id)
+        if row is None:
+            self.stats["missing"] += 1
+            return None
+        return row["data"].decode("utf-8")
+
+    def _cache_get(self, attachment_id: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            item = self._cache.get(attachment_id)
+            if item is not None:
+                self._cache.move_to_end(attachment_id)
+                self.stats["encode_cache_hits"] += 1
+            return item
+
+    def _cache_put(self, attachment_id: str, mime_type: str, base64_data: str):
+        with self._lock:
+            if attachment_id in self._cache or len(base64_data) > self.cache_bytes:
+                return
+            self._cache[attachment_id] = (mime_type, base64_data)
+            self._cached_bytes += len(base64_data)
+            while self._cached_bytes > self.cache_bytes:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    def _encode(self, attachment_id: str, row: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+        if row is None:
+            self.stats["missing"] += 1
+            return None
+        encoded = (row["mime_type"], base64.b64encode(row["data"]).decode("ascii"))
+        self.stats["encodes"] += 1
+        self._cache_put(attachment_id, *encoded)
+        return encoded
+
+    def get_base64_sync(self, attachment_id: str) -> Optional[Tuple[str, str]]:
+        """(mime_type, base64) của attachment, dùng cache nếu đã encode"""
+        return self._cache_get(attachment_id) or self._encode(attachment_id, self.db.get_attachment(attachment_id))
+
+    async def get_base64(self, attachment_id: str) -> Optional[Tuple[str, str]]:
+        """(mime_type, base64) của attachment, dùng cache nếu đã encode"""
+        cached = self._cache_get(attachment_id)
+        if cached is not None:
+            return cached
+        return self._encode(attachment_id, await self.async_db.get_attachment(attachment_id))
+
+    @staticmethod
+    def _ref_ids(messages: Sequence["BaseMessage"]) -> List[str]:
+        ids = []
+        for message in messages:
+            if isinstance(message.content, list):
+                for block in message.content:
+                    if isinstance(block, dict) and block.get("type") == ATTACHMENT_REF_TYPE:
+                        ids.append(block["attachment_id"])
+        return ids
+
+    @staticmethod
+    def _replace_refs(
+        messages: Sequence["BaseMessage"],
+        resolved: Dict[str, Optional[Tuple[str, str]]]
+    ) -> List["BaseMessage"]:
+        """Thay handle bằng block ảnh base64 (bản sao message, không sửa state của agent)"""
+        result = []
+        for message in messages:
+            if not isinstance(message.content, list) or not any(
+                isinstance(block, dict) and block.get("type") == ATTACHMENT_REF_TYPE
+                for block in message.content
+            ):
+                result.append(message)
+                continue
+
+            content = []
+            for block in message.content:
+                if not (isinstance(block, dict) and block.get("type") == ATTACHMENT_REF_TYPE):
+                    content.append(block)
+                    continue
+                item = resolved.get(block["attachment_id"])
+                if item is None:
+                    content.append({
+                        "type": "text",
+                        "text": f"[Ảnh đính kèm {block['attachment_id'][:12]} không còn trong kho lưu trữ]"
+                    })
+                else:
+                    mime_type, base64_data = item
+                    content.append({
+                        "type": "image",
+                        "source_type": "base64",
+                        "data": base64_data,
+                        "mime_type": mime_type,
+                    })
+            result.append(message.model_copy(update={"content": content}))
+        return result
+
+    def resolve_messages_sync(self, messages: Sequence["BaseMessage"]) -> List["BaseMessage"]:
+        """Resolve các handle attachment trong danh sách message (blocking)"""
+        ids = self._ref_ids(messages)
+        if not ids:
+            return list(messages)
+        resolved = {attachment_id: self.get_base64_sync(attachment_id) for attachment_id in set(ids)}
+        return self._replace_refs(messages, resolved)
+
+    async def resolve_messages(self, messages: Sequence["BaseMessage"]) -> List["BaseMessage"]:
+        """Resolve các handle attachment trong danh sách message"""
+        ids = self._ref_ids(messages)
+        if not ids:
+            return list(messages)
+        resolved = {attachment_id: await self.get_base64(attachment_id) for attachment_id in set(ids)}
+        return self._replace_refs(messages, resolved)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê lưu trữ/dedup và cache base64"""
+        return {**self.stats, "cached_entries": len(self._cache), "cached_bytes": self._cached_bytes}
+
+
+# Singleton instance
+attachment_store = AttachmentStore(db_manager, async_db_manager)
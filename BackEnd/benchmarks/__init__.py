@@ -0,0 +1,3 @@
+"""
+Benchmarks Package - Các script đo hiệu năng của backend
+"""
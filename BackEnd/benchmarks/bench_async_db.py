@@ -0,0 +1,91 @@
+"""
+Benchmark: p99 latency của SSE stream khi có DB write đồng thời
+
+So sánh 3 trường hợp:
+    - baseline: chỉ có stream, không có DB write
+    - sync writes: DB write gọi trực tiếp DatabaseManager trên event loop
+    - async writes: DB write qua AsyncDatabaseManager (executor + connection pool)
+
+Mỗi stream giả lập một SSE response phát chunk đều đặn; latency được đo là độ trễ
+giữa thời điểm chunk lẽ ra được phát và thời điểm thực tế.
+
+Chạy: python benchmarks/bench_async_db.py [--streams 50] [--writers 8]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from common import summarize, print_table
+
+from database import DatabaseManager, AsyncDatabaseManager
+
+
+async def simulated_stream(chunks: int, interval: float, lateness: list):
+    """Phát `chunks` chunk cách nhau `interval` giây, ghi lại độ trễ mỗi chunk (ms)"""
+    start = time.perf_counter()
+    for i in range(1, chunks + 1):
+        await asyncio.sleep(interval)
+        expected = start + i * interval
+        lateness.append((time.perf_counter() - expected) * 1000)
+
+
+async def sync_writer(manager: DatabaseManager, conversation_id: str, payload: str, stop: asyncio.Event):
+    """Ghi message bằng API sync ngay trên event loop (hành vi cũ)"""
+    while not stop.is_set():
+        manager.add_message(conversation_id, "assistant", payload)
+        await asyncio.sleep(0)
+
+
+async def async_writer(manager: AsyncDatabaseManager, conversation_id: str, payload: str, stop: asyncio.Event):
+    """Ghi message qua AsyncDatabaseManager"""
+    while not stop.is_set():
+        await manager.add_message(conversation_id, "assistant", payload)
+
+
+async def run_case(mode: str, db: DatabaseManager, async_db: AsyncDatabaseManager, args) -> list:
+    lateness: list = []
+    stop = asyncio.Event()
+    conversation_id = db.create_request("bench", "bench requirement")["conversation_id"]
+    payload = "x" * args.payload_size
+
+    writers = []
+    for _ in range(args.writers if mode != "baseline" else 0):
+        if mode == "sync":
+            writers.append(asyncio.create_task(sync_writer(db, conversation_id, payload, stop)))
+        else:
+            writers.append(asyncio.create_task(async_writer(async_db, conversation_id, payload, stop)))
+
+    await asyncio.gather(*[
+        simulated_stream(args.chunks, args.interval, lateness) for _ in range(args.streams)
+    ])
+    stop.set()
+    await asyncio.gather(*writers)
+    return lateness
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "bench.db"), pool_size=args.pool_size)
+        async_db = AsyncDatabaseManager(db)
+        results = {}
+        for mode in ("baseline", "sync", "async"):
+            lateness = await run_case(mode, db, async_db, args)
+            results[f"{mode} writes" if mode != "baseline" else "no writes"] = summarize(lateness)
+        async_db.close()
+    print_table(
+        f"chunk lateness: {args.streams} streams x {args.chunks} chunks, {args.writers} writers",
+        results
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.01, help="Khoảng cách giữa các chunk (giây)")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--payload-size", type=int, default=4096)
+    parser.add_argument("--pool-size", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,61 @@
+"""
+Benchmark: throughput của add_message khi nhiều stream kết thúc cùng lúc
+
+Mỗi thread giả lập một stream kết thúc và ghi cặp user/assistant message.
+Báo cáo số write/giây, latency mỗi write và số lỗi "database is locked".
+
+Chạy: python benchmarks/bench_db_writes.py [--threads 16] [--writes 200]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from common import summarize, print_table
+
+from database import DatabaseManager
+
+
+def worker(db: DatabaseManager, conversation_id: str, writes: int, payload: str, latencies: list, errors: list):
+    for _ in range(writes):
+        start = time.perf_counter()
+        try:
+            db.add_message(conversation_id, "assistant", payload)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "bench.db"))
+        conversation_ids = [db.create_request(f"bench {i}", "req")["conversation_id"] for i in range(args.threads)]
+        payload = "x" * args.payload_size
+        latencies: list = []
+        errors: list = []
+
+        threads = [
+            threading.Thread(target=worker, args=(db, cid, args.writes, payload, latencies, errors))
+            for cid in conversation_ids
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        db.connections.close_all()
+
+    print_table(f"add_message: {args.threads} threads x {args.writes} writes", {"add_message": summarize(latencies)})
+    print(f"throughput: {len(latencies) / elapsed:.0f} writes/s, locked errors: {len(errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--payload-size", type=int, default=4096)
+    main(parser.parse_args())
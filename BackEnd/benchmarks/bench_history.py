@@ -0,0 +1,76 @@
+"""
+Benchmark: prompt tokens mỗi lượt của một hội thoại dài, có và không có nén lịch sử
+
+Chạy một agent với fake model (cùng state schema, pre_model_hook và prompt như agent.py)
+qua nhiều lượt follow-up trên cùng thread, in số prompt tokens ước lượng mỗi lượt trước
+khi nén (toàn bộ lịch sử) và sau khi nén (lượt gần nhất + running summary).
+
+Chạy: python benchmarks/bench_history.py [--turns 30] [--budget 6000]
+"""
+import argparse
+import asyncio
+import time
+
+from common import summarize, print_table
+from fake_llm import FakeStreamingChatModel
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+
+import agent as agent_module
+from history import HistoryManager, TestcaseAgentState
+
+REQUIREMENT = (
+    "Bổ sung testcase cho màn hình đăng nhập: khóa tài khoản sau 5 lần sai mật khẩu, "
+    "gửi email mở khóa, ghi nhật ký truy cập. " * 3
+)
+
+
+async def run(turns: int, budget: int, response_words: int) -> list:
+    response = " ".join(f"Testcase {i}: bước thực hiện và kết quả mong đợi." for i in range(response_words // 8))
+    history = HistoryManager(
+        FakeStreamingChatModel(response_text="Tóm tắt: các testcase đăng nhập đã sinh.", first_token_latency=0.01),
+        enabled=True,
+        token_budget=budget
+    )
+    agent = create_react_agent(
+        model=FakeStreamingChatModel(response_text=response, first_token_latency=0.01, tokens_per_second=100000),
+        tools=[],
+        checkpointer=MemorySaver(),
+        state_schema=TestcaseAgentState,
+        pre_model_hook=RunnableLambda(history.compact_sync, afunc=history.compact),
+        prompt=RunnableLambda(agent_module._build_prompt, afunc=agent_module._abuild_prompt)
+    )
+    config = {"configurable": {"thread_id": "bench_history"}}
+
+    rows = []
+    for turn in range(1, turns + 1):
+        start = time.perf_counter()
+        await agent.ainvoke({"messages": [{"role": "user", "content": f"Lượt {turn}: {REQUIREMENT}"}]}, config)
+        elapsed = (time.perf_counter() - start) * 1000
+        before, after = history.samples[-1]
+        rows.append((turn, before, after, history.stats["summaries"], elapsed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--budget", type=int, default=6000, help="HISTORY_TOKEN_BUDGET")
+    parser.add_argument("--response-words", type=int, default=400, help="Độ dài mỗi câu trả lời (từ)")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args.turns, args.budget, args.response_words))
+    print(f"\n{'turn':>6}{'before':>10}{'after':>10}{'summaries':>12}{'ms':>10}")
+    for turn, before, after, summaries, elapsed in rows:
+        print(f"{turn:>6}{before:>10}{after:>10}{summaries:>12}{elapsed:>10.1f}")
+    print_table("Prompt tokens mỗi lượt", {
+        "không nén (toàn bộ lịch sử)": summarize([float(row[1]) for row in rows]),
+        "sau khi nén": summarize([float(row[2]) for row in rows]),
+    }, unit="tokens")
+    print(f"\nlượt cuối: {rows[-1][1]} tokens không nén -> {rows[-1][2]} tokens sau khi nén (budget {args.budget})")
+
+
+if __name__ == "__main__":
+    main()
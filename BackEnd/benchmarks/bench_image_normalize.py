@@ -0,0 +1,107 @@
+"""
+Benchmark: chuẩn hóa ảnh đính kèm trước khi gửi tới model multimodal
+
+Chạy ImageNormalizer trên một thư mục ảnh mẫu (screenshot, ảnh chụp điện thoại...) và in
+thời gian xử lý mỗi ảnh cùng tổng dung lượng base64 trước/sau. Nếu không truyền --folder,
+script sinh ảnh PNG tổng hợp kích thước như ảnh chụp điện thoại.
+
+Chạy: python benchmarks/bench_image_normalize.py [--folder ./samples] [--count 8]
+"""
+import argparse
+import asyncio
+import base64
+import mimetypes
+import os
+import random
+import time
+from typing import List, Tuple
+
+from common import invocation_path, summarize, print_table
+
+from Service.image_service import Image, ImageNormalizer
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif")
+
+
+def load_folder(folder: str) -> List[Tuple[str, bytes, str]]:
+    """Đọc toàn bộ ảnh trong thư mục"""
+    samples = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(folder, name), "rb") as f:
+            samples.append((name, f.read(), mimetypes.guess_type(name)[0] or "image/png"))
+    return samples
+
+
+def synthesize(count: int) -> List[Tuple[str, bytes, str]]:
+    """Sinh screenshot giả lập 1170x2532 (khung UI + vùng nhiễu) dạng PNG"""
+    import io
+    from PIL import ImageDraw
+
+    samples = []
+    rng = random.Random(42)
+    for i in range(count):
+        img = Image.new("RGB", (1170, 2532), (245, 245, 245))
+        draw = ImageDraw.Draw(img)
+        for row in range(0, 2532, 120):
+            draw.rectangle([40, row + 10, 1130, row + 100], fill=(rng.randrange(256), 200, 230))
+            draw.text((60, row + 40), f"Test case {i}-{row}", fill=(0, 0, 0))
+        # Vùng ảnh chụp (nhiễu) làm PNG khó nén như ảnh thật
+        noise = Image.effect_noise((600, 600), 64).convert("RGB")
+        img.paste(noise, (285, 900))
+        output = io.BytesIO()
+        img.save(output, format="PNG")
+        samples.append((f"synthetic_{i}.png", output.getvalue(), "image/png"))
+    return samples
+
+
+async def run(samples: List[Tuple[str, bytes, str]], normalizer: ImageNormalizer):
+    timings = []
+    before = after = 0
+    print(f"\n{'file':<32}{'before (B)':>14}{'after (B)':>14}{'ratio':>8}{'ms':>10}  size")
+    for name, data, mime in samples:
+        start = time.perf_counter()
+        result = await normalizer.normalize(data, mime)
+        elapsed = (time.perf_counter() - start) * 1000
+        timings.append(elapsed)
+        before += len(base64.b64encode(data))
+        after += len(base64.b64encode(result.data))
+        print(
+            f"{name[:31]:<32}{result.original_bytes:>14}{result.output_bytes:>14}"
+            f"{result.output_bytes / result.original_bytes:>8.2f}{elapsed:>10.1f}  "
+            f"{result.width}x{result.height} {result.mime_type}"
+        )
+
+    print_table("Thời gian chuẩn hóa mỗi ảnh", {"normalize": summarize(timings)})
+    print(f"\nbase64 payload: {before} -> {after} bytes ({1 - after / before:.1%} giảm)")
+    print(f"stats: {normalizer.snapshot()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", help="Thư mục chứa ảnh mẫu")
+    parser.add_argument("--count", type=int, default=8, help="Số ảnh tổng hợp khi không có --folder")
+    parser.add_argument("--max-dimension", type=int, default=1568)
+    parser.add_argument("--format", default="WEBP", choices=["WEBP", "JPEG", "PNG"])
+    parser.add_argument("--quality", type=int, default=80)
+    args = parser.parse_args()
+
+    if Image is None:
+        raise SystemExit("Cần cài Pillow để chạy benchmark này")
+
+    samples = load_folder(invocation_path(args.folder)) if args.folder else synthesize(args.count)
+    if not samples:
+        raise SystemExit("Không tìm thấy ảnh nào")
+
+    normalizer = ImageNormalizer(
+        enabled=True,
+        max_dimension=args.max_dimension,
+        output_format=args.format,
+        quality=args.quality
+    )
+    asyncio.run(run(samples, normalizer))
+
+
+if __name__ == "__main__":
+    main()
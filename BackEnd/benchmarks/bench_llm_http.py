@@ -0,0 +1,76 @@
+"""
+Benchmark: connection reuse của HTTP client dùng cho ChatOpenAI
+
+Chạy stub server tương thích OpenAI (benchmarks/stub_openai.py) và gọi model streaming
+qua ChatOpenAI với LLMHttpClients. So sánh pool có keep-alive (cấu hình mặc định) với
+pool không giữ connection (max_keepalive_connections=0, mỗi request một connection mới),
+in số connection phía server, số connection client mở và latency.
+
+Chạy: python benchmarks/bench_llm_http.py [--requests 200] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import time
+
+from common import summarize, print_table
+from stub_openai import StubOpenAIServer
+
+from langchain_openai import ChatOpenAI
+
+from llm_client import LLMHttpClients
+
+
+async def run_case(server: StubOpenAIServer, clients: LLMHttpClients, requests: int, concurrency: int):
+    """Gửi `requests` lời gọi streaming với `concurrency` lời gọi đồng thời, trả về latency (ms)"""
+    model = ChatOpenAI(
+        model="stub",
+        openai_api_key="stub",
+        base_url=server.base_url,
+        streaming=True,
+        http_async_client=clients.async_client,
+        timeout=clients.timeout,
+        max_retries=0
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            async for _ in model.astream("Sinh testcase cho màn hình đăng nhập"):
+                pass
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    await clients.aclose()
+    return latencies
+
+
+async def main(args):
+    server = StubOpenAIServer(first_token_latency=args.first_token_latency)
+    await server.start()
+    cases = {
+        "pooled (keep-alive)": LLMHttpClients(),
+        "no keep-alive": LLMHttpClients(max_keepalive_connections=0),
+    }
+    rows = {}
+    try:
+        for name, clients in cases.items():
+            server.reset()
+            latencies = await run_case(server, clients, args.requests, args.concurrency)
+            rows[name] = summarize(latencies)
+            snapshot = clients.snapshot()
+            print(f"{name:<24} server connections={server.connections:<5} requests={server.requests:<5} "
+                  f"client opened={snapshot['connections_opened']:<5} reuse={snapshot['connection_reuse_ratio']}")
+    finally:
+        await server.stop()
+
+    print_table(f"latency ({args.requests} requests, concurrency {args.concurrency})", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--first-token-latency", type=float, default=0.02)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,324 @@
+"""
+Load test: throughput, TTFB và latency các route chính với fake LLM (không gọi OpenAI)
+
+Server chạy ở process riêng (uvicorn, thư mục làm việc tạm nên database riêng), agent thật
+được dựng với FakeStreamingChatModel thay cho ChatOpenAI (agent.set_model), nên các tầng
+ChatService, checkpointer, history và DatabaseManager đều được đo. Mỗi scenario gửi
+--requests request với --concurrency worker đồng thời:
+- chat: POST /chat (stream)
+- agent_testcase: POST /agent-testcase không đính kèm
+- agent_testcase_text / agent_testcase_image: kèm file text / ảnh PNG
+- requests_crud: tạo, đọc, liệt kê, đọc messages, xoá request (mỗi thao tác tính một request)
+
+Với route SSE, TTFB là thời gian tới byte đầu tiên của body, TTFC là tới event "chunk" đầu tiên.
+Kết quả được so với baseline (benchmarks/load_baseline.json): latency p50/p95/p99 và TTFB p95
+tăng quá --latency-threshold (p99: --tail-threshold), throughput giảm quá --throughput-threshold, hoặc tỷ lệ lỗi vượt
+--max-error-rate đều tính là regression (exit code 1).
+
+Chạy: python benchmarks/bench_load.py [--concurrency 8] [--requests 40] [--scenarios chat,requests_crud]
+      python benchmarks/bench_load.py --update-baseline   # ghi kết quả lần chạy này làm baseline
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from common import invocation_path, summarize, print_table
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "load_baseline.json")
+SCENARIOS = ("chat", "agent_testcase", "agent_testcase_text", "agent_testcase_image", "requests_crud")
+
+TEXT_ATTACHMENT = "\n\n".join(
+    f"Mục {i}: Người dùng đăng nhập bằng email và mật khẩu. Sau 5 lần sai mật khẩu tài khoản bị khoá "
+    f"15 phút; hệ thống gửi email thông báo và ghi audit log cho lần đăng nhập thứ {i}."
+    for i in range(1, 200)
+).encode("utf-8")
+
+
+def make_png() -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (320, 240), (40, 120, 200)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def serve(args):
+    """Chạy server (process con) với agent dùng fake model"""
+    from fake_llm import FakeStreamingChatModel, DEFAULT_RESPONSE
+    import uvicorn
+    import agent as agent_module
+    import main
+
+    lines = DEFAULT_RESPONSE.splitlines()[:args.response_testcases * 3]
+    agent_module.set_model(FakeStreamingChatModel(
+        response_text="\n".join(lines),
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second
+    ))
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Result:
+    """Latency, TTFB và số lỗi của một scenario"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttfbs: List[float] = []
+        self.ttfcs: List[float] = []
+        self.errors = 0
+        self.wall = 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        total = len(self.latencies) + self.errors
+        latency = summarize(self.latencies)
+        return {
+            "requests": total,
+            "throughput_rps": round(len(self.latencies) / self.wall, 2) if self.wall else 0.0,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "latency_p50_ms": round(latency["p50"], 2),
+            "latency_p95_ms": round(latency["p95"], 2),
+            "latency_p99_ms": round(latency["p99"], 2),
+            "ttfb_p95_ms": round(summarize(self.ttfbs)["p95"], 2),
+            "ttfc_p95_ms": round(summarize(self.ttfcs)["p95"], 2) if self.ttfcs else None,
+        }
+
+
+async def timed_request(client: httpx.AsyncClient, result: Result, method: str, url: str, sse: bool = False, **kwargs):
+    """Gửi một request, ghi TTFB/latency (và TTFC với SSE); status lỗi hoặc event error tính là lỗi"""
+    start = time.perf_counter()
+    ttfb = ttfc = None
+    body = b""
+    try:
+        async with client.stream(method, url, **kwargs) as response:
+            async for chunk in response.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                if sse and ttfc is None and b'"type":"chunk"' in chunk:
+                    ttfc = time.perf_counter() - start
+                body += chunk
+        ok = response.status_code < 400 and not (sse and b'"type":"error"' in body)
+    except httpx.HTTPError:
+        ok = False
+    if not ok:
+        result.errors += 1
+        return None
+    elapsed = time.perf_counter() - start
+    result.latencies.append(elapsed * 1000)
+    result.ttfbs.append((ttfb if ttfb is not None else elapsed) * 1000)
+    if ttfc is not None:
+        result.ttfcs.append(ttfc * 1000)
+    return body
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, args) -> Result:
+    png = make_png() if name == "agent_testcase_image" else None
+
+    # Mỗi request agent_testcase dùng conversation riêng (tạo trước, không tính vào kết quả)
+    conversations = []
+    if name.startswith("agent_testcase"):
+        for i in range(args.warmup + args.requests):
+            response = await client.post("/requests", json={"title": f"Load {name} {i}", "pbi_requirement": "Đăng nhập"})
+            conversations.append(response.json()["conversation_id"])
+
+    async def one(i: int, result: Result):
+        if name == "chat":
+            await timed_request(client, result, "POST", "/chat", sse=True, json={
+                "messages": [{"role": "user", "content": f"Viết testcase cho chức năng đăng nhập #{i}"}],
+                "stream": True
+            })
+        elif name == "requests_crud":
+            body = await timed_request(client, result, "POST", "/requests", json={
+                "title": f"Load CRUD {i}", "pbi_requirement": "Người dùng đăng nhập bằng email"
+            })
+            if body is None:
+                return
+            conversation_id = json.loads(body)["conversation_id"]
+            await timed_request(client, result, "GET", f"/requests/{conversation_id}")
+            await timed_request(client, result, "GET", "/requests", params={"limit": 20})
+            await timed_request(client, result, "GET", f"/requests/{conversation_id}/messages")
+            await timed_request(client, result, "DELETE", f"/requests/{conversation_id}")
+        else:
+            files = None
+            if name == "agent_testcase_text":
+                files = {"file_attachment": ("spec.txt", TEXT_ATTACHMENT, "text/plain")}
+            elif name == "agent_testcase_image":
+                files = {"file_attachment": ("screen.png", png, "image/png")}
+            await timed_request(client, result, "POST", "/agent-testcase", sse=True, files=files, data={
+                "conversation_id": conversations[i],
+                "title": f"Màn hình đăng nhập #{i}",
+                "pbi_requirement": "Người dùng đăng nhập bằng email và mật khẩu",
+                "bypass_cache": "true"
+            })
+
+    async def worker(counter, result: Result):
+        for i in counter:
+            await one(i, result)
+
+    # Warm-up (không tính): cache của SQLite, retriever, image pipeline, connection pool
+    warmup = iter(range(args.warmup))
+    await asyncio.gather(*(worker(warmup, Result()) for _ in range(args.concurrency)))
+
+    result = Result()
+    counter = iter(range(args.warmup, args.warmup + args.requests))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(counter, result) for _ in range(args.concurrency)))
+    result.wall = time.perf_counter() - start
+    return result
+
+
+def compare(current: Dict[str, Dict], baseline: Dict, args) -> List[str]:
+    """Danh sách regression so với baseline"""
+    regressions = []
+    for name, stats in current.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for key, threshold in (
+            ("latency_p50_ms", args.latency_threshold),
+            ("latency_p95_ms", args.latency_threshold),
+            ("ttfb_p95_ms", args.latency_threshold),
+            ("latency_p99_ms", args.tail_threshold),
+        ):
+            if base.get(key) and stats[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name}.{key}: {stats[key]:.2f} > {base[key]:.2f} (+{threshold:.0%})")
+        if base.get("throughput_rps") and stats["throughput_rps"] < base["throughput_rps"] * (1 - args.throughput_threshold):
+            regressions.append(
+                f"{name}.throughput_rps: {stats['throughput_rps']:.2f} < {base['throughput_rps']:.2f} "
+                f"(-{args.throughput_threshold:.0%})"
+            )
+        if stats["error_rate"] > args.max_error_rate:
+            regressions.append(f"{name}.error_rate: {stats['error_rate']:.2%} > {args.max_error_rate:.2%}")
+    return regressions
+
+
+async def drive(args, base_url: str) -> Dict[str, Dict]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if (await client.get("/ready")).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("Server không sẵn sàng sau 60s")
+            await asyncio.sleep(0.1)
+
+        results = {}
+        latency_rows, ttfb_rows = {}, {}
+        for name in args.scenarios:
+            result = await run_scenario(client, name, args)
+            results[name] = result.to_dict()
+            latency_rows[name] = summarize(result.latencies)
+            ttfb_rows[name] = summarize(result.ttfbs)
+            if result.ttfcs:
+                ttfb_rows[f"{name} (chunk)"] = summarize(result.ttfcs)
+        print_table("latency", latency_rows)
+        print_table("time to first byte", ttfb_rows)
+        print(f"\n{'scenario':<24}{'requests':>10}{'req/s':>10}{'errors':>10}")
+        for name, stats in results.items():
+            print(f"{name:<24}{stats['requests']:>10}{stats['throughput_rps']:>10.2f}{stats['error_rate']:>10.2%}")
+        return results
+
+
+def main(args):
+    config = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "first_token_latency": args.first_token_latency,
+        "tokens_per_second": args.tokens_per_second,
+        "response_testcases": args.response_testcases,
+    }
+    print(f"config: {json.dumps(config)}")
+
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault("MODEL", "gpt-4o-mini")
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env["AGENT_WARMUP"] = "true"
+    # Đủ slot/hàng đợi cho mức concurrency của load test (có thể ghi đè bằng biến môi trường)
+    env.setdefault("LLM_MAX_CONCURRENCY", str(args.concurrency))
+    env.setdefault("LLM_MAX_QUEUE", str(args.concurrency * 4))
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen(
+            [sys.executable, "-W", "ignore", os.path.abspath(__file__), "--serve", "--port", str(port),
+             "--first-token-latency", str(args.first_token_latency),
+             "--tokens-per-second", str(args.tokens_per_second),
+             "--response-testcases", str(args.response_testcases)],
+            cwd=workdir, env=env
+        )
+        try:
+            results = asyncio.run(drive(args, f"http://127.0.0.1:{port}"))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "scenarios": results}, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"\nĐã ghi baseline: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nChưa có baseline ({args.baseline}), chạy lại với --update-baseline để tạo")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print(f"\nCảnh báo: cấu hình khác baseline {json.dumps(baseline.get('config'))}")
+    regressions = compare(results, baseline, args)
+    if regressions:
+        print("\nREGRESSION:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nKhông có regression so với baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40, help="Số request mỗi scenario")
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS))
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--response-testcases", type=int, default=5, help="Số testcase trong response của fake model")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--warmup", type=int, default=8, help="Số request warm-up (không tính) mỗi scenario")
+    parser.add_argument("--latency-threshold", type=float, default=0.35,
+                        help="Tỷ lệ tăng tối đa của latency p50/p95 và TTFB p95 so với baseline")
+    parser.add_argument("--tail-threshold", type=float, default=0.75, help="Tỷ lệ tăng tối đa của latency p99")
+    parser.add_argument("--throughput-threshold", type=float, default=0.25, help="Tỷ lệ giảm throughput tối đa so với baseline")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+    parsed.baseline = invocation_path(parsed.baseline)
+    unknown = set(parsed.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"scenario không hợp lệ: {', '.join(sorted(unknown))}")
+    if parsed.serve:
+        serve(parsed)
+    else:
+        sys.exit(main(parsed))
@@ -0,0 +1,57 @@
+"""
+Benchmark: overhead của instrumentation trên vòng lặp stream SSE
+
+Phát N frame SSE (giống event chunk của /agent-testcase) qua một async generator, đo thời
+gian mỗi frame khi đọc trực tiếp và khi bọc bởi metrics.instrument_sse; kèm chi phí một lần
+observe histogram và render /metrics.
+
+Chạy: python benchmarks/bench_metrics.py [--frames 200000]
+"""
+import argparse
+import asyncio
+import time
+
+from common import BACKEND_DIR  # noqa: F401  # thêm BackEnd vào sys.path
+
+from metrics import MetricsRegistry, instrument_sse, registry
+from Service.sse_encoder import ChunkFrameEncoder
+
+FRAME = ChunkFrameEncoder(conversation_id="conv_0123456789ab").encode("Kiểm tra đăng nhập ")
+
+
+async def source(frames: int):
+    for _ in range(frames):
+        yield FRAME
+
+
+async def consume(stream) -> float:
+    start = time.perf_counter()
+    async for _ in stream:
+        pass
+    return time.perf_counter() - start
+
+
+async def main(args):
+    raw = await consume(source(args.frames))
+    instrumented = await consume(instrument_sse("/bench", source(args.frames)))
+    print(f"{args.frames} frames")
+    print(f"  raw generator         {raw / args.frames * 1e9:8.0f} ns/frame")
+    print(f"  instrument_sse        {instrumented / args.frames * 1e9:8.0f} ns/frame "
+          f"(+{(instrumented - raw) / args.frames * 1e9:.0f} ns)")
+
+    scratch = MetricsRegistry()
+    histogram = scratch.histogram("bench_seconds", "bench", ("route",))
+    start = time.perf_counter()
+    for i in range(args.frames):
+        histogram.observe(i * 1e-6, "/bench")
+    print(f"  histogram.observe     {(time.perf_counter() - start) / args.frames * 1e9:8.0f} ns/call")
+
+    start = time.perf_counter()
+    text = registry.render()
+    print(f"  render /metrics       {(time.perf_counter() - start) * 1000:8.2f} ms ({len(text.splitlines())} lines)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=200000)
+    asyncio.run(main(parser.parse_args()))
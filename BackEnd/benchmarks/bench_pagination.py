@@ -0,0 +1,131 @@
+"""
+Benchmark: keyset pagination của /requests và /requests/{id}/messages
+
+Sinh dữ liệu tổng hợp (mặc định 20k requests, 1M messages), sau đó so sánh:
+    - đọc toàn bộ bảng (mọi trang, như /requests không có limit/cursor) với get_requests_page (trang đầu và trang sâu)
+    - toàn bộ messages của conversation với get_messages_page
+và in query plan để kiểm tra index composite được sử dụng.
+
+Chạy: python benchmarks/bench_pagination.py [--messages 1000000] [--requests 20000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import summarize, print_table
+
+from database import MAX_PAGE_SIZE, DatabaseManager
+
+
+def populate(db: DatabaseManager, requests: int, messages: int):
+    """Insert dữ liệu tổng hợp trong một transaction"""
+    start = time.perf_counter()
+    with db.transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO requests (conversation_id, title, pbi_requirement, created_at, updated_at)
+            VALUES (?, ?, ?, datetime('2024-01-01', ? || ' seconds'), datetime('2024-01-01', ? || ' seconds'))
+            """,
+            ((f"conv_{i:012d}", f"Request {i}", "Yêu cầu " * 20, i, random.randint(0, 10_000_000))
+             for i in range(requests))
+        )
+        conn.executemany(
+            """
+            INSERT INTO messages (conversation_id, role, content, created_at)
+            VALUES (?, ?, ?, datetime('2024-01-01', ? || ' seconds'))
+            """,
+            ((f"conv_{random.randrange(requests):012d}", "user" if i % 2 else "assistant", "Nội dung " * 10, i)
+             for i in range(messages))
+        )
+    print(f"populated {requests} requests / {messages} messages in {time.perf_counter() - start:.1f}s")
+
+
+def timed(func, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def walk_pages(fetch, pages: int):
+    """Đi qua `pages` trang liên tiếp, trả về cursor của trang cuối"""
+    cursor = None
+    for _ in range(pages):
+        page = fetch(cursor)
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    return cursor
+
+
+def all_pages(fetch) -> list:
+    """Đọc hết mọi trang với page size tối đa"""
+    items, cursor = [], None
+    while True:
+        page = fetch(MAX_PAGE_SIZE, cursor)
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return items
+
+
+def main(args):
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "bench.db"))
+        populate(db, args.requests, args.messages)
+        with db.get_connection() as conn:
+            conn.execute("ANALYZE")
+
+        # Conversation có nhiều messages nhất
+        with db.get_connection() as conn:
+            conversation_id = conn.execute(
+                "SELECT conversation_id FROM messages GROUP BY conversation_id ORDER BY COUNT(*) DESC LIMIT 1"
+            ).fetchone()[0]
+
+        deep_request_cursor = walk_pages(lambda c: db.get_requests_page(args.limit, c), args.deep_pages)
+        deep_message_cursor = walk_pages(lambda c: db.get_messages_page(conversation_id, 10, c), 5)
+
+        results = {
+            "all requests": summarize(timed(lambda: all_pages(db.get_requests_page), max(1, args.repeat // 10))),
+            "requests page 1": summarize(timed(lambda: db.get_requests_page(args.limit), args.repeat)),
+            f"requests page {args.deep_pages + 1}": summarize(
+                timed(lambda: db.get_requests_page(args.limit, deep_request_cursor), args.repeat)),
+            "all messages of conversation": summarize(timed(
+                lambda: all_pages(lambda page_limit, cursor: db.get_messages_page(conversation_id, page_limit, cursor)),
+                args.repeat
+            )),
+            "messages page 1": summarize(timed(lambda: db.get_messages_page(conversation_id, 10), args.repeat)),
+            "messages page 6": summarize(
+                timed(lambda: db.get_messages_page(conversation_id, 10, deep_message_cursor), args.repeat)),
+        }
+        print_table(f"{args.messages} messages, page size {args.limit}", results)
+
+        with db.get_connection() as conn:
+            print("\nquery plan (requests page):")
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM requests WHERE (updated_at, id) < (?, ?) "
+                "ORDER BY updated_at DESC, id DESC LIMIT 51", ("2024-06-01 00:00:00", 1)
+            ):
+                print("  ", row["detail"])
+            print("query plan (messages page):")
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM messages WHERE conversation_id = ? AND (created_at, id) > (?, ?) "
+                "ORDER BY created_at ASC, id ASC LIMIT 51", (conversation_id, "2024-01-01 00:00:00", 0)
+            ):
+                print("  ", row["detail"])
+        db.connections.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--deep-pages", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,88 @@
+"""
+Benchmark: chia đoạn + BM25 index cho file đính kèm text lớn
+
+Sinh tài liệu đặc tả tổng hợp (mặc định 5 MB, nhiều section), đo thời gian build index
+(chia đoạn + index) và thời gian query/chọn đoạn trong ngân sách token với một số
+title + PBI requirement mẫu.
+
+Chạy: python benchmarks/bench_retrieval.py [--size-mb 5] [--repeat 5] [--budget 1500]
+"""
+import argparse
+import random
+import time
+
+from common import summarize, print_table
+
+from Service.retrieval_service import AttachmentRetriever, estimate_tokens
+
+VOCABULARY = (
+    "người dùng hệ thống đăng nhập mật khẩu tài khoản quản trị báo cáo thanh toán đơn hàng "
+    "giỏ hàng sản phẩm tìm kiếm bộ lọc phân trang thông báo email xác thực phân quyền "
+    "nhật ký lỗi hiệu năng bảo mật dữ liệu xuất nhập file cấu hình giao diện màn hình nút "
+    "trường bắt buộc hợp lệ không hợp lệ thời gian phản hồi khóa mở trạng thái lịch sử"
+).split()
+
+QUERIES = [
+    ("Đăng nhập", "Người dùng đăng nhập bằng email và mật khẩu, khóa tài khoản sau 5 lần sai"),
+    ("Thanh toán đơn hàng", "Thanh toán giỏ hàng bằng thẻ, gửi email xác nhận đơn hàng"),
+    ("Xuất báo cáo", "Quản trị xuất báo cáo doanh thu theo bộ lọc thời gian ra file CSV"),
+]
+
+
+def synthesize(size_bytes: int, seed: int = 7) -> str:
+    """Tài liệu markdown gồm nhiều section, mỗi section vài paragraph"""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    section = 0
+    while total < size_bytes:
+        section += 1
+        heading = f"## {section}. {' '.join(rng.choices(VOCABULARY, k=4)).capitalize()}"
+        parts.append(heading)
+        total += len(heading.encode("utf-8")) + 2
+        for _ in range(rng.randint(2, 6)):
+            paragraph = " ".join(rng.choices(VOCABULARY, k=rng.randint(40, 120))) + "."
+            parts.append(paragraph)
+            total += len(paragraph.encode("utf-8")) + 2
+    return "\n\n".join(parts)
+
+
+def timed(func, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=1500, help="Ngân sách token cho phần trích")
+    args = parser.parse_args()
+
+    text = synthesize(int(args.size_mb * 1024 * 1024))
+    retriever = AttachmentRetriever(token_budget=args.budget)
+    print(f"document: {len(text.encode('utf-8'))} bytes, ~{estimate_tokens(text)} tokens")
+
+    index = retriever.build_index(text)
+    print(f"chunks: {len(index.chunks)}, terms: {len(index.postings)}")
+
+    rows = {"build index (chunk + BM25)": summarize(timed(lambda: retriever.build_index(text), args.repeat))}
+    for title, requirement in QUERIES:
+        query = f"{title}\n{requirement}"
+        rows[f"query: {title}"[:31]] = summarize(timed(lambda: index.search(query), args.repeat * 10))
+    query = f"{QUERIES[0][0]}\n{QUERIES[0][1]}"
+    rows["select (index cached)"] = summarize(
+        timed(lambda: retriever.select_sync(text, query, digest="bench"), args.repeat * 10)
+    )
+    print_table(f"Retrieval trên tài liệu {args.size_mb:g} MB", rows)
+
+    excerpt = retriever.select_sync(text, query, digest="bench")
+    print(f"\nexcerpt: {len(excerpt)} chars, ~{estimate_tokens(excerpt)} tokens (budget {args.budget})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark: tìm kiếm full-text (/search) trên requests và messages
+
+Sinh dữ liệu tổng hợp (mặc định 20k requests, 1M messages) theo mẫu câu của PBI và testcase
+do agent sinh ra, kèm mã hiếm theo phân phối Zipf, ghi qua trigger FTS; sau đó đo latency của
+DatabaseManager.search với các loại truy vấn: từ hiếm, từ phổ biến, nhiều từ, cụm từ, tiền tố,
+không dấu, trang thứ hai, trang thứ 20 và tìm trong một conversation.
+
+Chạy: python benchmarks/bench_search.py [--messages 1000000] [--requests 20000] [--repeat 30]
+      python benchmarks/bench_search.py --db /tmp/search.db   # giữ lại database để chạy lại nhanh
+"""
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+
+from common import invocation_path, summarize, print_table
+
+from database import DatabaseManager, build_fts_query
+
+FEATURES = (
+    "đăng nhập", "đăng xuất", "đổi mật khẩu", "quên mật khẩu", "khoá tài khoản", "giỏ hàng",
+    "thanh toán", "tìm kiếm sản phẩm", "bộ lọc danh sách", "quản lý đơn hàng", "huỷ đơn hàng",
+    "xuất báo cáo", "tải ảnh lên", "phân quyền quản trị", "thông báo email", "cập nhật hồ sơ",
+)
+CONDITIONS = (
+    "dữ liệu hợp lệ", "bỏ trống trường bắt buộc", "nhập sai định dạng email", "vượt quá số ký tự tối đa",
+    "mất kết nối mạng", "phiên đăng nhập hết hạn", "nhập sai mật khẩu 5 lần", "không có quyền truy cập",
+    "tải file quá dung lượng", "nhiều người dùng thao tác đồng thời",
+)
+ACTIONS = (
+    "Mở màn hình {feature}", "Nhập thông tin vào form", "Nhấn nút Xác nhận", "Chọn bộ lọc theo ngày",
+    "Làm mới trang", "Đăng nhập bằng tài khoản quản trị", "Nhấn nút Huỷ", "Tải file đính kèm",
+)
+RESULTS = (
+    "hệ thống hiển thị thông báo thành công", "hệ thống hiển thị thông báo lỗi", "dữ liệu được lưu",
+    "chuyển tới trang chủ", "tài khoản bị khoá 15 phút", "nút Xác nhận bị vô hiệu hoá",
+    "thời gian phản hồi dưới 2 giây", "danh sách được cập nhật",
+)
+# Mã hiếm (tên màn hình, mã lỗi,...): tần suất giảm theo Zipf
+RARE_CODES = [f"mã{i}" for i in range(1, 20001)]
+RARE_CUM_WEIGHTS = list(itertools.accumulate(1.0 / i for i in range(1, len(RARE_CODES) + 1)))
+
+QUERIES = {
+    "rare word": "mã15000",
+    "medium word": "mã50",
+    "common word": "thanh toán",
+    "phrase": '"khoá tài khoản"',
+    "prefix": "mã123*",
+    "no diacritics": "phien dang nhap het han",
+}
+
+
+def rare(rng: random.Random) -> str:
+    return rng.choices(RARE_CODES, cum_weights=RARE_CUM_WEIGHTS)[0]
+
+
+def pbi(rng: random.Random) -> str:
+    feature = rng.choice(FEATURES)
+    return (f"Là người dùng, tôi muốn {feature} ({rare(rng)}) để hoàn thành công việc. "
+            f"Hệ thống phải xử lý trường hợp {rng.choice(CONDITIONS)} và {rng.choice(CONDITIONS)}.")
+
+
+def testcases(rng: random.Random) -> str:
+    lines = []
+    for n in range(1, rng.randint(2, 4) + 1):
+        feature = rng.choice(FEATURES)
+        lines.append(f"### Testcase {n}: Kiểm tra {feature} khi {rng.choice(CONDITIONS)} ({rare(rng)})")
+        for step in range(1, 3):
+            action = rng.choice(ACTIONS).format(feature=feature)
+            lines.append(f"- Bước {step}: {action} -> Kết quả mong đợi: {rng.choice(RESULTS)}")
+    return "\n".join(lines)
+
+
+def populate(db: DatabaseManager, requests: int, messages: int, batch: int = 50000):
+    """Insert dữ liệu tổng hợp theo lô (index FTS được cập nhật qua trigger)"""
+    rng = random.Random(42)
+    start = time.perf_counter()
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO requests (conversation_id, title, pbi_requirement) VALUES (?, ?, ?)",
+            ((f"conv_{i:012d}", f"Màn hình {rng.choice(FEATURES)} {rare(rng)}", pbi(rng)) for i in range(requests))
+        )
+    for offset in range(0, messages, batch):
+        with db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
+                ((f"conv_{rng.randrange(requests):012d}", "assistant" if i % 2 else "user",
+                  testcases(rng) if i % 2 else pbi(rng))
+                 for i in range(offset, min(offset + batch, messages)))
+            )
+    elapsed = time.perf_counter() - start
+    print(f"populated {requests} requests / {messages} messages (with FTS triggers) in {elapsed:.1f}s "
+          f"({elapsed / (requests + messages) * 1e6:.0f} µs/row)")
+
+
+def timed(func, repeat: int) -> list:
+    func()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def run(db: DatabaseManager, args):
+    with db.get_connection() as conn:
+        if conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0] == 0:
+            populate(db, args.requests, args.messages)
+        total = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        counts = {
+            name: conn.execute(
+                "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?", (build_fts_query(query),)
+            ).fetchone()[0]
+            for name, query in QUERIES.items()
+        }
+
+    rows = {}
+    for name, query in QUERIES.items():
+        ranking = db.search(query, limit=1)["ranking"]
+        rows[f"{name} ({counts[name]} hits, {ranking})"] = summarize(timed(lambda: db.search(query, limit=20), args.repeat))
+    second_page = db.search(QUERIES["common word"], limit=20)["next_cursor"]
+    rows["common word, page 2"] = summarize(timed(
+        lambda: db.search(QUERIES["common word"], limit=20, cursor=second_page), args.repeat
+    ))
+    deep_page = None
+    for _ in range(19):
+        deep_page = db.search(QUERIES["common word"], limit=20, cursor=deep_page)["next_cursor"]
+    rows["common word, page 20"] = summarize(timed(
+        lambda: db.search(QUERIES["common word"], limit=20, cursor=deep_page), args.repeat
+    ))
+    medium_page = None
+    for _ in range(19):
+        medium_page = db.search(QUERIES["medium word"], limit=20, cursor=medium_page)["next_cursor"]
+    rows["medium word, page 20"] = summarize(timed(
+        lambda: db.search(QUERIES["medium word"], limit=20, cursor=medium_page), args.repeat
+    ))
+    rows["common word, 1 conversation"] = summarize(timed(
+        lambda: db.search(QUERIES["common word"], conversation_id=f"conv_{123:012d}", limit=20), args.repeat
+    ))
+    print_table(f"search latency over {total} messages, limit 20 ({args.repeat} runs)", rows)
+
+    slow = [name for name, stats in rows.items() if stats["p95"] >= 50]
+    print(f"\np95 < 50 ms: {'all queries' if not slow else 'NOT for ' + ', '.join(slow)}")
+
+
+def main(args):
+    if args.db:
+        run(DatabaseManager(invocation_path(args.db)), args)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        run(DatabaseManager(os.path.join(tmp, "bench.db")), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--db", help="File database (dùng lại nếu đã có dữ liệu)")
+    main(parser.parse_args())
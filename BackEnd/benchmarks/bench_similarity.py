@@ -0,0 +1,131 @@
+"""
+Benchmark: tìm request gần trùng (MinHash/LSH) khi số request tăng dần
+
+Sinh PBI tổng hợp rồi tạo các bản viết lại (đổi tên trường, thêm một câu, đổi con số) của PBI đã lưu;
+đo latency của DatabaseManager.find_similar_requests ở từng kích thước bảng, so với quét toàn bộ
+signature, kèm recall (tìm lại được PBI gốc), tỷ lệ PBI ngẫu nhiên có kết quả khớp và sai số của
+độ tương đồng ước lượng so với Jaccard chính xác trên tập shingle.
+
+Chạy: python benchmarks/bench_similarity.py [--sizes 1000,10000,100000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import summarize, print_table
+from bench_search import FEATURES, CONDITIONS, RESULTS, rare
+
+from database import DatabaseManager
+from similarity import minhasher, shingles, SIMILARITY_THRESHOLD
+
+ROLES = ("người dùng", "quản trị viên", "nhân viên kho", "khách hàng", "kế toán")
+FIELDS = (
+    "email", "số điện thoại", "mật khẩu", "họ tên", "ngày sinh", "địa chỉ giao hàng", "mã giảm giá",
+    "số lượng", "đơn giá", "ghi chú", "ảnh đại diện", "mã số thuế", "tên công ty", "phương thức thanh toán",
+    "ngày bắt đầu", "ngày kết thúc", "trạng thái", "mã đơn hàng", "tên sản phẩm", "danh mục",
+)
+EXTRA = (
+    "Ghi log mọi thao tác để phục vụ kiểm toán.", "Hỗ trợ hiển thị trên thiết bị di động.",
+    "Gửi email xác nhận sau khi hoàn tất.", "Chỉ người có quyền quản trị mới được xoá dữ liệu.",
+)
+
+
+def pbi(rng: random.Random) -> str:
+    fields = rng.sample(FIELDS, rng.randint(2, 4))
+    return (f"Là {rng.choice(ROLES)}, tôi muốn {rng.choice(FEATURES)} ({rare(rng)}) với các trường "
+            f"{', '.join(fields)}. Trường {fields[0]} là bắt buộc, tối đa {rng.choice((50, 100, 255))} ký tự. "
+            f"Hệ thống phải xử lý trường hợp {rng.choice(CONDITIONS)} và {rng.choice(CONDITIONS)}; "
+            f"khi thành công thì {rng.choice(RESULTS)}.")
+
+
+def rewrite(rng: random.Random, text: str) -> str:
+    """Bản viết lại nhẹ của một PBI"""
+    kind = rng.randrange(3)
+    if kind == 0:
+        present = [field for field in FIELDS if field in text]
+        return text.replace(rng.choice(present), rng.choice([f for f in FIELDS if f not in present]), 1)
+    if kind == 1:
+        return f"{text} {rng.choice(EXTRA)}"
+    return text.replace("tối đa", "không quá").replace(" ký tự", f" ký tự (mặc định {rng.randint(1, 9)})")
+
+
+def jaccard(a: str, b: str) -> float:
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b)
+
+
+def timed(func, queries: list) -> list:
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def full_scan(db: DatabaseManager, text: str) -> list:
+    """Cách không dùng LSH: so signature của query với mọi request"""
+    signature = minhasher.signature(text)
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT request_id, signature FROM request_signatures").fetchall()
+    scored = [(minhasher.similarity(signature, minhasher.unpack(row[1])), row[0]) for row in rows]
+    return sorted((item for item in scored if item[0] >= SIMILARITY_THRESHOLD), reverse=True)[:5]
+
+
+def main(args):
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    rng = random.Random(7)
+
+    sample = [pbi(rng) for _ in range(1000)]
+    start = time.perf_counter()
+    for text in sample:
+        minhasher.buckets(minhasher.signature(text))
+    print(f"signature + {minhasher.bands} LSH buckets: {(time.perf_counter() - start) / len(sample) * 1e3:.3f} ms/PBI")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "bench.db"))
+        stored: list = []
+        rows = {}
+        for size in sizes:
+            start = time.perf_counter()
+            batch = [(f"Request {i}", pbi(rng)) for i in range(len(stored), size)]
+            for offset in range(0, len(batch), 5000):
+                created = db.create_requests(batch[offset:offset + 5000])
+                stored.extend((item["conversation_id"], item["pbi_requirement"]) for item in created)
+            print(f"{size} requests: create_requests {(time.perf_counter() - start) / max(1, len(batch)) * 1e6:.0f} µs/row "
+                  f"(kèm signature + LSH)")
+
+            targets = rng.sample(stored, args.queries)
+            queries = [rewrite(rng, text) for _, text in targets]
+            found = sum(
+                any(match["conversation_id"] == conversation_id for match in db.find_similar_requests(query))
+                for (conversation_id, _), query in zip(targets, queries)
+            )
+            # PBI ngẫu nhiên cùng mẫu câu: khi bảng lớn, một số có request cũ thực sự gần giống
+            errors, matched = [], []
+            for text in (pbi(rng) for _ in range(args.queries)):
+                matches = db.find_similar_requests(text)
+                if matches:
+                    exact = jaccard(text, matches[0]["pbi_requirement"])
+                    matched.append(exact)
+                    errors.append(abs(matches[0]["similarity"] - exact))
+            print(f"  recall {found / len(queries):.1%} (rewrites); random PBIs with a match: "
+                  f"{len(matched) / args.queries:.1%}"
+                  + (f" (exact Jaccard min {min(matched):.2f}, mean |estimate - exact| "
+                     f"{sum(errors) / len(errors):.3f})" if matched else ""))
+
+            rows[f"LSH lookup, {size} requests"] = summarize(timed(db.find_similar_requests, queries))
+            if size <= args.scan_max:
+                rows[f"full scan, {size} requests"] = summarize(timed(lambda q: full_scan(db, q), queries[:20]))
+
+        print_table(f"near-duplicate lookup (threshold {SIMILARITY_THRESHOLD})", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scan-max", type=int, default=100000, help="Chỉ đo quét toàn bộ tới kích thước này")
+    main(parser.parse_args())
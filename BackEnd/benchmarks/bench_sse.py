@@ -0,0 +1,120 @@
+"""
+Benchmark: số lần ghi, bytes trên đường truyền và CPU encode của một response SSE
+
+Phát DEFAULT_RESPONSE của fake model theo từng token với token rate cố định rồi so sánh
+cách cũ (mỗi token một frame, json.dumps) với frame được gộp (coalesce_text + ChunkFrameEncoder)
+và gộp + gzip. Mỗi frame là một message body của ASGI, tức một lần transport.write / một syscall
+send của uvicorn; bytes trên đường truyền tính cả phần header chunked transfer-encoding của mỗi lần ghi.
+Độ trễ thêm là thời gian từ khi token được sinh ra tới khi frame chứa token đó được ghi.
+
+Chạy: python benchmarks/bench_sse.py [--tokens-per-second 200] [--runs 3] [--max-latency-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import time
+import zlib
+from typing import List
+
+from common import summarize, print_table
+from fake_llm import DEFAULT_RESPONSE, split_tokens
+
+from Service.sse_encoder import ChunkFrameEncoder, coalesce_text, SSE_GZIP_LEVEL
+
+CONVERSATION_ID = "conv_0123456789ab"
+
+
+async def token_source(tokens: List[str], tokens_per_second: float, emitted: List[float]):
+    """Phát token theo lịch cố định (không trôi theo sai số của sleep), ghi thời điểm sinh từng token"""
+    start = time.perf_counter()
+    for i, token in enumerate(tokens):
+        delay = start + i / tokens_per_second - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        emitted.append(time.perf_counter())
+        yield token
+
+
+async def legacy_frames(source, encode_seconds: List[float]):
+    """Cách cũ: mỗi token một event, serialize bằng json.dumps"""
+    async for text in source:
+        start = time.perf_counter()
+        frame = f"data: {json.dumps({'type': 'chunk', 'content': text, 'role': 'assistant', 'conversation_id': CONVERSATION_ID}, ensure_ascii=False)}\n\n"
+        encode_seconds[0] += time.perf_counter() - start
+        yield frame
+
+
+async def coalesced_frames(source, encode_seconds: List[float], max_latency_ms: float):
+    encoder = ChunkFrameEncoder(conversation_id=CONVERSATION_ID)
+    async for text in coalesce_text(source, max_latency_ms=max_latency_ms):
+        start = time.perf_counter()
+        frame = encoder.encode(text)
+        encode_seconds[0] += time.perf_counter() - start
+        yield frame
+
+
+async def measure(name: str, tokens: List[str], args) -> dict:
+    emitted: List[float] = []
+    encode_seconds = [0.0]
+    source = token_source(tokens, args.tokens_per_second, emitted)
+    if name == "per-token json.dumps":
+        frames = legacy_frames(source, encode_seconds)
+    else:
+        frames = coalesced_frames(source, encode_seconds, args.max_latency_ms)
+
+    # Nén từng frame với sync flush như gzip_stream (đo riêng CPU nén, không tính thời gian chờ token)
+    compressor = zlib.compressobj(SSE_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if name.endswith("gzip") else None
+    bodies: List[bytes] = []
+    written: List[tuple] = []  # (thời điểm ghi, số ký tự content đã gửi tới lúc đó)
+    chars = 0
+    async for frame in frames:
+        start = time.perf_counter()
+        body = frame.encode("utf-8")
+        if compressor is not None:
+            body = compressor.compress(body) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        encode_seconds[0] += time.perf_counter() - start
+        bodies.append(body)
+        chars += len(json.loads(frame[len("data: "):])["content"])
+        written.append((time.perf_counter(), chars))
+    if compressor is not None:
+        bodies.append(compressor.flush(zlib.Z_FINISH))
+    writes = len(bodies)
+    # Mỗi lần ghi của chunked transfer-encoding thêm "<size hex>\r\n" ... "\r\n"
+    wire_bytes = sum(len(body) + len(f"{len(body):x}") + 4 for body in bodies)
+
+    # Độ trễ thêm của từng token: tới frame đầu tiên chứa hết token đó
+    delays, index, offset = [], 0, 0
+    for token, at in zip(tokens, emitted):
+        offset += len(token)
+        while written[index][1] < offset:
+            index += 1
+        delays.append((written[index][0] - at) * 1000)
+    return {"writes": writes, "bytes": wire_bytes, "encode_us": encode_seconds[0] * 1e6, "delays": delays}
+
+
+async def main(args):
+    tokens = split_tokens(DEFAULT_RESPONSE)
+    print(f"response {len(DEFAULT_RESPONSE)} ký tự, {len(tokens)} token, {args.tokens_per_second:.0f} token/s, "
+          f"max latency {args.max_latency_ms:.0f} ms")
+
+    cases = ("per-token json.dumps", "coalesced", "coalesced + gzip")
+    results = {name: [] for name in cases}
+    for _ in range(args.runs):
+        for name in cases:
+            results[name].append(await measure(name, tokens, args))
+
+    print(f"\n{'case':<24}{'writes':>10}{'wire bytes':>14}{'encode µs':>12}")
+    for name, runs in results.items():
+        print(f"{name:<24}{sum(r['writes'] for r in runs) / len(runs):>10.0f}"
+              f"{sum(r['bytes'] for r in runs) / len(runs):>14.0f}{sum(r['encode_us'] for r in runs) / len(runs):>12.0f}")
+    print_table("độ trễ thêm của token (sinh ra -> ghi)", {
+        name: summarize([delay for run in runs for delay in run["delays"]]) for name, runs in results.items()
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-latency-ms", type=float, default=50)
+    asyncio.run(main(parser.parse_args()))
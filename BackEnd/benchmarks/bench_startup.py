@@ -0,0 +1,75 @@
+"""
+Benchmark: thời gian khởi động (cold start) của ứng dụng
+
+Mỗi lần đo chạy một Python process mới (thư mục làm việc tạm, database riêng) và ghi lại:
+- import main: thời gian import ứng dụng (agent chưa được dựng)
+- first /requests: từ lúc bắt đầu tới khi route DB đầu tiên trả về 200
+- /ready: từ lúc bắt đầu tới khi agent warm-up xong (readiness 200)
+- eager agent: thời gian dựng agent nếu làm ngay khi import (chi phí cũ mỗi lần khởi động)
+
+Chạy: python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import BACKEND_DIR, summarize, print_table
+
+CHILD_SCRIPT = r"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, BACKEND_DIR)
+import main
+imported = time.perf_counter()
+heavy_loaded = "langgraph.prebuilt" in sys.modules or "langchain_openai" in sys.modules
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    assert client.get("/requests").status_code == 200
+    first_db = time.perf_counter()
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.01)
+    ready = time.perf_counter()
+    build_ms = client.get("/ready").json()["build_ms"]
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_db_ms": (first_db - start) * 1000,
+    "ready_ms": (ready - start) * 1000,
+    "agent_build_ms": build_ms,
+    "heavy_loaded_on_import": heavy_loaded,
+}))
+""".replace("BACKEND_DIR", repr(BACKEND_DIR))
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault("MODEL", "gpt-4o-mini")
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env["AGENT_WARMUP"] = "true"
+    with tempfile.TemporaryDirectory() as workdir:
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", CHILD_SCRIPT],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    results = [run_once() for _ in range(args.runs)]
+    rows = {
+        "import main": summarize([r["import_ms"] for r in results]),
+        "first /requests 200": summarize([r["first_db_ms"] for r in results]),
+        "/ready 200 (agent warmed)": summarize([r["ready_ms"] for r in results]),
+        "eager agent build": summarize([r["agent_build_ms"] for r in results]),
+    }
+    print(f"langgraph/langchain_openai loaded by import main: "
+          f"{any(r['heavy_loaded_on_import'] for r in results)}")
+    print_table(f"cold start ({args.runs} processes)", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    main(parser.parse_args())
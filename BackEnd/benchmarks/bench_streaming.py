@@ -0,0 +1,75 @@
+"""
+Benchmark: time-to-first-byte và tổng thời gian stream của /agent-testcase
+
+So sánh AGENT_STREAM_MODE="updates" (hành vi cũ: chờ trọn message, chia 50 ký tự,
+sleep 0.05s) với "messages" (forward token ngay khi model sinh ra), dùng fake model
+có first-token latency và token rate cố định.
+
+Chạy: python benchmarks/bench_streaming.py [--runs 3] [--tokens-per-second 200]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from common import summarize, print_table
+from fake_llm import FakeStreamingChatModel
+
+from langgraph.prebuilt import create_react_agent
+from langgraph.checkpoint.memory import MemorySaver
+
+import agent as agent_module
+from Service.chat_service import ChatService
+
+
+async def measure_once() -> tuple:
+    """Chạy một stream, trả về (ttfb_ms, total_ms, response_chars)"""
+    start = time.perf_counter()
+    ttfb = None
+    chars = 0
+    async for frame in ChatService.process_agent_testcase_stream(
+        conversation_id=None,
+        title="Màn hình đăng nhập",
+        pbi_requirement="Người dùng đăng nhập bằng email và mật khẩu",
+        bypass_cache=True
+    ):
+        data = json.loads(frame[len("data: "):])
+        if data["type"] == "chunk":
+            if ttfb is None:
+                ttfb = (time.perf_counter() - start) * 1000
+            chars += len(data["content"])
+        elif data["type"] == "error":
+            raise RuntimeError(data["message"])
+    return ttfb or 0.0, (time.perf_counter() - start) * 1000, chars
+
+
+async def main(args):
+    model = FakeStreamingChatModel(
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second
+    )
+    agent_module.set_agent(create_react_agent(model=model, tools=[], checkpointer=MemorySaver()))
+
+    ttfb_rows, total_rows = {}, {}
+    for mode in ("updates", "messages"):
+        ChatService.stream_mode = mode
+        ttfbs, totals = [], []
+        for _ in range(args.runs):
+            ttfb, total, chars = await measure_once()
+            ttfbs.append(ttfb)
+            totals.append(total)
+        ttfb_rows[mode] = summarize(ttfbs)
+        total_rows[mode] = summarize(totals)
+
+    print(f"response: {chars} chars, first token after {args.first_token_latency * 1000:.0f} ms, "
+          f"{args.tokens_per_second:.0f} tokens/s")
+    print_table("time to first chunk", ttfb_rows)
+    print_table("total stream time", total_rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""
+Benchmark: liệt kê/đếm testcase của một request
+
+So sánh cách cũ (đọc toàn bộ messages của conversation rồi parse lại markdown) với truy vấn
+bảng testcases/testcase_steps qua index; kèm chi phí parse tăng dần trên luồng token.
+
+Chạy: python benchmarks/bench_testcases.py [--conversations 500] [--turns 4] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import summarize, print_table
+from fake_llm import DEFAULT_RESPONSE, split_tokens
+
+from database import MAX_PAGE_SIZE, DatabaseManager
+from Service.testcase_parser import TestcaseStreamParser
+
+
+def populate(db: DatabaseManager, conversations: int, turns: int) -> list:
+    """Mỗi conversation có `turns` lượt user/assistant, response assistant gồm 40 testcase"""
+    start = time.perf_counter()
+    testcases = TestcaseStreamParser.parse(DEFAULT_RESPONSE)
+    ids = [db.create_request(f"Request {i}", "Đăng nhập")["conversation_id"] for i in range(conversations)]
+    for _ in range(turns):
+        for conversation_id in ids:
+            db.add_message(conversation_id, "user", "Yêu cầu " * 50)
+            db.add_message(conversation_id, "assistant", DEFAULT_RESPONSE, testcases)
+    print(f"populated {conversations} conversations x {turns} turns ({len(testcases)} testcases/response) "
+          f"in {time.perf_counter() - start:.1f}s")
+    return ids
+
+
+def timed(func, ids: list, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        conversation_id = random.choice(ids)
+        start = time.perf_counter()
+        func(conversation_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def reparse(db: DatabaseManager, conversation_id: str) -> list:
+    testcases, cursor = [], None
+    while True:
+        page = db.get_messages_page(conversation_id, MAX_PAGE_SIZE, cursor)
+        for message in page["items"]:
+            if message["role"] == "assistant":
+                testcases.extend(TestcaseStreamParser.parse(message["content"]))
+        cursor = page["next_cursor"]
+        if not cursor:
+            return testcases
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "bench.db"))
+        ids = populate(db, args.conversations, args.turns)
+
+        rows = {
+            "count: re-parse messages": summarize(timed(lambda c: len(reparse(db, c)), ids, args.repeat)),
+            "count: indexed query": summarize(timed(db.count_testcases, ids, args.repeat)),
+            "list: re-parse messages": summarize(timed(lambda c: reparse(db, c)[:50], ids, args.repeat)),
+            "list: first page (50)": summarize(timed(lambda c: db.get_testcases_page(c, 50), ids, args.repeat)),
+        }
+        print_table(f"testcases of one request ({args.repeat} random conversations)", rows)
+
+        with db.get_connection() as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM testcases WHERE conversation_id = ?", (ids[0],)
+            ).fetchall()
+        print("\ncount plan:", " | ".join(row["detail"] for row in plan))
+
+    tokens = split_tokens(DEFAULT_RESPONSE)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        parser = TestcaseStreamParser()
+        for token in tokens:
+            parser.feed(token)
+        parser.finish()
+    per_token = (time.perf_counter() - start) / (args.repeat * len(tokens))
+    print(f"incremental parse: {per_token * 1e6:.2f} µs/token ({len(tokens)} tokens/response)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=50)
+    main(parser.parse_args())
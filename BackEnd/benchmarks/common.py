@@ -0,0 +1,58 @@
+"""
+Tiện ích dùng chung cho các benchmark script
+"""
+import atexit
+import os
+import shutil
+import sys
+import math
+import tempfile
+from typing import Dict, List
+
+# Cho phép chạy benchmark trực tiếp: python benchmarks/<script>.py
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Các module của app tạo database/checkpoint/trace theo đường dẫn tương đối ngay khi import:
+# chạy benchmark trong thư mục làm việc tạm để không ghi file nào vào repo
+INVOCATION_DIR = os.getcwd()
+WORK_DIR = tempfile.mkdtemp(prefix="bench_")
+os.chdir(WORK_DIR)
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+
+
+def invocation_path(path: str) -> str:
+    """Đường dẫn tham số dòng lệnh, tính theo thư mục chạy benchmark (không phải WORK_DIR)"""
+    return os.path.join(INVOCATION_DIR, path)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Tính percentile (nearest-rank) của danh sách giá trị"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Tóm tắt p50/p95/p99/max của một phân phối latency (đơn vị giữ nguyên)"""
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]], unit: str = "ms"):
+    """In bảng kết quả dạng text"""
+    print(f"\n== {title} ==")
+    print(f"{'case':<32}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  ({unit})")
+    for name, stats in rows.items():
+        print(
+            f"{name:<32}{stats['count']:>8}{stats['p50']:>10.2f}{stats['p95']:>10.2f}"
+            f"{stats['p99']:>10.2f}{stats['max']:>10.2f}"
+        )
@@ -0,0 +1,94 @@
+"""
+Fake chat model deterministic cho benchmark (không gọi OpenAI)
+
+FakeStreamingChatModel trả về một đoạn text cố định, phát từng token với
+độ trễ token đầu và tốc độ token cấu hình được, để đo hành vi streaming
+của ChatService mà không tốn chi phí LLM thật.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_RESPONSE = "\n".join(
+    f"### Testcase {i}: Kiểm tra chức năng đăng nhập trường hợp {i}\n"
+    f"- Bước 1: Nhập thông tin hợp lệ -> Kết quả mong đợi: hệ thống chấp nhận\n"
+    f"- Bước 2: Nhấn nút Đăng nhập -> Kết quả mong đợi: chuyển tới trang chủ"
+    for i in range(1, 41)
+)
+
+
+def split_tokens(text: str) -> List[str]:
+    """Tách text thành các "token" giả (từ kèm khoảng trắng phía sau)"""
+    tokens, current = [], ""
+    for ch in text:
+        current += ch
+        if ch.isspace():
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Chat model giả lập streaming với first-token latency và token rate cấu hình được"""
+
+    response_text: str = DEFAULT_RESPONSE
+    first_token_latency: float = 0.2  # giây
+    tokens_per_second: float = 200.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeStreamingChatModel":
+        # Fake model không bao giờ gọi tool
+        return self
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = split_tokens(self.response_text)
+        time.sleep(self.first_token_latency + self._token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response_text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in split_tokens(self.response_text):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+            time.sleep(self._token_delay())
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for token in split_tokens(self.response_text):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(self._token_delay())
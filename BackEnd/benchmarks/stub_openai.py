@@ -0,0 +1,103 @@
+"""
+Stub server tương thích OpenAI Chat Completions (streaming) cho benchmark
+
+Chạy local bằng aiohttp, trả về một câu trả lời cố định theo từng token và đếm số
+request cùng số connection TCP phía server, để kiểm tra client có dùng lại connection.
+"""
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+
+class StubOpenAIServer:
+    """OpenAI-compatible server: POST /v1/chat/completions (stream hoặc không)"""
+
+    def __init__(
+        self,
+        response_text: str = "Testcase 1: Đăng nhập thành công với email và mật khẩu hợp lệ.",
+        first_token_latency: float = 0.02,
+        tokens_per_second: float = 2000.0,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.response_text = response_text
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.host = host
+        self.port = port
+        self.requests = 0
+        # Giữ transport của mỗi connection để đếm số connection khác nhau
+        self._transports: set = set()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def connections(self) -> int:
+        return len(self._transports)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def reset(self):
+        self.requests = 0
+        self._transports = set()
+
+    @staticmethod
+    def _chunk(model: str, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> bytes:
+        data = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    async def _completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        self._transports.add(request.transport)
+        body = await request.json()
+        model = body.get("model", "stub")
+        await asyncio.sleep(self.first_token_latency)
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.response_text},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        await response.write(self._chunk(model, {"role": "assistant", "content": ""}))
+        for token in self.response_text.split(" "):
+            await response.write(self._chunk(model, {"content": token + " "}))
+            await asyncio.sleep(delay)
+        await response.write(self._chunk(model, {}, finish_reason="stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._completions)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
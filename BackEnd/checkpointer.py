@@ -0,0 +1,608 @@
+"""
+Checkpointer cho LangGraph agent: SQLite bền vững + LRU hot tier trong bộ nhớ
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from database import CHECKPOINT_DB_PATH, SQLiteConnectionManager
+
+# Số thread tối đa giữ trong hot tier và thời gian sống (giây) kể từ lần truy cập cuối
+CHECKPOINT_CACHE_SIZE = int(os.getenv("CHECKPOINT_CACHE_SIZE", "256"))
+CHECKPOINT_CACHE_TTL = float(os.getenv("CHECKPOINT_CACHE_TTL", "1800"))
+# Thread tạm (không có conversation_id) chỉ sống trong bộ nhớ với TTL ngắn hơn
+CHECKPOINT_TEMP_PREFIX = os.getenv("CHECKPOINT_TEMP_PREFIX", "temp_")
+CHECKPOINT_TEMP_TTL = float(os.getenv("CHECKPOINT_TEMP_TTL", "600"))
+# Số checkpoint giữ lại trên disk cho mỗi thread/namespace
+CHECKPOINT_KEEP_PER_THREAD = int(os.getenv("CHECKPOINT_KEEP_PER_THREAD", "10"))
+
+# Một checkpoint đã serialize:
+# (checkpoint_id, checkpoint typed, metadata typed, parent_checkpoint_id, writes)
+# writes: (task_id, idx) -> (task_id, channel, value typed, task_path)
+_SerializedCheckpoint = Tuple[str, Tuple[str, bytes], Tuple[str, bytes], Optional[str], Dict[Tuple[str, int], tuple]]
+
+
+class _HotThread:
+    """Checkpoint mới nhất (theo namespace) của một thread trong hot tier"""
+
+    __slots__ = ("latest", "last_access", "temporary", "pins", "verified")
+
+    def __init__(self, temporary: bool):
+        self.latest: Dict[str, _SerializedCheckpoint] = {}
+        self.last_access = time.monotonic()
+        self.temporary = temporary
+        # Số lần chạy agent đang dùng thread: thread đang được pin không bị evict
+        self.pins = 0
+        # (namespace, id connection) -> PRAGMA data_version của connection tại lần cuối biết chắc
+        # latest[namespace] khớp với SQLite
+        self.verified: Dict[Tuple[str, int], int] = {}
+
+
+class SQLiteTieredSaver(BaseCheckpointSaver[str]):
+    """
+    Checkpoint saver 2 tầng
+
+    - Cold tier: bảng agent_checkpoints / agent_checkpoint_writes trong SQLite,
+      dùng chung được giữa nhiều uvicorn worker và sống qua restart.
+    - Hot tier: LRU các thread gần đây (chỉ checkpoint mới nhất, dạng đã serialize),
+      giới hạn bởi số thread và TTL. Thread bị evict được nạp lại từ SQLite khi cần.
+
+    Thread có prefix CHECKPOINT_TEMP_PREFIX chỉ tồn tại trong hot tier và bị xóa
+    hẳn khi hết TTL hoặc bị evict. Thread đang có agent chạy (pinned) không bị evict.
+
+    Hot tier của thread bền vững được dùng khi không connection nào khác (worker khác,
+    DatabaseManager) commit vào file từ lần cuối hot tier được xác nhận khớp với SQLite,
+    kiểm tra qua PRAGMA data_version (không đọc bảng); chỉ khi có commit khác mới so
+    checkpoint mới nhất trên disk.
+    """
+
+    def __init__(
+        self,
+        db_path: str = CHECKPOINT_DB_PATH,
+        *,
+        max_threads: int = CHECKPOINT_CACHE_SIZE,
+        ttl_seconds: float = CHECKPOINT_CACHE_TTL,
+        temp_prefix: str = CHECKPOINT_TEMP_PREFIX,
+        temp_ttl_seconds: float = CHECKPOINT_TEMP_TTL,
+        keep_per_thread: int = CHECKPOINT_KEEP_PER_THREAD,
+        serde: Optional[SerializerProtocol] = None
+    ):
+        super().__init__(serde=serde)
+        self.max_threads = max(1, max_threads)
+        self.ttl_seconds = ttl_seconds
+        self.temp_prefix = temp_prefix
+        self.temp_ttl_seconds = temp_ttl_seconds
+        self.keep_per_thread = max(1, keep_per_thread)
+        self.connections = SQLiteConnectionManager(db_path)
+        self._hot: "OrderedDict[str, _HotThread]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="checkpoint")
+        self.stats = {"hot_hits": 0, "cold_loads": 0, "evictions": 0, "disk_checks": 0}
+        self._init_tables()
+
+    # ------------------------------------------------------------------ #
+    # SQLite
+    # ------------------------------------------------------------------ #
+    def _init_tables(self):
+        """Tạo bảng lưu checkpoint nếu chưa có"""
+        conn = self.connections.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS agent_checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS agent_checkpoint_writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                )
+            """)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _is_temporary(self, thread_id: str) -> bool:
+        return bool(self.temp_prefix) and str(thread_id).startswith(self.temp_prefix)
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> Dict[Tuple[str, int], tuple]:
+        rows = self.connections.get().execute("""
+            SELECT task_id, idx, channel, type, value, task_path
+            FROM agent_checkpoint_writes
+            WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+            ORDER BY task_id, idx
+        """, (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        return {
+            (row["task_id"], row["idx"]): (row["task_id"], row["channel"], (row["type"], row["value"]), row["task_path"])
+            for row in rows
+        }
+
+    def _row_to_serialized(self, row) -> _SerializedCheckpoint:
+        return (
+            row["checkpoint_id"],
+            (row["type"], row["checkpoint"]),
+            (row["metadata_type"], row["metadata"]),
+            row["parent_checkpoint_id"],
+            self._load_writes(row["thread_id"], row["checkpoint_ns"], row["checkpoint_id"]),
+        )
+
+    def _latest_marker(self, thread_id: str, checkpoint_ns: str) -> Optional[Tuple[str, int]]:
+        """(checkpoint_id mới nhất, số pending writes) trên disk, dùng để kiểm tra hot tier còn đúng"""
+        row = self.connections.get().execute("""
+            SELECT c.checkpoint_id, (
+                SELECT COUNT(*) FROM agent_checkpoint_writes w
+                WHERE w.thread_id = c.thread_id
+                  AND w.checkpoint_ns = c.checkpoint_ns
+                  AND w.checkpoint_id = c.checkpoint_id
+            ) AS writes
+            FROM agent_checkpoints c
+            WHERE c.thread_id = ? AND c.checkpoint_ns = ?
+            ORDER BY c.checkpoint_id DESC
+            LIMIT 1
+        """, (thread_id, checkpoint_ns)).fetchone()
+        return (row["checkpoint_id"], row["writes"]) if row else None
+
+    @staticmethod
+    def _data_version(conn) -> int:
+        """Bộ đếm của SQLite, đổi khi connection khác commit vào file (connection này commit thì không đổi)"""
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _mark_verified(self, thread_id: str, checkpoint_ns: str, conn, version: int):
+        """Ghi nhận hot tier của thread khớp với SQLite tại data_version này của conn"""
+        with self._lock:
+            entry = self._hot.get(thread_id)
+            if entry is not None:
+                entry.verified[(checkpoint_ns, id(conn))] = version
+
+    def _is_current(self, entry: _HotThread, thread_id: str, checkpoint_ns: str, saved: _SerializedCheckpoint) -> bool:
+        """Checkpoint trong hot tier vẫn là checkpoint mới nhất trên disk (worker khác chưa ghi mới hơn)"""
+        conn = self.connections.get()
+        version = self._data_version(conn)
+        if entry.verified.get((checkpoint_ns, id(conn))) == version:
+            return True
+        self.stats["disk_checks"] += 1
+        if self._latest_marker(thread_id, checkpoint_ns) != (saved[0], len(saved[4])):
+            return False
+        with self._lock:
+            entry.verified[(checkpoint_ns, id(conn))] = version
+        return True
+
+    # ------------------------------------------------------------------ #
+    # Hot tier
+    # ------------------------------------------------------------------ #
+    def _evict_expired(self):
+        """Loại các thread hết TTL hoặc vượt quá giới hạn LRU (gọi khi đang giữ lock)"""
+        now = time.monotonic()
+        for thread_id in list(self._hot.keys()):
+            entry = self._hot[thread_id]
+            ttl = self.temp_ttl_seconds if entry.temporary else self.ttl_seconds
+            if not entry.pins and now - entry.last_access > ttl:
+                del self._hot[thread_id]
+                self.stats["evictions"] += 1
+        # Thread đang được pin bị bỏ qua: hot tier có thể tạm vượt max_threads
+        overflow = len(self._hot) - self.max_threads
+        if overflow > 0:
+            for thread_id in [tid for tid, entry in self._hot.items() if not entry.pins][:overflow]:
+                del self._hot[thread_id]
+                self.stats["evictions"] += 1
+
+    def _hot_get(self, thread_id: str) -> Optional[_HotThread]:
+        with self._lock:
+            self._evict_expired()
+            entry = self._hot.get(thread_id)
+            if entry is not None:
+                entry.last_access = time.monotonic()
+                self._hot.move_to_end(thread_id)
+            return entry
+
+    def _hot_set(self, thread_id: str, checkpoint_ns: str, saved: _SerializedCheckpoint):
+        with self._lock:
+            entry = self._hot.get(thread_id)
+            if entry is None:
+                entry = _HotThread(temporary=self._is_temporary(thread_id))
+                self._hot[thread_id] = entry
+            entry.latest[checkpoint_ns] = saved
+            entry.last_access = time.monotonic()
+            self._hot.move_to_end(thread_id)
+            self._evict_expired()
+
+    @contextmanager
+    def pinned(self, thread_id: str):
+        """Giữ thread trong hot tier (không bị evict theo TTL/LRU) trong suốt một lần chạy agent"""
+        with self._lock:
+            entry = self._hot.get(thread_id)
+            if entry is None:
+                entry = _HotThread(temporary=self._is_temporary(thread_id))
+                self._hot[thread_id] = entry
+            entry.pins += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                entry.pins -= 1
+                entry.last_access = time.monotonic()
+
+    def evict(self, thread_id: str):
+        """Bỏ thread khỏi hot tier (ví dụ sau khi checkpoint của thread bị xóa trực tiếp trong SQLite)"""
+        with self._lock:
+            self._hot.pop(thread_id, None)
+
+    def hot_size(self) -> int:
+        """Số thread đang nằm trong hot tier"""
+        with self._lock:
+            return len(self._hot)
+
+    # ------------------------------------------------------------------ #
+    # Chuyển đổi
+    # ------------------------------------------------------------------ #
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, saved: _SerializedCheckpoint) -> CheckpointTuple:
+        checkpoint_id, checkpoint, metadata, parent_checkpoint_id, writes = saved
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed(checkpoint),
+            metadata=self.serde.loads_typed(metadata),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed(value))
+                for task_id, channel, value, _ in writes.values()
+            ],
+        )
+
+    # ------------------------------------------------------------------ #
+    # BaseCheckpointSaver API
+    # ------------------------------------------------------------------ #
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Lấy checkpoint (mới nhất hoặc theo checkpoint_id), ưu tiên hot tier"""
+        thread_id: str = config["configurable"]["thread_id"]
+        checkpoint_ns: str = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        temporary = self._is_temporary(thread_id)
+
+        entry = self._hot_get(thread_id)
+        saved = entry.latest.get(checkpoint_ns) if entry else None
+        if saved is not None and (checkpoint_id is None or checkpoint_id == saved[0]):
+            # Thread bền vững: chỉ dùng hot tier nếu worker khác chưa ghi checkpoint mới hơn
+            if temporary or self._is_current(entry, thread_id, checkpoint_ns, saved):
+                self.stats["hot_hits"] += 1
+                return self._to_tuple(thread_id, checkpoint_ns, saved)
+        if temporary:
+            return None
+
+        conn = self.connections.get()
+        # Đọc trước khi đọc bảng: commit xen giữa sẽ làm lần kiểm tra sau đọc lại disk
+        version = self._data_version(conn)
+        if checkpoint_id:
+            row = conn.execute("""
+                SELECT * FROM agent_checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+            """, (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+        else:
+            row = conn.execute("""
+                SELECT * FROM agent_checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ?
+                ORDER BY checkpoint_id DESC
+                LIMIT 1
+            """, (thread_id, checkpoint_ns)).fetchone()
+        if row is None:
+            return None
+
+        self.stats["cold_loads"] += 1
+        saved = self._row_to_serialized(row)
+        if checkpoint_id is None:
+            # Rehydrate thread vào hot tier
+            self._hot_set(thread_id, checkpoint_ns, saved)
+            self._mark_verified(thread_id, checkpoint_ns, conn, version)
+        return self._to_tuple(thread_id, checkpoint_ns, saved)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """Liệt kê checkpoint (mới trước) theo thread/namespace, metadata filter và before"""
+        candidates: List[Tuple[str, str, _SerializedCheckpoint]] = []
+        thread_id = config["configurable"]["thread_id"] if config else None
+        config_ns = config["configurable"].get("checkpoint_ns") if config else None
+
+        if thread_id is None or not self._is_temporary(thread_id):
+            query = "SELECT * FROM agent_checkpoints"
+            clauses, params = [], []
+            if thread_id is not None:
+                clauses.append("thread_id = ?")
+                params.append(thread_id)
+            if config_ns is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config_ns)
+            if config and (config_checkpoint_id := get_checkpoint_id(config)):
+                clauses.append("checkpoint_id = ?")
+                params.append(config_checkpoint_id)
+            if before and (before_checkpoint_id := get_checkpoint_id(before)):
+                clauses.append("checkpoint_id < ?")
+                params.append(before_checkpoint_id)
+            if clauses:
+                query += " WHERE " + " AND ".join(clauses)
+            query += " ORDER BY checkpoint_id DESC"
+            for row in self.connections.get().execute(query, params).fetchall():
+                candidates.append((row["thread_id"], row["checkpoint_ns"], self._row_to_serialized(row)))
+
+        # Thread tạm chỉ có checkpoint mới nhất trong hot tier
+        with self._lock:
+            hot_items = [
+                (tid, ns, saved)
+                for tid, entry in self._hot.items() if entry.temporary and (thread_id is None or tid == thread_id)
+                for ns, saved in entry.latest.items() if config_ns is None or ns == config_ns
+            ]
+        candidates.extend(hot_items)
+
+        for tid, ns, saved in candidates:
+            if limit is not None and limit <= 0:
+                break
+            item = self._to_tuple(tid, ns, saved)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Lưu checkpoint vào SQLite (trừ thread tạm) và cập nhật hot tier"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        checkpoint_typed = self.serde.dumps_typed(checkpoint)
+        metadata_typed = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        conn, version = None, None
+        if not self._is_temporary(thread_id):
+            conn = self.connections.get()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Trong transaction ghi: không connection nào commit được trước khi transaction này xong
+                version = self._data_version(conn)
+                conn.execute("""
+                    INSERT OR REPLACE INTO agent_checkpoints
+                    (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id,
+                    checkpoint_typed[0], checkpoint_typed[1], metadata_typed[0], metadata_typed[1]
+                ))
+                # Chỉ giữ lại keep_per_thread checkpoint mới nhất
+                conn.execute("""
+                    DELETE FROM agent_checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN (
+                        SELECT checkpoint_id FROM agent_checkpoints
+                        WHERE thread_id = ? AND checkpoint_ns = ?
+                        ORDER BY checkpoint_id DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                """, (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_per_thread))
+                conn.execute("""
+                    DELETE FROM agent_checkpoint_writes
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                        SELECT checkpoint_id FROM agent_checkpoints
+                        WHERE thread_id = ? AND checkpoint_ns = ?
+                    )
+                """, (thread_id, checkpoint_ns, thread_id, checkpoint_ns))
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+        self._hot_set(
+            thread_id,
+            checkpoint_ns,
+            (checkpoint["id"], checkpoint_typed, metadata_typed, parent_checkpoint_id, {})
+        )
+        if conn is not None:
+            self._mark_verified(thread_id, checkpoint_ns, conn, version)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """
+        Lưu pending writes của một task gắn với checkpoint
+
+        Raises:
+            RuntimeError: Thread tạm không còn checkpoint này trong bộ nhớ (không có disk để ghi thay)
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        temporary = self._is_temporary(thread_id)
+
+        entry = self._hot_get(thread_id)
+        saved = entry.latest.get(checkpoint_ns) if entry else None
+        hot_writes = saved[4] if saved is not None and saved[0] == checkpoint_id else None
+        if temporary and hot_writes is None:
+            raise RuntimeError(f"Checkpoint {checkpoint_id} của thread tạm {thread_id} không còn trong bộ nhớ")
+
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            inner_key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+            # Write thường (idx >= 0) không ghi đè; write đặc biệt (idx < 0) thì ghi đè
+            if inner_key[1] >= 0 and hot_writes is not None and inner_key in hot_writes:
+                continue
+            value_typed = self.serde.dumps_typed(value)
+            if hot_writes is not None:
+                hot_writes[inner_key] = (task_id, channel, value_typed, task_path)
+            rows.append((
+                thread_id, checkpoint_ns, checkpoint_id, task_id, inner_key[1],
+                channel, value_typed[0], value_typed[1], task_path
+            ))
+
+        if rows and not temporary:
+            conn = self.connections.get()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._data_version(conn)
+                for row in rows:
+                    verb = "INSERT OR REPLACE" if row[4] < 0 else "INSERT OR IGNORE"
+                    conn.execute(f"""
+                        {verb} INTO agent_checkpoint_writes
+                        (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, row)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            if hot_writes is not None:
+                self._mark_verified(thread_id, checkpoint_ns, conn, version)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Xóa toàn bộ checkpoint và writes của một thread"""
+        self.evict(thread_id)
+        if self._is_temporary(thread_id):
+            return
+        conn = self.connections.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM agent_checkpoints WHERE thread_id = ?", (thread_id,))
+            conn.execute("DELETE FROM agent_checkpoint_writes WHERE thread_id = ?", (thread_id,))
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    # ------------------------------------------------------------------ #
+    # Async API: chạy phần SQLite trên executor riêng để không block event loop
+    # ------------------------------------------------------------------ #
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        if self._is_temporary(thread_id):
+            # Thread tạm chỉ nằm trong bộ nhớ, không cần chuyển sang executor
+            return self.get_tuple(config)
+        return await self._run(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await self._run(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        if self._is_temporary(config["configurable"]["thread_id"]):
+            return self.put(config, checkpoint, metadata, new_versions)
+        return await self._run(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if self._is_temporary(config["configurable"]["thread_id"]):
+            return self.put_writes(config, writes, task_id, task_path)
+        return await self._run(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await self._run(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        next_v = current_v + 1
+        next_h = random.random()
+        return f"{next_v:032}.{next_h:016}"
+
+    def close(self):
+        """Dừng executor và đóng các connection SQLite"""
+        self._executor.shutdown(wait=True)
+        self.connections.close_all()
@@ -2,22 +2,206 @@
 Database setup và models cho SQLite
 """
 
+import asyncio
+import base64
+import functools
+import heapq
+import html
+import itertools
+import json
+import os
+import re
 import sqlite3
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from contextlib import contextmanager
 
+from metrics import DB_OPERATION_DURATION, DB_OPERATION_ERRORS
+from similarity import minhasher, SIMILARITY_THRESHOLD, SIMILARITY_MAX_CANDIDATES
+
+# Số worker thread của async layer (mỗi thread giữ một connection lâu dài)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# Page cache cho mỗi connection (KiB) và thời gian chờ khi database đang bị lock (ms)
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# File SQLite chứa checkpoint của agent (mặc định dùng chung database của ứng dụng)
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "testcase_agent.db")
+# Bảng checkpoint do SQLiteTieredSaver tạo (khi agent được dựng lần đầu)
+CHECKPOINT_TABLES = ("agent_checkpoints", "agent_checkpoint_writes")
+# Giới hạn số dòng mỗi trang cho keyset pagination
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Tokenizer FTS5: tách từ Unicode, bỏ dấu (tìm "dang nhap" khớp "đăng nhập")
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+# Ký hiệu đánh dấu từ khớp trong kết quả tìm kiếm
+SEARCH_HIGHLIGHT = ("<mark>", "</mark>")
+# FTS5 đánh dấu từ khớp bằng ký tự điều khiển; text được HTML-escape rồi mới thay bằng SEARCH_HIGHLIGHT
+_HIGHLIGHT_SENTINELS = ("\x02", "\x03")
+# BM25 phải duyệt toàn bộ danh sách khớp (IDF); truy vấn khớp nhiều hơn ngưỡng này được xếp theo thời gian
+SEARCH_RANK_MAX_HITS = int(os.getenv("SEARCH_RANK_MAX_HITS", "2000"))
+_SEARCH_TERM_RE = re.compile(r'"([^"]+)"|(\w+)(\*?)', re.UNICODE)
+
+
+def _fts_fold(expr: str) -> str:
+    """
+    Biểu thức SQL chuẩn hoá text trước khi index FTS
+
+    remove_diacritics của unicode61 không gộp "đ" vào "d"; thay 1 ký tự bằng 1 ký tự nên vị trí
+    token không đổi và highlight()/snippet() trên nội dung gốc vẫn đúng.
+    """
+    return f"replace(replace({expr}, 'đ', 'd'), 'Đ', 'D')"
+
+
+def render_highlight(text: Optional[str]) -> Optional[str]:
+    """HTML-escape nội dung gốc (do người dùng nhập) rồi thay ký tự đánh dấu của FTS5 bằng SEARCH_HIGHLIGHT"""
+    if text is None:
+        return None
+    text = html.escape(text, quote=True)
+    for sentinel, mark in zip(_HIGHLIGHT_SENTINELS, SEARCH_HIGHLIGHT):
+        text = text.replace(sentinel, mark)
+    return text
+
+
+def build_fts_query(query: str) -> str:
+    """
+    Chuyển chuỗi tìm kiếm của người dùng thành FTS5 MATCH expression an toàn
+
+    Các từ được AND với nhau; "cụm từ" trong ngoặc kép tìm theo cụm, từ kết thúc bằng * tìm theo tiền tố.
+
+    Raises:
+        ValueError: Nếu chuỗi tìm kiếm không có từ nào
+    """
+    folded = query.replace("đ", "d").replace("Đ", "D")
+    terms = []
+    for phrase, word, prefix in _SEARCH_TERM_RE.findall(folded):
+        if phrase:
+            words = re.findall(r"\w+", phrase, re.UNICODE)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+        else:
+            terms.append(f'"{word}"' + prefix)
+    if not terms:
+        raise ValueError("Chuỗi tìm kiếm không hợp lệ")
+    return " ".join(terms)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Mã hóa sort key của dòng cuối trang thành cursor dạng base64url"""
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Giải mã cursor thành sort key
+    
+    Raises:
+        ValueError: Nếu cursor không hợp lệ
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Cursor không hợp lệ")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Cursor không hợp lệ")
+    return values
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    """Chuẩn hóa limit về khoảng [1, MAX_PAGE_SIZE]"""
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+class SQLiteConnectionManager:
+    """
+    Quản lý sqlite3 connection lâu dài theo từng thread
+    
+    Mỗi thread mở một connection duy nhất và dùng lại cho mọi lần gọi sau.
+    Connection chạy ở autocommit mode (isolation_level=None); transaction được
+    mở tường minh qua DatabaseManager.transaction().
+    """
+    
+    def __init__(
+        self,
+        db_path: str,
+        cache_size_kb: int = DB_CACHE_SIZE_KB,
+        busy_timeout_ms: int = DB_BUSY_TIMEOUT_MS
+    ):
+        self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Mở connection mới và áp dụng các PRAGMA tuning"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row  # Để có thể access columns by name
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+    
+    def get(self) -> sqlite3.Connection:
+        """Lấy connection của thread hiện tại, mở mới nếu chưa có"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def close_all(self):
+        """Đóng tất cả connection đã mở"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        # Thread nào gọi lại get() sau khi đóng sẽ mở connection mới
+        self._local = threading.local()
+
+
 class DatabaseManager:
     """Manager class để xử lý SQLite database"""
     
-    def __init__(self, db_path: str = "testcase_agent.db"):
+    def __init__(
+        self,
+        db_path: str = "testcase_agent.db",
+        pool_size: int = DB_POOL_SIZE,
+        checkpoint_db_path: Optional[str] = None
+    ):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.connections = SQLiteConnectionManager(db_path)
+        # Checkpoint của agent nằm chung file (mặc định) hoặc ở file riêng
+        if checkpoint_db_path is None or os.path.abspath(checkpoint_db_path) == os.path.abspath(db_path):
+            self.checkpoint_connections = self.connections
+        else:
+            self.checkpoint_connections = SQLiteConnectionManager(checkpoint_db_path)
         self.init_database()
     
     def init_database(self):
         """Khởi tạo database và tạo tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.transaction() as conn:
             cursor = conn.cursor()
             
             # Tạo table requests
@@ -44,57 +228,290 @@ class DatabaseManager:
                 )
             """)
             
-            # Tạo index cho performance
+            # Index cho keyset pagination: danh sách requests sắp xếp theo updated_at
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_conversation_id 
-                ON messages (conversation_id)
+                CREATE INDEX IF NOT EXISTS idx_requests_updated_at_id 
+                ON requests (updated_at, id)
             """)
             
-            conn.commit()
+            # Index cho keyset pagination của messages trong một conversation.
+            # Prefix (conversation_id) thay thế luôn index đơn cột cũ.
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_conversation_created_id 
+                ON messages (conversation_id, created_at, id)
+            """)
+            cursor.execute("DROP INDEX IF EXISTS idx_conversation_id")
+            
+            # Tạo table response_cache (cache kết quả agent theo nội dung request)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_response_cache_last_access 
+                ON response_cache (last_access)
+            """)
+            
+            # Tạo table attachments (content-addressed theo SHA-256 của file upload gốc)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS attachments (
+                    attachment_id TEXT PRIMARY KEY,
+                    mime_type TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    original_size INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # Tạo table jobs (generation chạy nền, sống qua restart)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    conversation_id TEXT,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    heartbeat_at REAL,
+                    events TEXT
+                )
+            """)
+            # Database tạo trước khi có lease/event log: thêm cột owner/heartbeat_at/events
+            job_columns = {row[1] for row in cursor.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner", "TEXT"), ("heartbeat_at", "REAL"), ("events", "TEXT")):
+                if column not in job_columns:
+                    cursor.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_status_created 
+                ON jobs (status, created_at)
+            """)
+            
+            # Testcase đã tách từ response của agent (mỗi testcase gắn với message assistant chứa nó)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS testcases (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    ordinal INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (conversation_id) REFERENCES requests (conversation_id),
+                    FOREIGN KEY (message_id) REFERENCES messages (id)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS testcase_steps (
+                    testcase_id INTEGER NOT NULL,
+                    step_no INTEGER NOT NULL,
+                    action TEXT NOT NULL,
+                    expected_result TEXT NOT NULL,
+                    PRIMARY KEY (testcase_id, step_no),
+                    FOREIGN KEY (testcase_id) REFERENCES testcases (id)
+                ) WITHOUT ROWID
+            """)
+            # Liệt kê/đếm testcase của một conversation theo thứ tự tạo (keyset theo id)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_testcases_conversation_id 
+                ON testcases (conversation_id, id)
+            """)
+            
+            self._init_search_index(cursor)
+            self._init_similarity_index(cursor)
+    
+    def _init_search_index(self, cursor: sqlite3.Cursor):
+        """
+        Tạo index FTS5 (external content) cho requests và messages, giữ đồng bộ bằng trigger
+        
+        Database cũ được index lại một lần khi bảng FTS được tạo lần đầu.
+        """
+        for table, columns in (("requests", ("title", "pbi_requirement")), ("messages", ("content",))):
+            fts = f"{table}_fts"
+            exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+            ).fetchone()
+            column_list = ", ".join(columns)
+            new_values = ", ".join(_fts_fold(f"new.{column}") for column in columns)
+            old_values = ", ".join(_fts_fold(f"old.{column}") for column in columns)
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {column_list}, content='{table}', content_rowid='id', tokenize='{FTS_TOKENIZER}'
+                )
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                END
+            """)
+            # Chỉ khi nội dung được index thay đổi (không chạy khi touch updated_at)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                    INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+                END
+            """)
+            if not exists:
+                folded = ", ".join(_fts_fold(column) for column in columns)
+                cursor.execute(f"INSERT INTO {fts} (rowid, {column_list}) SELECT id, {folded} FROM {table}")
+    
+    def _init_similarity_index(self, cursor: sqlite3.Cursor):
+        """
+        Tạo index gần trùng cho pbi_requirement: MinHash signature của mỗi request và bảng LSH bucket
+        
+        Database cũ được index lại một lần khi bảng được tạo lần đầu.
+        """
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'request_signatures'"
+        ).fetchone()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS request_signatures (
+                request_id INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL,
+                buckets BLOB NOT NULL,
+                FOREIGN KEY (request_id) REFERENCES requests (id)
+            )
+        """)
+        # Mỗi request có một dòng cho mỗi band: tra ứng viên bằng các lần seek trên primary key
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS request_lsh (
+                bucket INTEGER NOT NULL,
+                request_id INTEGER NOT NULL,
+                PRIMARY KEY (bucket, request_id)
+            ) WITHOUT ROWID
+        """)
+        if not exists:
+            for row in cursor.execute("SELECT id, pbi_requirement FROM requests").fetchall():
+                self._index_similarity(cursor, row["id"], minhasher.sketch(row["pbi_requirement"]))
+    
+    @staticmethod
+    def _index_similarity(cursor: sqlite3.Cursor, request_id: int, sketch: Optional[Tuple[List[int], List[int]]]):
+        """Ghi signature và LSH bucket (minhasher.sketch) của một request, trong transaction của lệnh insert"""
+        if sketch is None:
+            return
+        signature, buckets = sketch
+        cursor.execute(
+            "INSERT OR REPLACE INTO request_signatures (request_id, signature, buckets) VALUES (?, ?, ?)",
+            (request_id, minhasher.pack(signature), minhasher.pack_buckets(buckets))
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO request_lsh (bucket, request_id) VALUES (?, ?)",
+            [(bucket, request_id) for bucket in buckets]
+        )
     
     @contextmanager
     def get_connection(self):
-        """Context manager để quản lý database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Để có thể access columns by name
+        """Context manager trả về connection lâu dài của thread hiện tại"""
+        conn = self.connections.get()
         try:
             yield conn
-        finally:
-            conn.close()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager chạy các câu lệnh trong một write transaction
+        
+        Dùng BEGIN IMMEDIATE để lấy write lock ngay từ đầu, tránh lỗi
+        "database is locked" khi nhiều connection cùng nâng cấp read lock lên write lock.
+        """
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
     
     def create_request(self, title: str, pbi_requirement: str) -> Dict[str, Any]:
         """Tạo request mới"""
         conversation_id = f"conv_{uuid.uuid4().hex[:12]}"
+        # Tính signature trước khi mở transaction để không giữ write lock trong lúc băm
+        sketch = minhasher.sketch(pbi_requirement)
         
-        with self.get_connection() as conn:
+        with self.transaction() as conn:
             cursor = conn.cursor()
+            # RETURNING trả về row vừa tạo, không cần SELECT lại
             cursor.execute("""
                 INSERT INTO requests (conversation_id, title, pbi_requirement)
                 VALUES (?, ?, ?)
+                RETURNING *
             """, (conversation_id, title, pbi_requirement))
             
-            request_id = cursor.lastrowid
-            conn.commit()
-            
-            # Lấy request vừa tạo
-            cursor.execute("""
-                SELECT * FROM requests WHERE id = ?
-            """, (request_id,))
-            
-            row = cursor.fetchone()
-            return dict(row) if row else None
+            rows = cursor.fetchall()
+            if rows:
+                self._index_similarity(cursor, rows[0]["id"], sketch)
+            return dict(rows[0]) if rows else None
     
-    def get_all_requests(self) -> List[Dict[str, Any]]:
-        """Lấy tất cả requests"""
-        with self.get_connection() as conn:
+    def create_requests(self, items: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Tạo nhiều request (title, pbi_requirement) trong một transaction, giữ nguyên thứ tự"""
+        created = []
+        sketches = [minhasher.sketch(pbi_requirement) for _, pbi_requirement in items]
+        with self.transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM requests 
-                ORDER BY updated_at DESC
-            """)
+            for (title, pbi_requirement), sketch in zip(items, sketches):
+                cursor.execute("""
+                    INSERT INTO requests (conversation_id, title, pbi_requirement)
+                    VALUES (?, ?, ?)
+                    RETURNING *
+                """, (f"conv_{uuid.uuid4().hex[:12]}", title, pbi_requirement))
+                created.append(dict(cursor.fetchall()[0]))
+                self._index_similarity(cursor, created[-1]["id"], sketch)
+        return created
+    
+    def get_requests_page(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Lấy một trang requests (mới cập nhật trước) bằng keyset pagination
+        
+        Args:
+            limit: Số dòng tối đa của trang
+            cursor: next_cursor của trang trước (None cho trang đầu)
             
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+        Returns:
+            Dict: {"items": [...], "next_cursor": str | None}
+        """
+        limit = clamp_page_size(limit)
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            if cursor:
+                updated_at, last_id = decode_cursor(cursor, 2)
+                db_cursor.execute("""
+                    SELECT * FROM requests 
+                    WHERE (updated_at, id) < (?, ?)
+                    ORDER BY updated_at DESC, id DESC
+                    LIMIT ?
+                """, (updated_at, last_id, limit + 1))
+            else:
+                db_cursor.execute("""
+                    SELECT * FROM requests 
+                    ORDER BY updated_at DESC, id DESC
+                    LIMIT ?
+                """, (limit + 1,))
+            
+            rows = [dict(row) for row in db_cursor.fetchall()]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
+        return {"items": rows, "next_cursor": next_cursor}
     
     def get_request_by_conversation_id(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Lấy request theo conversation_id"""
@@ -109,68 +526,899 @@ class DatabaseManager:
     
     def update_request_timestamp(self, conversation_id: str):
         """Cập nhật timestamp của request"""
-        with self.get_connection() as conn:
+        with self.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE requests 
                 SET updated_at = CURRENT_TIMESTAMP 
                 WHERE conversation_id = ?
             """, (conversation_id,))
-            conn.commit()
     
-    def add_message(self, conversation_id: str, role: str, content: str) -> Dict[str, Any]:
-        """Thêm message vào conversation"""
-        with self.get_connection() as conn:
+    def add_message(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        testcases: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Thêm message vào conversation (insert + touch request trong một transaction)
+        
+        Args:
+            testcases: Testcase tách từ nội dung message ({"ordinal", "title", "steps": [...]}),
+                được ghi cùng transaction
+        """
+        with self.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO messages (conversation_id, role, content)
                 VALUES (?, ?, ?)
+                RETURNING *
             """, (conversation_id, role, content))
+            rows = cursor.fetchall()
             
-            message_id = cursor.lastrowid
-            conn.commit()
+            for testcase in testcases or []:
+                cursor.execute("""
+                    INSERT INTO testcases (conversation_id, message_id, ordinal, title)
+                    VALUES (?, ?, ?, ?)
+                    RETURNING id
+                """, (conversation_id, rows[0]["id"], testcase["ordinal"], testcase["title"]))
+                testcase_id = cursor.fetchone()["id"]
+                cursor.executemany("""
+                    INSERT INTO testcase_steps (testcase_id, step_no, action, expected_result)
+                    VALUES (?, ?, ?, ?)
+                """, [
+                    (testcase_id, step["step_no"], step["action"], step["expected_result"])
+                    for step in testcase["steps"]
+                ])
             
             # Cập nhật timestamp của request
-            self.update_request_timestamp(conversation_id)
-            
-            # Lấy message vừa tạo
             cursor.execute("""
-                SELECT * FROM messages WHERE id = ?
-            """, (message_id,))
+                UPDATE requests 
+                SET updated_at = CURRENT_TIMESTAMP 
+                WHERE conversation_id = ?
+            """, (conversation_id,))
             
-            row = cursor.fetchone()
-            return dict(row) if row else None
+            return dict(rows[0]) if rows else None
+    
+    def get_messages_page(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Lấy một trang messages của conversation (cũ trước) bằng keyset pagination
+        
+        Returns:
+            Dict: {"items": [...], "next_cursor": str | None}
+        """
+        limit = clamp_page_size(limit)
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            if cursor:
+                created_at, last_id = decode_cursor(cursor, 2)
+                db_cursor.execute("""
+                    SELECT * FROM messages 
+                    WHERE conversation_id = ? AND (created_at, id) > (?, ?)
+                    ORDER BY created_at ASC, id ASC
+                    LIMIT ?
+                """, (conversation_id, created_at, last_id, limit + 1))
+            else:
+                db_cursor.execute("""
+                    SELECT * FROM messages 
+                    WHERE conversation_id = ? 
+                    ORDER BY created_at ASC, id ASC
+                    LIMIT ?
+                """, (conversation_id, limit + 1))
+            
+            rows = [dict(row) for row in db_cursor.fetchall()]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+        return {"items": rows, "next_cursor": next_cursor}
+    
+    def get_testcases_page(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Lấy một trang testcase của conversation (theo thứ tự tạo) kèm các bước, bằng keyset pagination
+        
+        Returns:
+            Dict: {"items": [...], "next_cursor": str | None}
+        """
+        limit = clamp_page_size(limit)
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            last_id = decode_cursor(cursor, 1)[0] if cursor else 0
+            db_cursor.execute("""
+                SELECT * FROM testcases 
+                WHERE conversation_id = ? AND id > ?
+                ORDER BY id ASC
+                LIMIT ?
+            """, (conversation_id, last_id, limit + 1))
+            rows = [dict(row) for row in db_cursor.fetchall()]
+            
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(rows[-1]["id"])
+            
+            self._attach_steps(db_cursor, rows)
+        
+        return {"items": rows, "next_cursor": next_cursor}
+    
+    @staticmethod
+    def _attach_steps(db_cursor: sqlite3.Cursor, rows: List[Dict[str, Any]]):
+        """Nạp các bước cho danh sách testcase trong một truy vấn (tra theo primary key)"""
+        if not rows:
+            return
+        placeholders = ",".join("?" * len(rows))
+        db_cursor.execute(f"""
+            SELECT * FROM testcase_steps 
+            WHERE testcase_id IN ({placeholders})
+            ORDER BY testcase_id, step_no
+        """, [row["id"] for row in rows])
+        steps: Dict[int, List[Dict[str, Any]]] = {}
+        for step in db_cursor.fetchall():
+            steps.setdefault(step["testcase_id"], []).append({
+                "step_no": step["step_no"],
+                "action": step["action"],
+                "expected_result": step["expected_result"]
+            })
+        for row in rows:
+            row["steps"] = steps.get(row["id"], [])
+    
+    def get_latest_testcases(self, conversation_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Testcase (kèm các bước) của response gần nhất có testcase trong conversation, theo ordinal"""
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.execute("""
+                SELECT * FROM testcases 
+                WHERE conversation_id = ? AND message_id = (
+                    SELECT MAX(message_id) FROM testcases WHERE conversation_id = ?
+                )
+                ORDER BY ordinal ASC
+                LIMIT ?
+            """, (conversation_id, conversation_id, clamp_page_size(limit)))
+            rows = [dict(row) for row in db_cursor.fetchall()]
+            self._attach_steps(db_cursor, rows)
+        return rows
     
-    def get_messages_by_conversation_id(self, conversation_id: str) -> List[Dict[str, Any]]:
-        """Lấy tất cả messages của một conversation"""
+    def count_testcases(self, conversation_id: str) -> int:
+        """Số testcase của conversation (đếm trên index, không đọc nội dung message)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT * FROM messages 
-                WHERE conversation_id = ? 
-                ORDER BY created_at ASC
+                SELECT COUNT(*) FROM testcases WHERE conversation_id = ?
             """, (conversation_id,))
+            return cursor.fetchone()[0]
+    
+    def find_similar_requests(
+        self,
+        pbi_requirement: str,
+        exclude_conversation_id: Optional[str] = None,
+        limit: int = 5,
+        threshold: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Tìm các request cũ có pbi_requirement gần trùng (MinHash/LSH)
+        
+        Ứng viên là các request trùng ít nhất một LSH bucket (mỗi band một lần seek trên index, không phụ
+        thuộc số request), tối đa SIMILARITY_MAX_CANDIDATES ứng viên trùng nhiều band nhất được so signature.
+        
+        Args:
+            pbi_requirement: Yêu cầu PBI cần so
+            exclude_conversation_id: Bỏ qua conversation này (thường là chính request đang xét)
+            limit: Số kết quả tối đa
+            threshold: Độ tương đồng tối thiểu (mặc định SIMILARITY_THRESHOLD)
             
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+        Returns:
+            List[Dict]: Request kèm similarity (Jaccard ước lượng trên shingle ký tự) và testcase_count,
+            similarity giảm dần
+        """
+        threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+        sketch = minhasher.sketch(pbi_requirement)
+        if sketch is None:
+            return []
+        signature, buckets = sketch
+        packed = minhasher.pack(signature)
+        
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.execute(f"""
+                SELECT request_id FROM request_lsh 
+                WHERE bucket IN ({",".join("?" * len(buckets))})
+                GROUP BY request_id
+                ORDER BY COUNT(*) DESC
+                LIMIT ?
+            """, (*buckets, SIMILARITY_MAX_CANDIDATES))
+            candidates = [row["request_id"] for row in db_cursor.fetchall()]
+            if not candidates:
+                return []
+            
+            db_cursor.execute(f"""
+                SELECT r.*, s.signature FROM request_signatures s
+                JOIN requests r ON r.id = s.request_id
+                WHERE s.request_id IN ({",".join("?" * len(candidates))})
+            """, candidates)
+            matches = []
+            for row in db_cursor.fetchall():
+                if row["conversation_id"] == exclude_conversation_id:
+                    continue
+                if row["signature"] == packed:
+                    similarity = 1.0
+                else:
+                    similarity = minhasher.similarity(signature, minhasher.unpack(row["signature"]))
+                if similarity >= threshold:
+                    match = dict(row)
+                    del match["signature"]
+                    match["similarity"] = round(similarity, 3)
+                    matches.append(match)
+            matches.sort(key=lambda match: (-match["similarity"], -match["id"]))
+            matches = matches[:limit]
+            
+            if matches:
+                db_cursor.execute(f"""
+                    SELECT conversation_id, COUNT(*) AS testcase_count FROM testcases 
+                    WHERE conversation_id IN ({",".join("?" * len(matches))})
+                    GROUP BY conversation_id
+                """, [match["conversation_id"] for match in matches])
+                counts = {row["conversation_id"]: row["testcase_count"] for row in db_cursor.fetchall()}
+                for match in matches:
+                    match["testcase_count"] = counts.get(match["conversation_id"], 0)
+        return matches
     
-    def delete_request(self, conversation_id: str) -> bool:
-        """Xóa request và tất cả messages liên quan"""
+    def search(
+        self,
+        query: str,
+        scope: str = "all",
+        conversation_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Tìm kiếm full-text trên requests (title, pbi_requirement) và messages
+        
+        Xếp hạng theo BM25 khi số kết quả khớp không vượt quá SEARCH_RANK_MAX_HITS. Với từ quá phổ biến
+        (chi phí BM25 tăng theo số dòng khớp), kết quả được xếp theo thời gian, mới nhất trước:
+        FTS5 đọc index theo rowid giảm dần và dừng ngay khi đủ trang.
+        
+        Args:
+            query: Chuỗi tìm kiếm (xem build_fts_query)
+            scope: "all", "requests" hoặc "messages"
+            conversation_id: Chỉ tìm trong một conversation
+            limit: Số kết quả mỗi trang
+            cursor: next_cursor của trang trước
+            
+        Returns:
+            Dict: {"items": [...], "next_cursor": str | None, "ranking": "bm25" | "recent"}; mỗi item có
+            kind ("request"/"message"), title và snippet đã HTML-escape, từ khớp được đánh dấu bằng SEARCH_HIGHLIGHT,
+            score (BM25, cao hơn = liên quan hơn; None khi xếp theo thời gian)
+        
+        Raises:
+            ValueError: Nếu query hoặc cursor không hợp lệ
+        """
+        match = build_fts_query(query)
+        limit = clamp_page_size(limit)
+        # Cursor (keyset) giữ cách xếp hạng, để các trang sau không đổi thứ tự khi dữ liệu tăng, và sort key
+        # của dòng cuối đã trả về ở mỗi nguồn: (rank, rowid) khi xếp theo BM25, (rowid,) khi xếp theo thời gian.
+        # Nguồn chưa có dòng nào được trả về không có key; nguồn đã hết kết quả có key None
+        ranking, after = decode_cursor(cursor, 2) if cursor else (None, {})
+        key_size = {"bm25": 2, "recent": 1}.get(ranking)
+        if cursor and (key_size is None or not isinstance(after, dict) or any(
+            kind not in ("requests", "messages") or (key is not None and (
+                not isinstance(key, list) or len(key) != key_size
+                or not all(isinstance(value, (int, float)) for value in key)
+            ))
+            for kind, key in after.items()
+        )):
+            raise ValueError("Cursor không hợp lệ")
+        sources = [kind for kind in ("requests", "messages")
+                   if scope in ("all", kind) and after.get(kind, ()) is not None]
+        
+        fetched: Dict[str, List[Dict[str, Any]]] = {}
         with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            if ranking is None:
+                # Đếm có giới hạn, không dùng hàm phụ trợ: chỉ đọc doclist tới dòng thứ SEARCH_RANK_MAX_HITS + 1
+                ranking = "bm25"
+                for kind in sources:
+                    db_cursor.execute(
+                        f"SELECT COUNT(*) FROM (SELECT rowid FROM {kind}_fts WHERE {kind}_fts MATCH ? LIMIT ?)",
+                        (match, SEARCH_RANK_MAX_HITS + 1)
+                    )
+                    if db_cursor.fetchone()[0] > SEARCH_RANK_MAX_HITS:
+                        ranking = "recent"
+            for kind in sources:
+                fetched[kind] = self._search_source(
+                    db_cursor, kind, match, ranking, conversation_id, after.get(kind), limit + 1
+                )
+            
+            # Trộn các nguồn (mỗi nguồn đã theo thứ tự của SQL) và lấy một trang
+            if ranking == "bm25":
+                merged = heapq.merge(*fetched.values(), key=lambda hit: (hit["rank"], hit["rowid"]))
+            else:
+                merged = heapq.merge(
+                    *fetched.values(), key=lambda hit: (hit["sort_at"], hit["rowid"]), reverse=True
+                )
+            page = list(itertools.islice(merged, limit))
+            
+            # highlight/snippet chỉ tính cho các dòng của trang
+            marks = {}
+            for kind in sources:
+                rowids = [hit["rowid"] for hit in page if hit["kind"] == kind[:-1]]
+                if rowids:
+                    # Theo thời gian trên toàn bộ dữ liệu: các dòng của trang liền nhau trong danh sách khớp
+                    contiguous = ranking == "recent" and not conversation_id
+                    marks[kind] = self._search_marks(db_cursor, kind, match, rowids, contiguous)
+        
+        next_after = dict(after)
+        for kind in sources:
+            taken = [hit for hit in page if hit["kind"] == kind[:-1]]
+            if taken:
+                last = taken[-1]
+                next_after[kind] = [last["rank"], last["rowid"]] if ranking == "bm25" else [last["rowid"]]
+            if len(taken) == len(fetched[kind]):
+                # Đã trả về mọi dòng đọc được và nguồn không còn dòng nào sau đó
+                next_after[kind] = None
+        
+        items = []
+        for hit in page:
+            title, snippet = marks[hit["kind"] + "s"][hit["rowid"]]
+            items.append({
+                "kind": hit["kind"],
+                "conversation_id": hit["conversation_id"],
+                "message_id": hit["message_id"],
+                "role": hit["role"],
+                "title": render_highlight(title if hit["kind"] == "request" else hit["title"]),
+                "snippet": render_highlight(snippet),
+                "score": -hit["rank"] if ranking == "bm25" else None,
+                "created_at": hit["created_at"],
+            })
+        has_more = any(next_after.get(kind, ()) is not None for kind in ("requests", "messages")
+                       if scope in ("all", kind))
+        next_cursor = encode_cursor(ranking, next_after) if has_more else None
+        return {"items": items, "next_cursor": next_cursor, "ranking": ranking}
+    
+    @staticmethod
+    def _search_source(
+        db_cursor: sqlite3.Cursor,
+        kind: str,
+        match: str,
+        ranking: str,
+        conversation_id: Optional[str],
+        after: Optional[List[Any]],
+        fetch: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Tối đa fetch dòng khớp của một nguồn ("requests"/"messages") sau key after, theo thứ tự xếp hạng
+        
+        ORDER BY + LIMIT nằm trong subquery chỉ đọc bảng FTS, bảng gốc được join sau khi đã cắt trang.
+        Khi xếp theo thời gian, ORDER BY rowid DESC và điều kiện rowid < ? được FTS5 xử lý bên trong (dừng
+        ngay khi đủ trang). Khi tìm trong một conversation, các dòng của conversation (qua index) dẫn vòng lặp
+        và FTS5 chỉ kiểm tra từng rowid, không quét toàn bộ danh sách khớp.
+        """
+        fts = f"{kind}_fts"
+        if conversation_id:
+            source = f"{kind} b CROSS JOIN {fts} ON {fts}.rowid = b.id"
+            scope_filter, args = "AND b.conversation_id = ?", [match, conversation_id]
+            key_column = "b.id"
+        else:
+            source, scope_filter, args = fts, "", [match]
+            key_column = f"{fts}.rowid"
+        # BM25 của requests: title nặng hơn pbi_requirement
+        rank_config = f"AND {fts}.rank MATCH 'bm25(5.0, 1.0)'" if kind == "requests" else ""
+        if ranking == "bm25":
+            rank = f"{fts}.rank"
+            order = f"{fts}.rank, {key_column}"
+            # Dấu + để điều kiện trên rank không được chuyển cho FTS5 (rank = ? là cấu hình hàm xếp hạng)
+            keyset = f"AND (+{fts}.rank > ? OR (+{fts}.rank = ? AND {key_column} > ?))" if after else ""
+            args += [after[0], after[0], after[1]] if after else []
+        else:
+            rank, order = "NULL", f"{key_column} DESC"
+            keyset = f"AND {key_column} < ?" if after else ""
+            args += [after[0]] if after else []
+        page = f"""
+            SELECT {key_column} AS rowid, {rank} AS rank FROM {source}
+            WHERE {fts} MATCH ? {rank_config} {scope_filter} {keyset}
+            ORDER BY {order} LIMIT ?
+        """
+        if kind == "requests":
+            db_cursor.execute(f"""
+                SELECT 'request' AS kind, p.rowid, p.rank, r.conversation_id, NULL AS message_id, NULL AS role,
+                       NULL AS title, r.updated_at AS created_at, r.created_at AS sort_at
+                FROM ({page}) p JOIN requests r ON r.id = p.rowid
+            """, (*args, fetch))
+        else:
+            db_cursor.execute(f"""
+                SELECT 'message' AS kind, p.rowid, p.rank, m.conversation_id, m.id AS message_id, m.role,
+                       r.title, m.created_at, m.created_at AS sort_at
+                FROM ({page}) p
+                JOIN messages m ON m.id = p.rowid
+                LEFT JOIN requests r ON r.conversation_id = m.conversation_id
+            """, (*args, fetch))
+        hits = [dict(row) for row in db_cursor.fetchall()]
+        # Join không giữ thứ tự của subquery
+        if ranking == "bm25":
+            hits.sort(key=lambda hit: (hit["rank"], hit["rowid"]))
+        else:
+            hits.sort(key=lambda hit: hit["rowid"], reverse=True)
+        return hits
+    
+    @staticmethod
+    def _search_marks(
+        db_cursor: sqlite3.Cursor,
+        kind: str,
+        match: str,
+        rowids: List[int],
+        contiguous: bool
+    ) -> Dict[int, Tuple[Optional[str], str]]:
+        """
+        (title đánh dấu từ khớp, snippet) theo rowid cho các dòng của trang
+        
+        contiguous: các rowid là một đoạn liền nhau của danh sách khớp, FTS5 đọc theo khoảng rowid;
+        ngược lại FTS5 tra từng rowid (join theo rowid = ?, nhanh hơn rowid IN (...) với query nhiều từ).
+        """
+        mark_open, mark_close = _HIGHLIGHT_SENTINELS
+        fts = f"{kind}_fts"
+        if kind == "requests":
+            columns = "highlight(requests_fts, 0, ?, ?), snippet(requests_fts, 1, ?, ?, '…', 24)"
+            args = [mark_open, mark_close, mark_open, mark_close]
+        else:
+            columns = "NULL, snippet(messages_fts, 0, ?, ?, '…', 24)"
+            args = [mark_open, mark_close]
+        if contiguous:
+            db_cursor.execute(
+                f"SELECT rowid, {columns} FROM {fts} WHERE {fts} MATCH ? AND rowid BETWEEN ? AND ?",
+                (*args, match, min(rowids), max(rowids))
+            )
+        else:
+            db_cursor.execute(f"""
+                SELECT {fts}.rowid, {columns}
+                FROM (SELECT value AS id FROM json_each(?)) page CROSS JOIN {fts} ON {fts}.rowid = page.id
+                WHERE {fts} MATCH ?
+            """, (*args, json.dumps(rowids), match))
+        return {row[0]: (row[1], row[2]) for row in db_cursor.fetchall()}
+    
+    def delete_request(self, conversation_id: str) -> bool:
+        """Xóa request và tất cả messages, testcases, checkpoint của agent liên quan"""
+        with self.transaction() as conn:
             cursor = conn.cursor()
             
-            # Xóa messages trước
+            # Xóa testcases (kèm các bước) và messages trước
+            cursor.execute("""
+                DELETE FROM testcase_steps WHERE testcase_id IN (
+                    SELECT id FROM testcases WHERE conversation_id = ?
+                )
+            """, (conversation_id,))
+            cursor.execute("""
+                DELETE FROM testcases WHERE conversation_id = ?
+            """, (conversation_id,))
             cursor.execute("""
                 DELETE FROM messages WHERE conversation_id = ?
             """, (conversation_id,))
             
+            # Xóa index gần trùng (tra request_lsh theo primary key với các bucket đã lưu)
+            cursor.execute("""
+                SELECT s.request_id, s.buckets FROM request_signatures s
+                JOIN requests r ON r.id = s.request_id
+                WHERE r.conversation_id = ?
+            """, (conversation_id,))
+            indexed = cursor.fetchone()
+            if indexed:
+                cursor.executemany(
+                    "DELETE FROM request_lsh WHERE bucket = ? AND request_id = ?",
+                    [(bucket, indexed["request_id"]) for bucket in minhasher.unpack_buckets(indexed["buckets"])]
+                )
+                cursor.execute("DELETE FROM request_signatures WHERE request_id = ?", (indexed["request_id"],))
+            
             # Xóa request
             cursor.execute("""
                 DELETE FROM requests WHERE conversation_id = ?
             """, (conversation_id,))
+            deleted = cursor.rowcount > 0
             
+            # Checkpoint của agent cùng file: xóa trong cùng transaction
+            if self.checkpoint_connections is self.connections:
+                self._delete_checkpoints(conn, conversation_id)
+        
+        if self.checkpoint_connections is not self.connections:
+            conn = self.checkpoint_connections.get()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete_checkpoints(conn, conversation_id)
+            except BaseException:
+                conn.rollback()
+                raise
             conn.commit()
+        return deleted
+    
+    @staticmethod
+    def _delete_checkpoints(conn: sqlite3.Connection, thread_id: str):
+        """
+        Xóa checkpoint và pending writes của agent cho một thread
+        
+        Xóa trực tiếp trong bảng của SQLiteTieredSaver để route CRUD không phải dựng checkpointer/agent.
+        """
+        existing = {
+            row[0] for row in conn.execute(
+                f"SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({', '.join('?' * len(CHECKPOINT_TABLES))})",
+                CHECKPOINT_TABLES
+            )
+        }
+        for table in CHECKPOINT_TABLES:
+            if table in existing:
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+    
+    def get_cached_response(self, cache_key: str, ttl_seconds: float) -> Optional[str]:
+        """Lấy payload đã cache (None nếu không có hoặc đã hết hạn) và cập nhật last_access"""
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT payload, created_at FROM response_cache WHERE cache_key = ?
+            """, (cache_key,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            
+            if now - row["created_at"] > ttl_seconds:
+                cursor.execute("DELETE FROM response_cache WHERE cache_key = ?", (cache_key,))
+                return None
+            
+            cursor.execute("""
+                UPDATE response_cache SET last_access = ? WHERE cache_key = ?
+            """, (now, cache_key))
+            return row["payload"]
+    
+    def put_cached_response(self, cache_key: str, payload: str, ttl_seconds: float, max_total_bytes: int):
+        """Lưu payload vào cache, sau đó xóa entry hết hạn và entry cũ nhất khi vượt quá dung lượng"""
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO response_cache (cache_key, payload, size_bytes, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            """, (cache_key, payload, len(payload.encode("utf-8")), now, now))
+            
+            cursor.execute("""
+                DELETE FROM response_cache WHERE created_at < ?
+            """, (now - ttl_seconds,))
+            
+            # Giữ các entry truy cập gần nhất có tổng dung lượng <= max_total_bytes
+            cursor.execute("""
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM (
+                        SELECT cache_key,
+                               SUM(size_bytes) OVER (ORDER BY last_access DESC, cache_key) AS running_bytes
+                        FROM response_cache
+                    )
+                    WHERE running_bytes > ?
+                )
+            """, (max_total_bytes,))
+
+    
+    def get_attachment_meta(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy thông tin attachment (không kèm dữ liệu)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT attachment_id, mime_type, size_bytes, original_size, created_at
+                FROM attachments WHERE attachment_id = ?
+            """, (attachment_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def get_attachment(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy attachment kèm dữ liệu bytes"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM attachments WHERE attachment_id = ?
+            """, (attachment_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def put_attachment(self, attachment_id: str, mime_type: str, data: bytes, original_size: int) -> Dict[str, Any]:
+        """Lưu attachment nếu chưa có (dedup theo attachment_id), trả về thông tin bản đang lưu"""
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR IGNORE INTO attachments (attachment_id, mime_type, size_bytes, original_size, data)
+                VALUES (?, ?, ?, ?, ?)
+            """, (attachment_id, mime_type, len(data), original_size, data))
+            
+            cursor.execute("""
+                SELECT attachment_id, mime_type, size_bytes, original_size, created_at
+                FROM attachments WHERE attachment_id = ?
+            """, (attachment_id,))
+            return dict(cursor.fetchone())
+
+    
+    def create_job(self, conversation_id: Optional[str], params: str) -> Dict[str, Any]:
+        """Tạo job mới ở trạng thái queued"""
+        job_id = f"job_{uuid.uuid4().hex[:12]}"
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO jobs (job_id, conversation_id, status, params, created_at)
+                VALUES (?, ?, 'queued', ?, ?)
+                RETURNING *
+            """, (job_id, conversation_id, params, time.time()))
+            return dict(cursor.fetchall()[0])
+    
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy job theo job_id"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def update_job(self, job_id: str, owner: Optional[str] = None, **fields: Any) -> bool:
+        """
+        Cập nhật các cột status/result/error/started_at/finished_at/events của job
+        
+        Args:
+            owner: Chỉ cập nhật nếu job vẫn thuộc owner này (lease chưa bị worker khác lấy lại)
+        
+        Returns:
+            bool: Có row nào được cập nhật không
+        """
+        allowed = {"status", "result", "error", "started_at", "finished_at", "events"}
+        columns = [name for name in fields if name in allowed]
+        if not columns:
+            return False
+        condition, params = "job_id = ?", [job_id]
+        if owner is not None:
+            condition += " AND owner = ?"
+            params.append(owner)
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in columns)} WHERE {condition}",
+                [fields[name] for name in columns] + params
+            )
             return cursor.rowcount > 0
+    
+    def claim_job(self, job_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Nhận job queued để chạy (atomic: khi nhiều worker cùng claim, chỉ một worker nhận được)
+        
+        Returns:
+            Optional[Dict]: Row của job đã chuyển sang running, None nếu job không còn queued
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE jobs SET status = 'running', owner = ?, started_at = ?, heartbeat_at = ?
+                WHERE job_id = ? AND status = 'queued'
+                RETURNING *
+            """, (owner, now, now, job_id))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def heartbeat_jobs(self, owner: str) -> int:
+        """Gia hạn lease của các job running thuộc owner, trả về số job được gia hạn"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'",
+                (time.time(), owner)
+            )
+            return cursor.rowcount
+    
+    def requeue_expired_jobs(self, lease_seconds: float) -> List[str]:
+        """
+        Đưa job running có lease hết hạn (worker chạy nó đã dừng, không còn heartbeat) về queued
+        
+        Job của worker khác còn sống (vẫn heartbeat) không bị động tới.
+        
+        Returns:
+            List[str]: job_id vừa được đưa về queued
+        """
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE jobs SET status = 'queued', owner = NULL, started_at = NULL, heartbeat_at = NULL
+                WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+                RETURNING job_id
+            """, (time.time() - lease_seconds,))
+            return [row["job_id"] for row in cursor.fetchall()]
+    
+    def release_jobs(self, owner: str) -> List[str]:
+        """Trả các job running của owner về queued (worker dừng có kiểm soát) để worker khác chạy ngay"""
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE jobs SET status = 'queued', owner = NULL, started_at = NULL, heartbeat_at = NULL
+                WHERE owner = ? AND status = 'running'
+                RETURNING job_id
+            """, (owner,))
+            return [row["job_id"] for row in cursor.fetchall()]
+    
+    def list_queued_jobs(self) -> List[str]:
+        """job_id của các job queued theo thứ tự tạo"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at")
+            return [row["job_id"] for row in cursor.fetchall()]
+
+
+class AsyncDatabaseManager:
+    """
+    Async variant của DatabaseManager
+    
+    Mỗi method chạy method sync tương ứng trên một ThreadPoolExecutor có giới hạn
+    để không block event loop. Mỗi worker thread giữ một connection lâu dài,
+    nên số connection mở tối đa bằng số worker.
+    """
+    
+    def __init__(self, manager: DatabaseManager, max_workers: Optional[int] = None):
+        self.manager = manager
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or manager.pool_size,
+            thread_name_prefix="db"
+        )
+    
+    async def _run(self, func, *args, **kwargs):
+        """Chạy hàm sync trên executor của database (ghi latency/lỗi theo tên method)"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        except Exception:
+            DB_OPERATION_ERRORS.inc(func.__name__)
+            raise
+        finally:
+            DB_OPERATION_DURATION.observe(time.perf_counter() - start, func.__name__)
+    
+    async def create_request(self, title: str, pbi_requirement: str) -> Dict[str, Any]:
+        """Tạo request mới"""
+        return await self._run(self.manager.create_request, title, pbi_requirement)
+    
+    async def create_requests(self, items: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Tạo nhiều request trong một transaction"""
+        return await self._run(self.manager.create_requests, items)
+    
+    async def get_requests_page(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Lấy một trang requests bằng keyset pagination"""
+        return await self._run(self.manager.get_requests_page, limit, cursor)
+    
+    async def get_request_by_conversation_id(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy request theo conversation_id"""
+        return await self._run(self.manager.get_request_by_conversation_id, conversation_id)
+    
+    async def update_request_timestamp(self, conversation_id: str):
+        """Cập nhật timestamp của request"""
+        return await self._run(self.manager.update_request_timestamp, conversation_id)
+    
+    async def add_message(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        testcases: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Thêm message (kèm testcase đã tách) vào conversation"""
+        return await self._run(self.manager.add_message, conversation_id, role, content, testcases)
+    
+    async def get_messages_page(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Lấy một trang messages của conversation bằng keyset pagination"""
+        return await self._run(self.manager.get_messages_page, conversation_id, limit, cursor)
+    
+    async def get_testcases_page(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Lấy một trang testcase (kèm các bước) của conversation bằng keyset pagination"""
+        return await self._run(self.manager.get_testcases_page, conversation_id, limit, cursor)
+    
+    async def count_testcases(self, conversation_id: str) -> int:
+        """Số testcase của conversation"""
+        return await self._run(self.manager.count_testcases, conversation_id)
+    
+    async def get_latest_testcases(self, conversation_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Testcase của response gần nhất có testcase trong conversation"""
+        return await self._run(self.manager.get_latest_testcases, conversation_id, limit)
+    
+    async def find_similar_requests(
+        self,
+        pbi_requirement: str,
+        exclude_conversation_id: Optional[str] = None,
+        limit: int = 5,
+        threshold: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Tìm các request cũ có pbi_requirement gần trùng"""
+        return await self._run(
+            self.manager.find_similar_requests, pbi_requirement, exclude_conversation_id, limit, threshold
+        )
+    
+    async def search(
+        self,
+        query: str,
+        scope: str = "all",
+        conversation_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Tìm kiếm full-text trên requests và messages"""
+        return await self._run(self.manager.search, query, scope, conversation_id, limit, cursor)
+    
+    async def delete_request(self, conversation_id: str) -> bool:
+        """Xóa request và tất cả messages, testcases, checkpoint của agent liên quan"""
+        return await self._run(self.manager.delete_request, conversation_id)
+    
+    async def get_cached_response(self, cache_key: str, ttl_seconds: float) -> Optional[str]:
+        """Lấy payload đã cache"""
+        return await self._run(self.manager.get_cached_response, cache_key, ttl_seconds)
+    
+    async def put_cached_response(self, cache_key: str, payload: str, ttl_seconds: float, max_total_bytes: int):
+        """Lưu payload vào cache"""
+        return await self._run(self.manager.put_cached_response, cache_key, payload, ttl_seconds, max_total_bytes)
+    
+    async def get_attachment_meta(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy thông tin attachment (không kèm dữ liệu)"""
+        return await self._run(self.manager.get_attachment_meta, attachment_id)
+    
+    async def get_attachment(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy attachment kèm dữ liệu bytes"""
+        return await self._run(self.manager.get_attachment, attachment_id)
+    
+    async def put_attachment(self, attachment_id: str, mime_type: str, data: bytes, original_size: int) -> Dict[str, Any]:
+        """Lưu attachment nếu chưa có"""
+        return await self._run(self.manager.put_attachment, attachment_id, mime_type, data, original_size)
+    
+    async def create_job(self, conversation_id: Optional[str], params: str) -> Dict[str, Any]:
+        """Tạo job mới ở trạng thái queued"""
+        return await self._run(self.manager.create_job, conversation_id, params)
+    
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy job theo job_id"""
+        return await self._run(self.manager.get_job, job_id)
+    
+    async def update_job(self, job_id: str, owner: Optional[str] = None, **fields: Any) -> bool:
+        """Cập nhật trạng thái/kết quả của job"""
+        return await self._run(self.manager.update_job, job_id, owner, **fields)
+    
+    async def claim_job(self, job_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Nhận job queued để chạy (atomic)"""
+        return await self._run(self.manager.claim_job, job_id, owner)
+    
+    async def heartbeat_jobs(self, owner: str) -> int:
+        """Gia hạn lease các job running của owner"""
+        return await self._run(self.manager.heartbeat_jobs, owner)
+    
+    async def requeue_expired_jobs(self, lease_seconds: float) -> List[str]:
+        """Đưa job có lease hết hạn về queued"""
+        return await self._run(self.manager.requeue_expired_jobs, lease_seconds)
+    
+    async def release_jobs(self, owner: str) -> List[str]:
+        """Trả các job running của owner về queued"""
+        return await self._run(self.manager.release_jobs, owner)
+    
+    async def list_queued_jobs(self) -> List[str]:
+        """job_id của các job queued"""
+        return await self._run(self.manager.list_queued_jobs)
+    
+    def close(self):
+        """Dừng executor và đóng các connection đã mở"""
+        self._executor.shutdown(wait=True)
+        self.manager.connections.close_all()
+        self.manager.checkpoint_connections.close_all()
 
 # Singleton instance
-db_manager = DatabaseManager()
+db_manager = DatabaseManager(checkpoint_db_path=CHECKPOINT_DB_PATH)
+async_db_manager = AsyncDatabaseManager(db_manager)
@@ -0,0 +1,326 @@
+"""
+Quản lý lịch sử hội thoại của agent: giữ prompt trong ngân sách token bằng running summary
+"""
+
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langgraph.prebuilt.chat_agent_executor import AgentState
+from typing_extensions import NotRequired
+
+HISTORY_COMPACTION_ENABLED = os.getenv("HISTORY_COMPACTION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Ngân sách token cho phần lịch sử gửi tới model (không tính system prompt)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+# Phần ngân sách dành cho running summary
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "800"))
+# Khi phải tóm tắt, phần giữ nguyên văn được thu về tỷ lệ này của ngân sách,
+# để summary được dùng lại cho nhiều lượt tiếp theo thay vì tóm tắt lại mỗi lượt
+HISTORY_COMPACTION_TARGET = float(os.getenv("HISTORY_COMPACTION_TARGET", "0.5"))
+# Kết quả tool của các lượt trước được cắt còn tối đa số ký tự này
+HISTORY_TOOL_RESULT_CHARS = int(os.getenv("HISTORY_TOOL_RESULT_CHARS", "500"))
+# Nội dung trả lời của trợ lý ở các lượt trước được cắt còn tối đa số ký tự này
+HISTORY_ASSISTANT_MESSAGE_CHARS = int(os.getenv("HISTORY_ASSISTANT_MESSAGE_CHARS", "1500"))
+# Số lượt gần nhất giữ lại trong thống kê prompt tokens
+HISTORY_STATS_WINDOW = int(os.getenv("HISTORY_STATS_WINDOW", "1000"))
+
+# Ước lượng cho một ảnh đính kèm (OpenAI tính ~765 token cho ảnh 1024px ở detail high)
+_IMAGE_TOKENS = 800
+
+SUMMARY_PROMPT = """Bạn tóm tắt hội thoại giữa người dùng và trợ lý QA sinh testcase.
+Giữ lại: yêu cầu nghiệp vụ, các quyết định/ràng buộc người dùng đưa ra, tên file đính kèm,
+tiêu đề các testcase đã sinh và các chỉnh sửa đã được yêu cầu. Bỏ chi tiết từng bước.
+Viết ngắn gọn bằng tiếng Việt, tối đa {max_words} từ."""
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """Ước lượng số token của một message (~4 ký tự/token, ảnh tính cố định)"""
+    content = message.content
+    if isinstance(content, str):
+        chars, images = len(content), 0
+    else:
+        chars, images = 0, 0
+        for block in content:
+            if isinstance(block, str):
+                chars += len(block)
+            elif block.get("type") == "text":
+                chars += len(block.get("text", ""))
+            else:
+                images += 1
+    if isinstance(message, AIMessage) and message.tool_calls:
+        chars += sum(len(str(call.get("args", ""))) + len(call.get("name", "")) for call in message.tool_calls)
+    return 4 + math.ceil(chars / 4) + images * _IMAGE_TOKENS
+
+
+def _text_of(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    parts = []
+    for block in message.content:
+        if isinstance(block, str):
+            parts.append(block)
+        elif block.get("type") == "text":
+            parts.append(block.get("text", ""))
+        else:
+            parts.append("[ảnh đính kèm]")
+    return "\n".join(parts)
+
+
+def _truncate_content(content: Any, limit: int) -> Optional[Any]:
+    """Nội dung đã cắt còn tối đa limit ký tự text (None nếu không cần cắt)"""
+    suffix = "... (đã rút gọn)"
+    if isinstance(content, str):
+        return content[:limit] + suffix if len(content) > limit else None
+    remaining, truncated, changed = limit, [], False
+    for block in content:
+        if isinstance(block, dict) and block.get("type") == "text":
+            text = block.get("text", "")
+            if len(text) > remaining:
+                block = {**block, "text": text[:remaining] + suffix}
+                changed = True
+            remaining = max(remaining - len(text), 0)
+        truncated.append(block)
+    return truncated if changed else None
+
+
+class TestcaseAgentState(AgentState):
+    """State của agent: messages + running summary của các lượt cũ (do HistoryManager cập nhật)"""
+    history_summary: NotRequired[Optional[Dict[str, Any]]]
+
+
+class HistoryManager:
+    """
+    Chính sách nén lịch sử chạy như pre_model_hook của agent
+
+    Khi toàn bộ lịch sử vượt HISTORY_TOKEN_BUDGET, các lượt cũ (tính theo ranh giới
+    message của người dùng) được gộp vào running summary, chỉ các lượt gần nhất được gửi
+    nguyên văn. Summary được lưu trong state của agent (key history_summary) nên nằm trong
+    checkpoint: mỗi phần lịch sử chỉ được tóm tắt một lần, các lượt sau tóm tắt tăng dần
+    từ summary cũ. Checkpoint vẫn giữ đầy đủ messages.
+    """
+
+    def __init__(
+        self,
+        model: BaseChatModel,
+        enabled: bool = HISTORY_COMPACTION_ENABLED,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        summary_max_tokens: int = HISTORY_SUMMARY_MAX_TOKENS,
+        compaction_target: float = HISTORY_COMPACTION_TARGET,
+        tool_result_chars: int = HISTORY_TOOL_RESULT_CHARS,
+        assistant_message_chars: int = HISTORY_ASSISTANT_MESSAGE_CHARS,
+        stats_window: int = HISTORY_STATS_WINDOW
+    ):
+        self.model = model
+        self.enabled = enabled
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.compaction_target = compaction_target
+        self.tool_result_chars = tool_result_chars
+        self.assistant_message_chars = assistant_message_chars
+        self.stats = {"model_calls": 0, "compacted_calls": 0, "summaries": 0, "summary_reuses": 0, "summary_failures": 0}
+        # (prompt tokens trước khi nén, sau khi nén) của các lần gọi model gần nhất
+        self.samples: deque = deque(maxlen=stats_window)
+
+    def _trim_old_turns(self, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+        """
+        Cắt ngắn kết quả tool và câu trả lời của trợ lý ở các lượt trước lượt hiện tại
+
+        tool_calls của AIMessage được giữ nguyên để mỗi ToolMessage còn lại vẫn khớp với
+        lời gọi của nó; ở các lượt cũ, tool call không có kết quả và kết quả không có tool
+        call tương ứng (lượt bị ngắt giữa chừng) được bỏ đi vì model sẽ từ chối cặp lệch.
+        """
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+        answered: Set[str] = {m.tool_call_id for m in messages[:last_human] if isinstance(m, ToolMessage)}
+        called: Set[str] = {
+            call["id"] for m in messages[:last_human] if isinstance(m, AIMessage) for call in m.tool_calls
+        }
+        trimmed = []
+        for i, message in enumerate(messages):
+            if i >= last_human:
+                trimmed.append(message)
+                continue
+            update: Dict[str, Any] = {}
+            if isinstance(message, ToolMessage):
+                if message.tool_call_id not in called:
+                    continue
+                content = _truncate_content(message.content, self.tool_result_chars)
+                if content is not None:
+                    update["content"] = content
+            elif isinstance(message, AIMessage):
+                content = _truncate_content(message.content, self.assistant_message_chars)
+                if content is not None:
+                    update["content"] = content
+                tool_calls = [call for call in message.tool_calls if call["id"] in answered]
+                if len(tool_calls) != len(message.tool_calls):
+                    if not tool_calls and not _text_of(message):
+                        continue
+                    update["tool_calls"] = tool_calls
+                    # Bản OpenAI thô trong additional_kwargs cũng mang tool call đã bỏ
+                    update["additional_kwargs"] = {
+                        k: v for k, v in message.additional_kwargs.items() if k != "tool_calls"
+                    }
+            trimmed.append(message.model_copy(update=update) if update else message)
+        return trimmed
+
+    @property
+    def window_budget(self) -> int:
+        """Ngân sách cho phần lịch sử giữ nguyên văn"""
+        return self.token_budget - self.summary_max_tokens
+
+    def _split_index(self, messages: Sequence[BaseMessage], window_budget: float) -> int:
+        """
+        Vị trí bắt đầu phần lịch sử giữ nguyên văn trong window_budget
+
+        Luôn cắt tại message của người dùng để không tách tool call khỏi kết quả của nó,
+        và luôn giữ lượt hiện tại.
+        """
+        human_indexes = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        if not human_indexes:
+            return 0
+        split = human_indexes[-1]
+        kept = sum(estimate_tokens(m) for m in messages[split:])
+        for start in reversed(human_indexes[:-1]):
+            cost = sum(estimate_tokens(m) for m in messages[start:split])
+            if kept + cost > window_budget:
+                break
+            kept += cost
+            split = start
+        return split
+
+    @staticmethod
+    def _covered_count(messages: Sequence[BaseMessage], summary: Optional[Dict[str, Any]]) -> int:
+        """Số message đầu lịch sử đã nằm trong summary hiện có"""
+        if not summary:
+            return 0
+        for i, message in enumerate(messages):
+            if message.id == summary.get("covered_until"):
+                return i + 1
+        return 0
+
+    def _summary_request(self, previous: Optional[str], messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+        # Giới hạn transcript gửi đi tóm tắt, mỗi message tối đa 2000 ký tự
+        lines = []
+        for message in messages:
+            if isinstance(message, ToolMessage):
+                continue
+            role = "Người dùng" if isinstance(message, HumanMessage) else "Trợ lý"
+            text = _text_of(message)
+            if text:
+                lines.append(f"{role}: {text[:2000]}")
+        transcript = "\n\n".join(lines)
+        if previous:
+            transcript = f"Tóm tắt trước đó:\n{previous}\n\nCác lượt tiếp theo:\n{transcript}"
+        return [
+            SystemMessage(content=SUMMARY_PROMPT.format(max_words=int(self.summary_max_tokens * 0.6))),
+            HumanMessage(content=transcript),
+        ]
+
+    def _plan(self, state: Dict[str, Any]) -> Tuple[List[BaseMessage], int, int, Optional[Dict[str, Any]]]:
+        """
+        Trả về (messages, split, covered, summary hiện có)
+
+        split == covered nghĩa là dùng lại summary hiện có; split > covered nghĩa là
+        messages[covered:split] cần được tóm tắt thêm.
+        """
+        messages = list(state["messages"])
+        summary = state.get("history_summary")
+        covered = self._covered_count(messages, summary)
+        if covered and sum(estimate_tokens(m) for m in messages[covered:]) <= self.window_budget:
+            return messages, covered, covered, summary
+        split = self._split_index(messages, self.window_budget * self.compaction_target)
+        return messages, max(split, covered), covered, summary
+
+    def _finish(
+        self,
+        messages: List[BaseMessage],
+        split: int,
+        summary_text: Optional[str],
+        update: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        llm_input = self._trim_old_turns(messages[split:])
+        if split and summary_text:
+            llm_input.insert(0, SystemMessage(
+                content=f"Tóm tắt các lượt hội thoại trước (đã được rút gọn):\n{summary_text}"
+            ))
+        self._record(messages, llm_input, compacted=split > 0)
+        update["llm_input_messages"] = llm_input
+        return update
+
+    def _record(self, messages: Sequence[BaseMessage], llm_input: Sequence[BaseMessage], compacted: bool):
+        self.stats["model_calls"] += 1
+        if compacted:
+            self.stats["compacted_calls"] += 1
+        self.samples.append((
+            sum(estimate_tokens(m) for m in messages),
+            sum(estimate_tokens(m) for m in llm_input),
+        ))
+
+    def _new_summary(self, messages: List[BaseMessage], split: int, text: str) -> Dict[str, Any]:
+        self.stats["summaries"] += 1
+        return {"text": text, "covered_until": messages[split - 1].id, "updated_at": time.time()}
+
+    def compact_sync(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """pre_model_hook (sync): trả về llm_input_messages và summary mới (nếu có)"""
+        messages = list(state["messages"])
+        if not self.enabled or sum(estimate_tokens(m) for m in messages) <= self.token_budget:
+            return self._finish(messages, 0, None, {})
+
+        messages, split, covered, summary = self._plan(state)
+        if split == 0:
+            return self._finish(messages, 0, None, {})
+        if covered == split:
+            self.stats["summary_reuses"] += 1
+            return self._finish(messages, split, summary["text"], {})
+
+        previous = summary["text"] if covered else None
+        try:
+            result = self.model.invoke(self._summary_request(previous, messages[covered:split]))
+        except Exception:
+            self.stats["summary_failures"] += 1
+            return self._finish(messages, covered, previous, {})
+        new_summary = self._new_summary(messages, split, _text_of(result))
+        return self._finish(messages, split, new_summary["text"], {"history_summary": new_summary})
+
+    async def compact(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """pre_model_hook (async): trả về llm_input_messages và summary mới (nếu có)"""
+        messages = list(state["messages"])
+        if not self.enabled or sum(estimate_tokens(m) for m in messages) <= self.token_budget:
+            return self._finish(messages, 0, None, {})
+
+        messages, split, covered, summary = self._plan(state)
+        if split == 0:
+            return self._finish(messages, 0, None, {})
+        if covered == split:
+            self.stats["summary_reuses"] += 1
+            return self._finish(messages, split, summary["text"], {})
+
+        previous = summary["text"] if covered else None
+        try:
+            result = await self.model.ainvoke(self._summary_request(previous, messages[covered:split]))
+        except Exception:
+            self.stats["summary_failures"] += 1
+            return self._finish(messages, covered, previous, {})
+        new_summary = self._new_summary(messages, split, _text_of(result))
+        return self._finish(messages, split, new_summary["text"], {"history_summary": new_summary})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Thống kê nén lịch sử và prompt tokens mỗi lần gọi model (trước/sau khi nén)"""
+        before = [b for b, _ in self.samples]
+        after = [a for _, a in self.samples]
+
+        def describe(values: List[int]) -> Dict[str, float]:
+            if not values:
+                return {"avg": 0.0, "max": 0}
+            return {"avg": sum(values) / len(values), "max": max(values)}
+
+        return {
+            "enabled": self.enabled,
+            "token_budget": self.token_budget,
+            **self.stats,
+            "prompt_tokens_before": describe(before),
+            "prompt_tokens_after": describe(after),
+        }
@@ -0,0 +1,141 @@
+"""
+HTTP client dùng chung cho ChatOpenAI: connection pool, keep-alive và timeout cấu hình qua env
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401  # HTTP/2 cần package h2 (pip install httpx[http2])
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# Số connection tối đa tới OpenAI API và số connection keep-alive được giữ lại trong pool
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Thời gian giữ connection rảnh trong pool (giây)
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# Timeout (giây): kết nối, đọc (giữa hai chunk của stream), ghi, chờ connection rảnh trong pool
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+OPENAI_WRITE_TIMEOUT = float(os.getenv("OPENAI_WRITE_TIMEOUT", "30"))
+OPENAI_POOL_TIMEOUT = float(os.getenv("OPENAI_POOL_TIMEOUT", "10"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+# Số lần retry của OpenAI SDK khi lỗi kết nối/429/5xx
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+
+class LLMHttpClients:
+    """
+    Cặp httpx client (sync + async) dùng chung cho mọi lời gọi model
+
+    Connection tới upstream được giữ trong pool và dùng lại giữa các request, tránh TCP/TLS
+    handshake mới cho mỗi lời gọi. Mỗi request được gắn trace hook để đếm số connection
+    mở mới và số TLS handshake, từ đó tính tỷ lệ dùng lại connection.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections: int = OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = OPENAI_KEEPALIVE_EXPIRY,
+        connect_timeout: float = OPENAI_CONNECT_TIMEOUT,
+        read_timeout: float = OPENAI_READ_TIMEOUT,
+        write_timeout: float = OPENAI_WRITE_TIMEOUT,
+        pool_timeout: float = OPENAI_POOL_TIMEOUT,
+        http2: bool = OPENAI_HTTP2
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=write_timeout,
+            pool=pool_timeout
+        )
+        # Không có h2 thì dùng HTTP/1.1 keep-alive
+        self.http2 = http2 and _HTTP2_AVAILABLE
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self.stats = {"requests": 0, "connections_opened": 0, "tls_handshakes": 0, "connect_failures": 0}
+
+    def _record(self, event: str):
+        if event == "connection.connect_tcp.complete":
+            self.stats["connections_opened"] += 1
+        elif event == "connection.start_tls.complete":
+            self.stats["tls_handshakes"] += 1
+        elif event == "connection.connect_tcp.failed":
+            self.stats["connect_failures"] += 1
+
+    def _trace(self, event: str, info: Dict[str, Any]):
+        self._record(event)
+
+    async def _atrace(self, event: str, info: Dict[str, Any]):
+        self._record(event)
+
+    def _on_request(self, request: httpx.Request):
+        self.stats["requests"] += 1
+        request.extensions["trace"] = self._trace
+
+    async def _aon_request(self, request: httpx.Request):
+        self.stats["requests"] += 1
+        request.extensions["trace"] = self._atrace
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        """Client sync (agent.invoke), tạo khi dùng lần đầu"""
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                event_hooks={"request": [self._on_request]}
+            )
+        return self._sync_client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Client async (agent.astream/ainvoke), tạo khi dùng lần đầu"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                event_hooks={"request": [self._aon_request]}
+            )
+        return self._async_client
+
+    async def aclose(self):
+        """Đóng các connection trong pool (gọi khi ứng dụng dừng)"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        if self._sync_client is not None:
+            self._sync_client.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cấu hình pool và số request/connection đã mở"""
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "connection_reuse_ratio": round(1 - self.stats["connections_opened"] / requests, 4) if requests else None,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "timeout": {
+                "connect": self.timeout.connect,
+                "read": self.timeout.read,
+                "write": self.timeout.write,
+                "pool": self.timeout.pool,
+            },
+            "http2": self.http2,
+        }
+
+
+# Singleton instance
+llm_http_clients = LLMHttpClients()
@@ -1,18 +1,61 @@
 """
 FastAPI Application - Demo Project
 """
-from fastapi import FastAPI, HTTPException, Form, File, UploadFile
+from fastapi import FastAPI, HTTPException, Form, File, UploadFile, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from typing import Dict, List, Optional
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+import asyncio
+import os
+import time
 import uvicorn
-import base64
-from Model import Item, ItemCreate, ChatMessage, ChatRequest, AgentTestcaseRequest, RequestCreate, RequestResponse, MessageResponse
-from Service import ChatService
-from database import db_manager
+from Model import Item, ItemCreate, ChatMessage, ChatRequest, AgentTestcaseRequest, BatchTestcaseRequest, RequestCreate, RequestResponse, MessageResponse, RequestPage, MessagePage, SimilarRequest, JobResponse, TestcaseResponse, TestcasePage, SearchHit, SearchPage
+from Service import ChatService, BatchService, job_manager, response_cache, single_flight, attachment_retriever
+from Service import stream_registry, StreamGapError, admission_controller, AdmissionRejected
+from Service.batch_service import BATCH_MAX_ITEMS
+from Service.attachment_service import AttachmentService, AttachmentTooLargeError, ATTACHMENT_MAX_BYTES
+from Service.image_service import image_normalizer
+from Service.sse_encoder import accepts_gzip, gzip_stream
+from attachment_store import attachment_store
+from database import MAX_PAGE_SIZE, async_db_manager
+import agent as agent_module
+from llm_client import llm_http_clients
+from metrics import registry as metrics_registry, instrument_sse, HTTP_REQUESTS, HTTP_REQUEST_DURATION
+from tracing import tracer, NOOP_TRACE, TRACE_DEBUG_HEADER
+
+# Gauge đọc trạng thái hiện tại của các thành phần lúc scrape /metrics
+metrics_registry.gauge("llm_admission_active", "Số lời gọi agent đang giữ slot", lambda: admission_controller.active)
+metrics_registry.gauge("llm_admission_queue_depth", "Số request đang chờ slot gọi agent", lambda: admission_controller.queue_depth)
+metrics_registry.gauge("sse_buffered_bytes", "Dung lượng ring buffer SSE cho Last-Event-ID replay", lambda: stream_registry.buffered_bytes)
+metrics_registry.gauge("jobs_running", "Số job nền đang chạy", lambda: job_manager.snapshot()["running"])
+metrics_registry.gauge("jobs_queued", "Số job nền đang chờ", lambda: job_manager.snapshot()["queued"])
+metrics_registry.gauge("agent_ready", "1 khi agent đã được dựng xong", lambda: int(agent_module.agent_status()["ready"]))
+
+# Dựng agent ngay khi khởi động (ở background); false = dựng ở request đầu tiên cần agent
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "true").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Khởi tạo và giải phóng tài nguyên dùng chung theo vòng đời ứng dụng"""
+    # Chạy worker pool cho job nền (nạp lại job queued/chạy dở từ lần chạy trước)
+    await job_manager.start()
+    # Dựng agent ở thread riêng: server nhận request ngay, /ready báo khi agent sẵn sàng
+    if AGENT_WARMUP:
+        asyncio.get_running_loop().run_in_executor(None, agent_module.warm_up)
+    yield
+    await job_manager.stop()
+    # Đóng connection pool tới OpenAI API
+    await llm_http_clients.aclose()
+    # Dừng DB executor và đóng các connection đã mở
+    async_db_manager.close()
+    agent_module.close()
+    # Ghi nốt các trace còn trong hàng đợi xuất file
+    await asyncio.get_running_loop().run_in_executor(None, tracer.close)
 
 # Tạo instance FastAPI
 app = FastAPI(
+    lifespan=lifespan,
     title="Demo FastAPI Application",
     description="Ứng dụng FastAPI demo với các endpoints cơ bản",
     version="1.0.0",
@@ -20,15 +63,120 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
-# Cấu hình CORS
+# Các route nhận file upload và phần dư cho các field khác trong multipart body
+UPLOAD_ROUTES = {"/agent-testcase"}
+UPLOAD_FORM_OVERHEAD_BYTES = 1024 * 1024
+
+class UploadTooLarge(HTTPException):
+    """Body của request upload vượt quá giới hạn (413)"""
+
+    def __init__(self):
+        super().__init__(
+            status_code=413,
+            detail=f"File đính kèm vượt quá dung lượng cho phép ({ATTACHMENT_MAX_BYTES} bytes)"
+        )
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Giới hạn dung lượng body của các route upload trước khi multipart body được đọc/buffer
+
+    Có Content-Length: trả 413 ngay, không đọc body. Chunked transfer-encoding (không có
+    Content-Length): đếm bytes của từng message http.request khi app đọc body và dừng ở giới hạn,
+    nên parser multipart không bao giờ spool nhiều hơn giới hạn.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in UPLOAD_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI trả lại HTTPException phát sinh khi đọc body như khi raise trong endpoint
+                    raise UploadTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadTooLarge:
+            if started:
+                raise
+            await self._reject(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send):
+        error = UploadTooLarge()
+        await JSONResponse(status_code=error.status_code, content={"detail": error.detail})(scope, receive, send)
+
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=ATTACHMENT_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Quá tải: trả về 429 kèm Retry-After thay vì gửi thêm lời gọi tới LLM"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Đếm request và đo latency theo route template (với SSE: thời gian tới khi gửi header)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(request.method, route_path, str(status))
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, request.method, route_path)
+
+# Cấu hình CORS (thêm sau cùng để bao ngoài các middleware khác, kể cả response 413)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Trong production nên giới hạn origins cụ thể
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Id", "X-Trace-Id"],
 )
 
+def _sse_response(request: Request, route: str, stream, headers: Dict[str, str], media_type: str = "text/event-stream"):
+    """StreamingResponse cho stream SSE/NDJSON: ghi metrics, nén gzip nếu client chấp nhận"""
+    body = instrument_sse(route, stream)
+    if accepts_gzip(request.headers.get("accept-encoding")):
+        # Nén trong route (GZipMiddleware sẽ buffer cả stream): mỗi event vẫn tới client ngay
+        body = gzip_stream(body)
+        headers = {**headers, "Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
 
 
 # Routes
@@ -50,17 +198,37 @@ async def health_check():
     """
     return {"status": "healthy", "message": "Server đang hoạt động tốt"}
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness check: 200 khi agent đã được dựng xong, 503 khi đang warm-up hoặc lỗi cấu hình
+    (/health chỉ cho biết process đang chạy)
+    """
+    status = agent_module.agent_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Chat endpoint với streaming response
+    
+    Mỗi event SSE có id "<stream_id>:<seq>". Gửi lại request với header Last-Event-ID để
+    nhận tiếp các event bị lỡ của stream đó.
     """
     if request.stream:
+        resumed = _resume_response(http_request, "/chat")
+        if resumed is not None:
+            return resumed
+        # Hàng đợi gọi agent đã đầy: 429 ngay thay vì mở stream
+        admission_controller.check()
         # Trả về streaming response
-        return StreamingResponse(
-            ChatService.generate_stream_response(request.messages),
-            media_type="text/event-stream",
+        stream = stream_registry.create(ChatService.generate_stream_response(request.messages))
+        return _sse_response(
+            http_request,
+            "/chat",
+            _resume_events(stream, 0),
             headers={
+                "X-Stream-Id": stream.stream_id,
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
                 "Access-Control-Allow-Origin": "*",
@@ -71,15 +239,21 @@ async def chat(request: ChatRequest):
         # Trả về response thông thường (non-streaming)
         try:
             return await ChatService.process_chat_request(request.messages)
+        except AdmissionRejected:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/agent-testcase")
 async def agent_testcase(
+    request: Request,
     conversation_id: Optional[str] = Form(None),
     title: str = Form(...),
     pbi_requirement: str = Form(...),
-    file_attachment: Optional[UploadFile] = File(None)
+    file_attachment: Optional[UploadFile] = File(None),
+    bypass_cache: bool = Form(False),
+    reuse_similar: bool = Form(False),
+    mode: str = Form("stream")
 ):
     """
     Agent testcase endpoint với streaming response
@@ -89,82 +263,274 @@ async def agent_testcase(
         title: Tiêu đề của testcase
         pbi_requirement: Yêu cầu PBI
         file_attachment: File đính kèm (optional)
+        bypass_cache: Bỏ qua response cache và luôn gọi agent
+        reuse_similar: Dùng lại testcase của request cũ có PBI gần trùng nhất (agent chỉ sửa phần khác biệt)
+        mode: "stream" (SSE trong request này) hoặc "job" (chạy nền, trả về job_id ngay)
+    
+    Mỗi event SSE có id "<stream_id>:<seq>". Gửi lại request với header Last-Event-ID để
+    nhận tiếp các event bị lỡ của stream đó thay vì chạy generation mới.
+    
+    Ở lượt đầu của conversation, event "similar" liệt kê các request cũ có PBI gần trùng (nếu có).
+    
+    Gửi header X-Debug-Timing: 1 (mode "stream") để nhận thêm event "timing" với thời gian
+    từng giai đoạn (preload file, ghi DB, các bước graph, tool, serialize SSE) sau event "end".
     
     Returns:
-        StreamingResponse: Server-Sent Events stream
+        StreamingResponse: Server-Sent Events stream (mode "stream")
+        JobResponse: Job vừa tạo, status 202 (mode "job")
     """
+    if mode not in ("stream", "job"):
+        raise HTTPException(status_code=400, detail="mode phải là 'stream' hoặc 'job'")
+    
+    # Client kết nối lại: phát tiếp từ event sau Last-Event-ID của stream cũ
+    if mode == "stream":
+        resumed = _resume_response(request, "/agent-testcase")
+        if resumed is not None:
+            return resumed
+    
+    # Hàng đợi gọi agent đã đầy: 429 ngay, trước khi đọc file đính kèm
+    if mode == "stream":
+        admission_controller.check()
+    
+    # Trace request (khi bật TRACING_ENABLED hoặc client gửi debug header)
+    debug_timing = mode == "stream" and request.headers.get(TRACE_DEBUG_HEADER, "").lower() in ("1", "true")
+    trace = tracer.start_trace("agent-testcase", force=debug_timing, mode=mode) if mode == "stream" else NOOP_TRACE
+    
     try:
         # Preload nội dung file (nếu có) để tránh lỗi stream bị đóng khi streaming response
-        preloaded_file_name = None
-        preloaded_file_content = None
-        preloaded_base64_data = None
-        preloaded_mime_type = None
-        
+        attachment = None
         if file_attachment is not None:
-            try:
-                try:
-                    await file_attachment.seek(0)
-                except Exception:
-                    pass
-                file_bytes = await file_attachment.read()
-                preloaded_file_name = file_attachment.filename or "unknown_file"
-                
-                if not file_bytes or len(file_bytes) == 0:
-                    preloaded_file_content = f"[EMPTY FILE: {preloaded_file_name}]"
-                else:
-                    if file_attachment.content_type and file_attachment.content_type.startswith('image/'):
-                        # Cho file ảnh: tạo base64 data và content description
-                        preloaded_base64_data = base64.b64encode(file_bytes).decode('utf-8')
-                        preloaded_mime_type = file_attachment.content_type
-                        preloaded_file_content = f"[IMAGE: {preloaded_file_name}] - Size: {len(file_bytes)} bytes, Content-Type: {file_attachment.content_type}"
-                    else:
-                        # Cho file text: decode nội dung
-                        try:
-                            text_content = file_bytes.decode('utf-8')
-                            if len(text_content) > 2000:
-                                text_content = text_content[:2000] + "... (truncated)"
-                            preloaded_file_content = text_content
-                        except UnicodeDecodeError:
-                            try:
-                                text_content = file_bytes.decode('latin-1')
-                                if len(text_content) > 2000:
-                                    text_content = text_content[:2000] + "... (truncated)"
-                                preloaded_file_content = text_content
-                            except Exception:
-                                preloaded_file_content = f"[BINARY FILE: {preloaded_file_name}] - Size: {len(file_bytes)} bytes"
-            except Exception as preload_err:
-                preloaded_file_name = file_attachment.filename or "unknown_file"
-                preloaded_file_content = f"[ERROR READING FILE: {preloaded_file_name}] - {str(preload_err)}"
-
-        # Trả về streaming response với nội dung file đã preload
-        return StreamingResponse(
-            ChatService.process_agent_testcase_stream(
-                conversation_id=conversation_id,
-                title=title,
-                pbi_requirement=pbi_requirement,
-                file_attachment=None,
-                preloaded_file_name=preloaded_file_name,
-                preloaded_file_content=preloaded_file_content,
-                preloaded_base64_data=preloaded_base64_data,
-                preloaded_mime_type=preloaded_mime_type
-            ),
-            media_type="text/event-stream",
+            with trace.span("attachment.preload", file_name=file_attachment.filename or ""):
+                attachment = await AttachmentService.ingest(file_attachment)
+
+        params = dict(
+            conversation_id=conversation_id,
+            title=title,
+            pbi_requirement=pbi_requirement,
+            preloaded_file_name=attachment.file_name if attachment else None,
+            preloaded_file_content=attachment.content if attachment else None,
+            preloaded_attachment_id=attachment.attachment_id if attachment else None,
+            preloaded_mime_type=attachment.mime_type if attachment and attachment.is_image else None,
+            attachment_digest=attachment.sha256 if attachment else None,
+            bypass_cache=bypass_cache,
+            reuse_similar=reuse_similar
+        )
+        
+        if mode == "job":
+            # Chạy nền: client theo dõi qua /jobs/{job_id}/events, có thể ngắt và attach lại
+            job = await job_manager.submit(params)
+            job.pop("params", None)
+            return JSONResponse(status_code=202, content=JobResponse(**job).model_dump())
+        
+        # Trả về streaming response với nội dung file đã preload.
+        # Generation chạy trong ResumableStream nên vẫn tiếp tục khi client mất kết nối.
+        stream = stream_registry.create(ChatService.traced_stream(
+            trace,
+            ChatService.process_agent_testcase_stream(**params, trace=trace),
+            debug=debug_timing
+        ))
+        headers = {"X-Trace-Id": trace.trace_id} if trace.enabled else {}
+        return _sse_response(
+            request,
+            "/agent-testcase",
+            _resume_events(stream, 0),
             headers={
+                **headers,
+                "X-Stream-Id": stream.stream_id,
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Headers": "*",
             }
         )
+    except AttachmentTooLargeError as e:
+        tracer.finish(trace, error=e)
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
+        tracer.finish(trace, error=e)
         raise HTTPException(status_code=500, detail=f"Lỗi xử lý agent testcase: {str(e)}")
 
+def _resume_response(request: Request, route: str) -> Optional[StreamingResponse]:
+    """
+    Response phát tiếp stream cũ nếu request có header Last-Event-ID (None nếu không có)
+
+    Raises:
+        HTTPException: 400 nếu Last-Event-ID sai định dạng, 410 nếu stream đã hết hạn
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if not last_event_id:
+        return None
+    try:
+        stream_id, last_seq = stream_registry.parse_event_id(last_event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=410, detail="Stream đã hết hạn, hãy gửi lại request không kèm Last-Event-ID")
+    return _sse_response(
+        request,
+        route,
+        _resume_events(stream, last_seq),
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Stream-Id": stream.stream_id}
+    )
+
+async def _resume_events(stream, after_seq: int):
+    """Phát event của ResumableStream, báo lỗi nếu các event bị lỡ đã bị loại khỏi buffer"""
+    try:
+        async for frame in stream.subscribe(after_seq):
+            yield frame
+    except StreamGapError:
+        yield ChatService._format_sse({
+            "type": "error",
+            "message": "Không thể tiếp tục stream: một phần event đã bị loại khỏi buffer"
+        })
+
+@app.get("/metrics")
+async def metrics():
+    """Metrics dạng Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/tracing/stats")
+async def tracing_stats():
+    """Thống kê tracing: cấu hình, số trace đã tạo và đã xuất"""
+    return {
+        "enabled": tracer.enabled,
+        "sample_rate": tracer.sample_rate,
+        "sinks": [type(sink).__name__ for sink in tracer.sinks],
+        "sink_stats": [getattr(sink, "stats", {}) for sink in tracer.sinks],
+        **tracer.stats,
+    }
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """Thống kê HTTP client tới LLM: cấu hình pool, số request và số connection mở mới"""
+    return llm_http_clients.snapshot()
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """Thống kê admission control: slot đang dùng, độ sâu hàng đợi, thời gian chờ, số request bị từ chối"""
+    return admission_controller.snapshot()
+
+@app.get("/streams/stats")
+async def stream_stats():
+    """Thống kê buffer SSE dùng cho Last-Event-ID replay (số stream, số event, dung lượng)"""
+    return stream_registry.snapshot()
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """Thống kê hàng đợi job nền"""
+    return job_manager.snapshot()
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Lấy trạng thái và kết quả của job"""
+    job = await job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """
+    Attach vào event stream của job (SSE)
+    
+    Job đang chạy được phát lại từ đầu rồi tiếp tục live; ngắt kết nối không làm dừng job.
+    Mỗi event có id "<job_id>:<seq>"; kết nối lại với header Last-Event-ID chỉ nhận các event sau đó.
+    """
+    after_seq = 0
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            event_job_id, after_seq = stream_registry.parse_event_id(last_event_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if event_job_id != job_id:
+            raise HTTPException(status_code=400, detail="Last-Event-ID không thuộc job này")
+    if not await job_manager.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _sse_response(
+        request,
+        "/jobs/{job_id}/events",
+        job_manager.subscribe(job_id, after_seq),
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+@app.post("/agent-testcase/batch")
+async def agent_testcase_batch(
+    request: BatchTestcaseRequest,
+    http_request: Request,
+    output_format: str = Query("sse", alias="format", pattern="^(sse|ndjson)$")
+):
+    """
+    Sinh testcase cho nhiều yêu cầu trong một request
+    
+    Args:
+        request: Danh sách items {title, pbi_requirement}, concurrency, bypass_cache
+        output_format: "sse" (Server-Sent Events) hoặc "ndjson"
+    
+    Với format "sse", mỗi event có id "<stream_id>:<seq>" và batch vẫn chạy tiếp khi client
+    mất kết nối; gửi lại request với header Last-Event-ID để nhận tiếp các event bị lỡ.
+    NDJSON không có id nên không nối lại được.
+    
+    Returns:
+        StreamingResponse: batch_start, một event item cho mỗi item khi hoàn thành, batch_end
+    """
+    if output_format == "sse":
+        resumed = _resume_response(http_request, "/agent-testcase/batch")
+        if resumed is not None:
+            return resumed
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch tối đa {BATCH_MAX_ITEMS} items")
+    
+    events = BatchService.process_batch_stream(
+        request.items,
+        concurrency=request.concurrency,
+        bypass_cache=request.bypass_cache,
+        output_format=output_format
+    )
+    headers = {"Cache-Control": "no-cache", "Connection": "keep-alive"}
+    if output_format == "ndjson":
+        return _sse_response(http_request, "/agent-testcase/batch", events, headers=headers, media_type="application/x-ndjson")
+    
+    stream = stream_registry.create(events)
+    return _sse_response(
+        http_request,
+        "/agent-testcase/batch",
+        _resume_events(stream, 0),
+        headers={**headers, "X-Stream-Id": stream.stream_id}
+    )
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Thống kê hit/miss của response cache và số request được gộp (single-flight) cho /agent-testcase"""
+    return {
+        **response_cache.snapshot(),
+        "single_flight": single_flight.snapshot()
+    }
+
+@app.get("/attachments/stats")
+async def attachment_stats():
+    """Thống kê chuẩn hóa ảnh, kho attachment (dedup, cache base64) và index retrieval"""
+    return {
+        "normalizer": image_normalizer.snapshot(),
+        "store": attachment_store.snapshot(),
+        "retrieval": attachment_retriever.snapshot()
+    }
+
+@app.get("/history/stats")
+async def history_stats():
+    """Thống kê nén lịch sử hội thoại: prompt tokens mỗi lần gọi model trước/sau khi nén"""
+    return agent_module.history_stats()
+
 # Request Management APIs
 @app.post("/requests", response_model=RequestResponse)
 async def create_request(request: RequestCreate):
     """Tạo request mới"""
     try:
-        result = db_manager.create_request(request.title, request.pbi_requirement)
+        result = await async_db_manager.create_request(request.title, request.pbi_requirement)
         if result:
             return RequestResponse(**result)
         else:
@@ -172,12 +538,40 @@ async def create_request(request: RequestCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/requests", response_model=List[RequestResponse])
-async def get_all_requests():
-    """Lấy tất cả requests"""
+async def _collect_pages(
+    fetch_page: Callable[[int, Optional[str]], Awaitable[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """Toàn bộ kết quả, đọc lần lượt từng trang keyset (dành cho client cũ không gửi limit/cursor)"""
+    items: List[Dict[str, Any]] = []
+    cursor = None
+    while True:
+        page = await fetch_page(MAX_PAGE_SIZE, cursor)
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return items
+
+@app.get("/requests", response_model=Union[RequestPage, List[RequestResponse]])
+async def get_all_requests(
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """
+    Lấy danh sách requests (mới cập nhật trước)
+    
+    Có limit hoặc cursor: một trang keyset ({"items", "next_cursor"}). Không có cả hai:
+    danh sách đầy đủ như trước khi có phân trang, để client cũ không bị ảnh hưởng.
+    """
     try:
-        requests = db_manager.get_all_requests()
-        return [RequestResponse(**req) for req in requests]
+        if limit is None and cursor is None:
+            return [RequestResponse(**req) for req in await _collect_pages(async_db_manager.get_requests_page)]
+        page = await async_db_manager.get_requests_page(limit, cursor)
+        return RequestPage(
+            items=[RequestResponse(**req) for req in page["items"]],
+            next_cursor=page["next_cursor"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -185,7 +579,7 @@ async def get_all_requests():
 async def get_request(conversation_id: str):
     """Lấy request theo conversation_id"""
     try:
-        request = db_manager.get_request_by_conversation_id(conversation_id)
+        request = await async_db_manager.get_request_by_conversation_id(conversation_id)
         if request:
             return RequestResponse(**request)
         else:
@@ -193,20 +587,109 @@ async def get_request(conversation_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/requests/{conversation_id}/messages", response_model=List[MessageResponse])
-async def get_messages(conversation_id: str):
-    """Lấy tất cả messages của một conversation"""
+@app.get("/requests/{conversation_id}/similar", response_model=List[SimilarRequest])
+async def get_similar_requests(
+    conversation_id: str,
+    limit: int = Query(5, ge=1, le=50),
+    threshold: Optional[float] = Query(None, ge=0, le=1)
+):
+    """Các request khác có PBI gần trùng (MinHash/LSH), độ tương đồng giảm dần"""
+    request = await async_db_manager.get_request_by_conversation_id(conversation_id)
+    if not request:
+        raise HTTPException(status_code=404, detail="Request không tồn tại")
+    try:
+        similar = await async_db_manager.find_similar_requests(
+            request["pbi_requirement"], conversation_id, limit, threshold
+        )
+        return [SimilarRequest(**item) for item in similar]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/requests/{conversation_id}/messages", response_model=Union[MessagePage, List[MessageResponse]])
+async def get_messages(
+    conversation_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """
+    Lấy messages của một conversation (cũ trước)
+    
+    Có limit hoặc cursor: một trang keyset ({"items", "next_cursor"}). Không có cả hai:
+    danh sách đầy đủ như trước khi có phân trang, để client cũ không bị ảnh hưởng.
+    """
+    try:
+        if limit is None and cursor is None:
+            messages = await _collect_pages(
+                lambda page_limit, page_cursor: async_db_manager.get_messages_page(conversation_id, page_limit, page_cursor)
+            )
+            return [MessageResponse(**msg) for msg in messages]
+        page = await async_db_manager.get_messages_page(conversation_id, limit, cursor)
+        return MessagePage(
+            items=[MessageResponse(**msg) for msg in page["items"]],
+            next_cursor=page["next_cursor"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/search", response_model=SearchPage)
+async def search(
+    q: str = Query(..., min_length=1, max_length=500),
+    scope: str = Query("all", pattern="^(all|requests|messages)$"),
+    conversation_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """
+    Tìm kiếm full-text trên title/PBI của requests và nội dung messages
+    
+    Kết quả xếp theo độ liên quan (BM25); với từ quá phổ biến xếp theo thời gian (ranking = "recent").
+    Từ khớp được đánh dấu bằng <mark>...</mark>.
+    Các từ được AND với nhau; dùng "cụm từ" để tìm theo cụm, từ* để tìm theo tiền tố.
+    """
     try:
-        messages = db_manager.get_messages_by_conversation_id(conversation_id)
-        return [MessageResponse(**msg) for msg in messages]
+        page = await async_db_manager.search(q, scope, conversation_id, limit, cursor)
+        return SearchPage(
+            items=[SearchHit(**hit) for hit in page["items"]],
+            next_cursor=page["next_cursor"],
+            ranking=page["ranking"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/requests/{conversation_id}/testcases", response_model=TestcasePage)
+async def get_testcases(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """Lấy testcases (kèm các bước) đã tách từ các response của agent, theo trang và thứ tự tạo"""
+    try:
+        page, total = await asyncio.gather(
+            async_db_manager.get_testcases_page(conversation_id, limit, cursor),
+            async_db_manager.count_testcases(conversation_id)
+        )
+        return TestcasePage(
+            items=[TestcaseResponse(**testcase) for testcase in page["items"]],
+            total=total,
+            next_cursor=page["next_cursor"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/requests/{conversation_id}")
 async def delete_request(conversation_id: str):
-    """Xóa request và tất cả messages liên quan"""
+    """Xóa request và tất cả messages, testcases liên quan"""
     try:
-        success = db_manager.delete_request(conversation_id)
+        # Checkpoint của agent cho conversation này được xóa cùng request trong DB layer
+        # (không dựng checkpointer/agent cho route CRUD), chỉ còn phải bỏ bản trong hot tier
+        success = await async_db_manager.delete_request(conversation_id)
+        agent_module.forget_thread(conversation_id)
         if success:
             return {"message": "Request đã được xóa thành công"}
         else:
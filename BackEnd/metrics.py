@@ -0,0 +1,240 @@
+"""
+Metrics: counter/histogram trong process và xuất theo Prometheus text format (GET /metrics)
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Sequence, Tuple, Union
+
+# Bucket (giây) cho latency request/DB/agent
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Bucket cho số event và số bytes của một SSE stream
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Counter theo bộ label (giá trị label truyền theo thứ tự labelnames)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Histogram:
+    """Histogram với bucket cố định; mỗi series lưu số mẫu theo bucket, tổng và số lượng"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [counts theo bucket (không cộng dồn, phần tử cuối là +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items()]
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class GaugeCallback:
+    """Gauge đọc giá trị hiện tại từ callback lúc scrape (không tốn chi phí trên hot path)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Union[float, int]]):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            return [f"{self.name} {_format_value(self.callback())}"]
+        except Exception:
+            return []
+
+
+class MetricsRegistry:
+    """Tập các metric được xuất ở /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Histogram, GaugeCallback]] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], Union[float, int]]) -> GaugeCallback:
+        return self.register(GaugeCallback(name, documentation, callback))
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "Số HTTP request theo route và status", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Thời gian tới khi response bắt đầu (với SSE: tới khi gửi header)", ("method", "route")
+)
+SSE_TIME_TO_FIRST_CHUNK = registry.histogram(
+    "sse_time_to_first_chunk_seconds", "Thời gian từ khi mở stream tới event chunk đầu tiên", ("route",)
+)
+SSE_STREAM_DURATION = registry.histogram(
+    "sse_stream_duration_seconds", "Thời gian của một SSE stream", ("route",)
+)
+SSE_STREAM_EVENTS = registry.histogram(
+    "sse_stream_events", "Số event gửi trong một SSE stream", ("route",), buckets=COUNT_BUCKETS
+)
+SSE_STREAM_BYTES = registry.histogram(
+    "sse_stream_bytes", "Số bytes (UTF-8) gửi trong một SSE stream", ("route",), buckets=SIZE_BUCKETS
+)
+SSE_STREAMS = registry.counter(
+    "sse_streams_total", "Số SSE stream theo kết quả (completed, disconnected, error)", ("route", "outcome")
+)
+SSE_CLIENT_DISCONNECTS = registry.counter(
+    "sse_client_disconnects_total", "Số SSE stream bị client ngắt kết nối trước khi kết thúc", ("route",)
+)
+DB_OPERATION_DURATION = registry.histogram(
+    "db_operation_duration_seconds", "Thời gian một thao tác DatabaseManager (gồm thời gian chờ executor)", ("method",)
+)
+DB_OPERATION_ERRORS = registry.counter(
+    "db_operation_errors_total", "Số thao tác DatabaseManager bị lỗi", ("method",)
+)
+AGENT_CALL_DURATION = registry.histogram(
+    "agent_call_duration_seconds", "Thời gian một lời gọi agent (gồm các lần gọi LLM upstream)", ("operation",)
+)
+AGENT_CALLS = registry.counter(
+    "agent_calls_total", "Số lời gọi agent theo kết quả (ok, error, cancelled)", ("operation", "outcome")
+)
+
+
+def record_agent_call(operation: str, start: float, outcome: str):
+    """Ghi thời gian và kết quả một lời gọi agent bắt đầu tại `start` (perf_counter)"""
+    AGENT_CALL_DURATION.observe(time.perf_counter() - start, operation)
+    AGENT_CALLS.inc(operation, outcome)
+
+
+async def instrument_sse(route: str, stream: AsyncIterator[str]) -> AsyncGenerator[bytes, None]:
+    """
+    Phát lại stream SSE dưới dạng bytes và ghi time-to-first-chunk, thời lượng, số event, số bytes
+
+    Frame được encode UTF-8 đúng một lần tại đây (StreamingResponse và gzip_stream nhận bytes nên
+    không encode lại), số bytes lấy từ kết quả đó. Event chunk đầu tiên nhận biết qua event_type
+    do encoder gắn vào frame (SSEFrame), không đọc nội dung frame. Trong vòng lặp chỉ cập nhật
+    biến cục bộ; metric được ghi một lần khi stream kết thúc.
+    """
+    start = time.perf_counter()
+    first_chunk_at = None
+    events = 0
+    size = 0
+    outcome = "error"
+    try:
+        async for frame in stream:
+            if first_chunk_at is None and getattr(frame, "event_type", None) == "chunk":
+                first_chunk_at = time.perf_counter()
+            body = frame.encode("utf-8")
+            events += 1
+            size += len(body)
+            yield body
+        outcome = "completed"
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = "disconnected"
+        raise
+    finally:
+        if first_chunk_at is not None:
+            SSE_TIME_TO_FIRST_CHUNK.observe(first_chunk_at - start, route)
+        SSE_STREAM_DURATION.observe(time.perf_counter() - start, route)
+        SSE_STREAM_EVENTS.observe(events, route)
+        SSE_STREAM_BYTES.observe(size, route)
+        SSE_STREAMS.inc(route, outcome)
+        if outcome == "disconnected":
+            SSE_CLIENT_DISCONNECTS.inc(route)
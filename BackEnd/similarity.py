@@ -0,0 +1,126 @@
+"""
+Phát hiện yêu cầu gần trùng: MinHash trên shingle ký tự của PBI + LSH banding để tra ứng viên theo index
+"""
+import hashlib
+import operator
+import os
+import re
+import struct
+import unicodedata
+from typing import List, Optional, Sequence, Tuple
+
+SIMILAR_REQUESTS_ENABLED = os.getenv("SIMILAR_REQUESTS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Độ tương đồng Jaccard (ước lượng) tối thiểu để coi là gần trùng
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
+# Số ứng viên tối đa (nhiều band trùng nhất) được so signature sau bước tra LSH
+SIMILARITY_MAX_CANDIDATES = int(os.getenv("SIMILARITY_MAX_CANDIDATES", "200"))
+# Số request gần trùng trả về / gửi trong event "similar"
+SIMILAR_REQUESTS_LIMIT = int(os.getenv("SIMILAR_REQUESTS_LIMIT", "3"))
+# Số testcase tối đa của request cũ được đưa vào prompt khi reuse_similar
+SIMILAR_SEED_MAX_TESTCASES = int(os.getenv("SIMILAR_SEED_MAX_TESTCASES", "40"))
+
+# Tham số của index (đổi giá trị cần index lại bảng request_signatures/request_lsh).
+# Shingle 8 ký tự: các PBI viết theo cùng mẫu user story chỉ chung phần khung, Jaccard thấp hơn hẳn bản viết lại.
+# 21 band x 6 hàng: cặp có Jaccard 0.7 trùng ít nhất một band với xác suất ~93%, 0.8 ~99.8%, 0.3 chỉ ~1.5%
+SHINGLE_CHARS = 8
+LSH_BANDS = 21
+LSH_ROWS = 6
+
+_NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+_EMPTY = (1 << 64) - 1
+
+
+def normalize(text: str) -> str:
+    """Chữ thường, bỏ dấu (kể cả đ), gộp dấu câu/khoảng trắng thành một khoảng trắng"""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D").casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD_RE.sub(" ", text).strip()
+
+
+def shingles(text: str, size: int = SHINGLE_CHARS) -> set:
+    """Tập các đoạn `size` ký tự liên tiếp của text đã chuẩn hoá"""
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """
+    MinHash một lần băm (one permutation hashing) có densification
+
+    Mỗi shingle chỉ được băm một lần: 32 bit cao chọn bin, 32 bit thấp là giá trị, mỗi bin giữ giá trị nhỏ nhất.
+    Bin rỗng (text ngắn) mượn giá trị của bin kế tiếp kèm offset theo khoảng cách, nên hai signature
+    vẫn trùng ở mỗi vị trí với xác suất xấp xỉ độ tương đồng Jaccard của hai tập shingle.
+    """
+
+    def __init__(self, bands: int = LSH_BANDS, rows: int = LSH_ROWS, shingle_chars: int = SHINGLE_CHARS):
+        self.bands = bands
+        self.rows = rows
+        self.shingle_chars = shingle_chars
+        self.num_perm = bands * rows
+
+    def signature(self, text: str) -> Optional[List[int]]:
+        """Signature num_perm giá trị (None nếu text không có chữ nào)"""
+        values = shingles(text, self.shingle_chars)
+        if not values:
+            return None
+        signature = [_EMPTY] * self.num_perm
+        for shingle in values:
+            digest = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+            slot = (digest >> 32) % self.num_perm
+            value = digest & 0xFFFFFFFF
+            if value < signature[slot]:
+                signature[slot] = value
+        if _EMPTY in signature:
+            # Duyệt vòng tròn từ phải sang trái: bin rỗng lấy bin không rỗng gần nhất bên phải,
+            # offset theo khoảng cách để giá trị mượn khác giá trị gốc
+            dense = list(signature)
+            nearest = None
+            for i in reversed(range(2 * self.num_perm)):
+                slot = i % self.num_perm
+                if signature[slot] != _EMPTY:
+                    nearest = i
+                elif nearest is not None and i < self.num_perm:
+                    dense[slot] = ((nearest - i) << 32) | signature[nearest % self.num_perm]
+            signature = dense
+        return signature
+
+    def buckets(self, signature: Sequence[int]) -> List[int]:
+        """Một bucket (int64 có dấu, kèm chỉ số band) cho mỗi band của signature"""
+        packed = self.pack(signature)
+        width = self.rows * 8
+        return [
+            int.from_bytes(
+                hashlib.blake2b(band.to_bytes(2, "little") + packed[band * width:(band + 1) * width], digest_size=8).digest(),
+                "little",
+                signed=True
+            )
+            for band in range(self.bands)
+        ]
+
+    def sketch(self, text: str) -> Optional[Tuple[List[int], List[int]]]:
+        """(signature, buckets) của text, None nếu text không có chữ nào"""
+        signature = self.signature(text)
+        return None if signature is None else (signature, self.buckets(signature))
+
+    def pack(self, signature: Sequence[int]) -> bytes:
+        return struct.pack(f"<{self.num_perm}Q", *signature)
+
+    def unpack(self, blob: bytes) -> tuple:
+        return struct.unpack(f"<{self.num_perm}Q", blob)
+
+    def pack_buckets(self, buckets: Sequence[int]) -> bytes:
+        return struct.pack(f"<{self.bands}q", *buckets)
+
+    def unpack_buckets(self, blob: bytes) -> tuple:
+        return struct.unpack(f"<{self.bands}q", blob)
+
+    @staticmethod
+    def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+        """Ước lượng Jaccard: tỷ lệ vị trí trùng nhau của hai signature"""
+        return sum(map(operator.eq, a, b)) / len(a)
+
+
+# Singleton instance
+minhasher = MinHasher()
@@ -0,0 +1,18 @@
+"""
+Cấu hình chung cho test: import module của app từ BackEnd và chạy trong thư mục làm việc tạm
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Các module của app tạo database/checkpoint theo đường dẫn tương đối ngay khi import:
+# chạy test trong thư mục làm việc tạm để không ghi vào testcase_agent.db của repo
+WORK_DIR = tempfile.mkdtemp(prefix="tests_")
+os.chdir(WORK_DIR)
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
@@ -0,0 +1,107 @@
+"""
+Test AdmissionController: giới hạn slot, hàng đợi FIFO, từ chối/timeout và vé background
+"""
+import asyncio
+
+import pytest
+
+from Service.admission_control import AdmissionController, AdmissionRejected, AdmissionTimeout
+
+
+async def _until_admitted(ticket):
+    while not ticket.admitted:
+        await ticket.wait()
+
+
+def test_admits_until_max_concurrency_then_queues_fifo():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=2, max_queue=2, queue_timeout=5)
+        first, second = controller.enqueue(), controller.enqueue()
+        third, fourth = controller.enqueue(), controller.enqueue()
+        assert first.admitted and second.admitted
+        assert (third.position, fourth.position) == (1, 2)
+
+        first.release()
+        assert third.admitted and third.position == 0
+        assert fourth.position == 1
+        # Gọi release nhiều lần không trả slot hai lần
+        first.release()
+        assert controller.active == 2
+
+    asyncio.run(scenario())
+
+
+def test_interactive_rejected_when_queue_full():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        controller.enqueue()
+        controller.enqueue()
+        with pytest.raises(AdmissionRejected) as error:
+            controller.enqueue()
+        assert error.value.retry_after >= 1
+        assert controller.stats["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_interactive_ticket_times_out_in_queue():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        controller.enqueue()
+        ticket = controller.enqueue()
+        with pytest.raises(AdmissionTimeout):
+            await _until_admitted(ticket)
+        assert controller.queue_depth == 0
+        assert controller.stats["timeouts"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_background_tickets_not_counted_in_queue_and_never_time_out():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        holder = controller.enqueue()
+        # Hàng đợi đã có nhiều vé background hơn max_queue nhưng request interactive vẫn được xếp hàng
+        background = [controller.enqueue(background=True) for _ in range(3)]
+        interactive = controller.enqueue()
+        assert controller.snapshot()["background_waiting"] == 3
+        assert interactive.position == 4
+        with pytest.raises(AdmissionRejected):
+            controller.enqueue()
+
+        # Vé background chờ quá queue_timeout mà không hết hạn; vé interactive thì hết hạn
+        waiter = asyncio.create_task(_until_admitted(background[0]))
+        with pytest.raises(AdmissionTimeout):
+            await _until_admitted(interactive)
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+        assert controller.stats["timeouts"] == 1
+
+        # Slot được trả: vé background được cấp theo thứ tự FIFO
+        holder.release()
+        await waiter
+        assert background[0].admitted
+        assert [ticket.position for ticket in background[1:]] == [1, 2]
+        background[0].release()
+        assert background[1].admitted
+        assert controller.snapshot()["background_waiting"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_background_slot_never_rejected():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=0.01)
+        order = []
+
+        async def job(name: str):
+            async with controller.slot(background=True):
+                order.append(name)
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(*(job(name) for name in "abc"))
+        assert order == ["a", "b", "c"]
+        assert controller.stats["rejected"] == controller.stats["timeouts"] == 0
+        assert controller.active == 0 and controller.queue_depth == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,58 @@
+"""
+Test _TextBudgetDecoder: decode UTF-8 theo chunk trong ngân sách ký tự và fallback latin-1
+"""
+from typing import Tuple
+
+from Service.attachment_service import _TextBudgetDecoder
+
+
+def _decode(data: bytes, max_chars: int, chunk_size: int) -> Tuple[_TextBudgetDecoder, str]:
+    decoder = _TextBudgetDecoder(max_chars)
+    for start in range(0, len(data), chunk_size):
+        decoder.update(data[start:start + chunk_size])
+    return decoder, decoder.finish()
+
+
+def test_utf8_split_across_chunks():
+    source = "Kiểm thử đăng nhập ✓ " * 20
+    decoder, text = _decode(source.encode("utf-8"), max_chars=10_000, chunk_size=3)
+    assert text == source
+    assert decoder.utf8 and not decoder.truncated
+
+
+def test_utf8_truncated_at_budget():
+    source = "ưu tiên " * 100
+    decoder, text = _decode(source.encode("utf-8"), max_chars=50, chunk_size=16)
+    assert text == source[:50]
+    assert decoder.utf8 and decoder.truncated
+
+
+def test_invalid_utf8_falls_back_to_latin1_of_original_bytes():
+    # Phần đầu hợp lệ UTF-8 (đã decode rồi mới gặp lỗi) phải được khôi phục đúng bytes gốc
+    data = "Tiêu đề: ".encode("utf-8") + b"caf\xe9 " * 50
+    decoder, text = _decode(data, max_chars=10_000, chunk_size=4)
+    assert not decoder.utf8
+    assert text == data.decode("latin-1")
+    assert not decoder.truncated
+
+
+def test_latin1_fallback_respects_budget():
+    data = "Bước ".encode("utf-8") + b"\xff" * 500
+    decoder, text = _decode(data, max_chars=100, chunk_size=7)
+    assert text == data[:100].decode("latin-1")
+    assert decoder.truncated
+
+
+def test_incomplete_sequence_at_end_falls_back_to_latin1():
+    # File kết thúc giữa một ký tự nhiều byte: chỉ phát hiện được khi finish
+    data = "Kết quả".encode("utf-8") + "ả".encode("utf-8")[:1]
+    decoder, text = _decode(data, max_chars=1000, chunk_size=5)
+    assert not decoder.utf8
+    assert text == data.decode("latin-1")
+
+
+def test_invalid_bytes_after_budget_are_ignored():
+    data = "a" * 20 + "\xff"
+    decoder, text = _decode(data.encode("latin-1"), max_chars=10, chunk_size=10)
+    assert decoder.utf8 and decoder.truncated
+    assert text == "a" * 10
@@ -0,0 +1,114 @@
+"""
+Test SQLiteTieredSaver: hot tier (LRU/TTL, pin, thread tạm) và cold tier SQLite dùng chung giữa các worker
+"""
+import sqlite3
+
+import pytest
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+
+from checkpointer import SQLiteTieredSaver
+
+
+def _config(thread_id: str, **configurable):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", **configurable}}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "checkpoints.db")
+
+
+@pytest.fixture
+def saver(db_path):
+    saver = SQLiteTieredSaver(db_path, max_threads=2)
+    yield saver
+    saver.close()
+
+
+def _disk_rows(db_path: str, thread_id: str) -> int:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM agent_checkpoints WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+
+def test_hot_hits_skip_disk_until_another_connection_commits(saver, db_path):
+    checkpoint = empty_checkpoint()
+    saved = saver.put(_config("t1"), checkpoint, {}, {})
+    saver.put_writes(saved, [("messages", "hello")], "task-1")
+
+    for _ in range(3):
+        result = saver.get_tuple(_config("t1"))
+        assert result.checkpoint["id"] == checkpoint["id"]
+        assert result.pending_writes == [("task-1", "messages", "hello")]
+    assert saver.stats["hot_hits"] == 3
+    assert saver.stats["disk_checks"] == saver.stats["cold_loads"] == 0
+
+    # Commit của connection khác (không đụng tới checkpoint): kiểm tra disk một lần rồi lại dùng hot tier
+    with sqlite3.connect(db_path) as other:
+        other.execute("CREATE TABLE unrelated (id INTEGER)")
+    saver.get_tuple(_config("t1"))
+    saver.get_tuple(_config("t1"))
+    assert saver.stats["disk_checks"] == 1
+    assert saver.stats["hot_hits"] == 5
+
+
+def test_checkpoint_written_by_other_worker_is_not_served_from_hot_tier(saver, db_path):
+    first = empty_checkpoint()
+    saved = saver.put(_config("t1"), first, {}, {})
+    assert saver.get_tuple(_config("t1")).checkpoint["id"] == first["id"]
+
+    other = SQLiteTieredSaver(db_path)
+    try:
+        second = create_checkpoint(first, None, 2)
+        other.put(saved, second, {}, {})
+    finally:
+        other.close()
+
+    assert saver.get_tuple(_config("t1")).checkpoint["id"] == second["id"]
+    assert saver.stats["cold_loads"] == 1
+
+
+def test_evicted_thread_reloaded_from_disk(saver, db_path):
+    checkpoints = {thread_id: empty_checkpoint() for thread_id in ("t1", "t2", "t3")}
+    for thread_id, checkpoint in checkpoints.items():
+        saver.put(_config(thread_id), checkpoint, {"step": 1}, {})
+    # max_threads=2: t1 (ít dùng gần đây nhất) bị bỏ khỏi hot tier nhưng vẫn còn trong SQLite
+    assert saver.hot_size() == 2
+    assert saver.stats["evictions"] == 1
+    assert _disk_rows(db_path, "t1") == 1
+
+    result = saver.get_tuple(_config("t1"))
+    assert result.checkpoint["id"] == checkpoints["t1"]["id"]
+    assert result.metadata["step"] == 1
+    assert saver.stats["cold_loads"] == 1
+    assert saver.get_tuple(_config("t1", checkpoint_id="missing")) is None
+
+
+def test_temporary_thread_stays_in_memory(saver, db_path):
+    saver.put(_config("temp_a"), empty_checkpoint(), {}, {})
+    assert saver.get_tuple(_config("temp_a")) is not None
+    assert _disk_rows(db_path, "temp_a") == 0
+
+    # Thread tạm bị evict là mất hẳn
+    saver.evict("temp_a")
+    assert saver.get_tuple(_config("temp_a")) is None
+
+
+def test_pinned_thread_not_evicted(saver):
+    with saver.pinned("temp_a"):
+        saved = saver.put(_config("temp_a"), empty_checkpoint(), {}, {})
+        for thread_id in ("t1", "t2", "t3"):
+            saver.put(_config(thread_id), empty_checkpoint(), {}, {})
+        assert saver.get_tuple(_config("temp_a")) is not None
+        saver.put_writes(saved, [("messages", 1)], "task-1")
+    assert saver.get_tuple(_config("temp_a")).pending_writes == [("task-1", "messages", 1)]
+
+    # Hết pin: thread tạm bị evict theo LRU như thread khác
+    for thread_id in ("t1", "t2"):
+        saver.get_tuple(_config(thread_id))
+    assert saver.get_tuple(_config("temp_a")) is None
+
+
+def test_temporary_writes_for_unknown_checkpoint_raise(saver):
+    saver.put(_config("temp_a"), empty_checkpoint(), {}, {})
+    with pytest.raises(RuntimeError):
+        saver.put_writes(_config("temp_a", checkpoint_id="missing"), [("messages", 1)], "task-1")
@@ -0,0 +1,129 @@
+"""
+Test JobManager: nhận job atomic, lease hết hạn được đưa về queued và chạy lại, phát lại event log
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+from attachment_store import AttachmentStore
+from database import AsyncDatabaseManager, DatabaseManager
+from Service import job_service
+from Service.job_service import JobManager
+from Service.sse_encoder import format_event
+
+
+@pytest.fixture
+def db(tmp_path):
+    async_db = AsyncDatabaseManager(DatabaseManager(str(tmp_path / "jobs.db")))
+    yield async_db
+    async_db.close()
+
+
+@pytest.fixture
+def agent_stream(monkeypatch):
+    """Thay agent bằng stream giả: phát các chunk trong params["chunks"], chờ gate["event"] nếu params["block"]"""
+    gate = {"event": None}
+
+    def fake_stream(conversation_id=None, chunks=(), block=False, background=False):
+        async def frames():
+            for text in chunks:
+                yield format_event({"type": "chunk", "content": text, "conversation_id": conversation_id})
+            if block:
+                await gate["event"].wait()
+            yield format_event({"type": "end", "conversation_id": conversation_id})
+        return frames()
+
+    monkeypatch.setattr(job_service.ChatService, "process_agent_testcase_stream", fake_stream)
+    return gate
+
+
+def _expire_lease(db: AsyncDatabaseManager, job_id: str):
+    with db.manager.transaction() as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?", (time.time() - 3600, job_id))
+
+
+async def _wait_status(db: AsyncDatabaseManager, job_id: str, status: str) -> dict:
+    for _ in range(200):
+        job = await db.get_job(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} không chuyển sang {status}")
+
+
+def test_claim_job_only_once(db):
+    manager = db.manager
+    job = manager.create_job("conv", json.dumps({}))
+    assert job["status"] == "queued"
+
+    claimed = manager.claim_job(job["job_id"], "worker-a")
+    assert claimed["status"] == "running" and claimed["owner"] == "worker-a"
+    assert manager.claim_job(job["job_id"], "worker-b") is None
+    assert manager.list_queued_jobs() == []
+
+
+def test_expired_lease_requeued_and_old_owner_loses_job(db):
+    manager = db.manager
+    alive = manager.create_job("conv", json.dumps({}))["job_id"]
+    dead = manager.create_job("conv", json.dumps({}))["job_id"]
+    manager.claim_job(alive, "worker-a")
+    manager.claim_job(dead, "worker-b")
+
+    # Lease còn hạn: không job nào bị đưa về queued
+    assert manager.requeue_expired_jobs(60) == []
+
+    _expire_lease(db, dead)
+    assert manager.heartbeat_jobs("worker-a") == 1
+    assert manager.requeue_expired_jobs(60) == [dead]
+    job = manager.get_job(dead)
+    assert job["status"] == "queued" and job["owner"] is None
+    assert manager.get_job(alive)["owner"] == "worker-a"
+
+    # Worker cũ không ghi đè được kết quả sau khi job đã được worker khác nhận lại
+    assert manager.claim_job(dead, "worker-c") is not None
+    assert not manager.update_job(dead, owner="worker-b", status="completed")
+    assert manager.update_job(dead, owner="worker-c", status="completed")
+
+
+def test_manager_reruns_expired_job_and_replays_events(db, agent_stream):
+    async def scenario():
+        params = {"conversation_id": "conv", "chunks": ["a", "b", "c"]}
+        job_id = (await db.create_job("conv", json.dumps(params)))["job_id"]
+        await db.claim_job(job_id, "dead-worker")
+        _expire_lease(db, job_id)
+
+        manager = JobManager(db, store=AttachmentStore(db.manager, db), workers=1, heartbeat_interval=60)
+        await manager.start()
+        try:
+            job = await _wait_status(db, job_id, "completed")
+        finally:
+            await manager.stop()
+        assert manager.stats["requeued"] == 1 and manager.stats["completed"] == 1
+        assert job["owner"] == manager.owner and job["result"] == "abc"
+        assert [event["type"] for event in json.loads(job["events"])] == ["chunk", "chunk", "chunk", "end"]
+
+        # Kết nối lại sau event 2: nhận event 3, 4 với cùng id như lúc chạy
+        frames = [frame async for frame in manager.subscribe(job_id, after_seq=2)]
+        assert [frame.splitlines()[0] for frame in frames] == [f"id: {job_id}:3", f"id: {job_id}:4"]
+        assert frames[0].data["content"] == "c"
+        assert "params" not in await manager.get(job_id)
+
+    asyncio.run(scenario())
+
+
+def test_stop_releases_running_jobs(db, agent_stream):
+    async def scenario():
+        agent_stream["event"] = asyncio.Event()
+        manager = JobManager(db, store=AttachmentStore(db.manager, db), workers=1, heartbeat_interval=60)
+        await manager.start()
+        job_id = (await manager.submit({"conversation_id": "conv", "chunks": ["a"], "block": True}))["job_id"]
+        await _wait_status(db, job_id, "running")
+        await manager.stop()
+
+        job = await db.get_job(job_id)
+        assert job["status"] == "queued" and job["owner"] is None
+        assert await db.list_queued_jobs() == [job_id]
+
+    asyncio.run(scenario())
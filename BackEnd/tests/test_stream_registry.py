@@ -0,0 +1,143 @@
+"""
+Test ResumableStream/StreamRegistry: replay theo Last-Event-ID, phát hiện gap và giới hạn buffer
+"""
+import asyncio
+
+import pytest
+
+from Service.stream_registry import StreamGapError, StreamRegistry
+
+
+async def _frames(count: int, size: int = 10):
+    for index in range(count):
+        yield f"data: {str(index).zfill(size)}\n\n"
+
+
+async def _collect(stream, after_seq: int = 0):
+    return [frame async for frame in stream.subscribe(after_seq)]
+
+
+def _payload(frame: str) -> int:
+    return int(frame.split("data: ")[1])
+
+
+def test_parse_event_id():
+    assert StreamRegistry.parse_event_id("sabc:12") == ("sabc", 12)
+    assert StreamRegistry.parse_event_id(" s:a:3 ") == ("s:a", 3)
+    for invalid in ("", "sabc", ":3", "sabc:", "sabc:x"):
+        with pytest.raises(ValueError):
+            StreamRegistry.parse_event_id(invalid)
+
+
+def test_replay_after_last_event_id():
+    async def scenario():
+        registry = StreamRegistry(max_events=100, max_bytes=1 << 20)
+        stream = registry.create(_frames(5))
+        frames = await _collect(stream)
+        assert [_payload(frame) for frame in frames] == [0, 1, 2, 3, 4]
+        assert frames[0].startswith(f"id: {stream.stream_id}:1\n")
+
+        # Kết nối lại sau event thứ 3: chỉ nhận event 4, 5 với cùng id
+        assert registry.get(stream.stream_id) is stream
+        replayed = await _collect(stream, after_seq=3)
+        assert replayed == frames[3:]
+        assert await _collect(stream, after_seq=5) == []
+        assert registry.stats["resumes"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_live_subscriber_receives_new_events():
+    async def scenario():
+        source: asyncio.Queue = asyncio.Queue()
+
+        async def frames():
+            while True:
+                item = await source.get()
+                if item is None:
+                    return
+                yield f"data: {item}\n\n"
+
+        registry = StreamRegistry(max_events=100, max_bytes=1 << 20)
+        stream = registry.create(frames())
+        source.put_nowait(1)
+        reader = asyncio.create_task(_collect(stream))
+        await asyncio.sleep(0)
+        source.put_nowait(2)
+        source.put_nowait(None)
+        assert [_payload(frame) for frame in await reader] == [1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_gap_when_events_evicted_by_max_events():
+    async def scenario():
+        registry = StreamRegistry(max_events=3, max_bytes=1 << 20)
+        stream = registry.create(_frames(10))
+        await stream._task
+        assert [seq for seq, _ in stream.events] == [8, 9, 10]
+        assert registry.stats["evicted_events"] == 7
+
+        # Event 7 vẫn còn ngay sau after_seq = 7 thì phát lại được, sau seq 3 thì thiếu event 4..7
+        assert [_payload(frame) for frame in await _collect(stream, after_seq=7)] == [7, 8, 9]
+        with pytest.raises(StreamGapError):
+            await _collect(stream, after_seq=3)
+        with pytest.raises(StreamGapError):
+            await _collect(stream)
+
+    asyncio.run(scenario())
+
+
+def test_finished_streams_evicted_before_running_ones():
+    async def scenario():
+        frame_size = len(f"id: s000000000000:1\ndata: {'0' * 10}\n\n")
+        registry = StreamRegistry(max_events=100, max_bytes=frame_size * 6)
+        finished = registry.create(_frames(4))
+        await finished._task
+
+        source: asyncio.Queue = asyncio.Queue()
+
+        async def frames():
+            while True:
+                item = await source.get()
+                if item is None:
+                    return
+                yield f"data: {str(item).zfill(10)}\n\n"
+
+        running = registry.create(frames())
+        for index in range(4):
+            source.put_nowait(index)
+        await asyncio.sleep(0.01)
+
+        # Vượt giới hạn: stream đã kết thúc bị bỏ cả, stream đang chạy giữ nguyên
+        assert registry.get(finished.stream_id) is None
+        assert registry.stats["evicted_streams"] == 1
+        assert len(running.events) == 4
+        assert registry.buffered_bytes <= registry.max_bytes
+
+        # Chỉ còn stream đang chạy: event cũ nhất của nó bị bỏ
+        for index in range(4, 8):
+            source.put_nowait(index)
+        await asyncio.sleep(0.01)
+        assert registry.buffered_bytes <= registry.max_bytes
+        assert running.events[0][0] > 1
+        assert running.events[-1][0] == 8
+        with pytest.raises(StreamGapError):
+            await _collect(running)
+        source.put_nowait(None)
+        await running._task
+
+    asyncio.run(scenario())
+
+
+def test_finished_stream_expires_after_grace():
+    async def scenario():
+        registry = StreamRegistry(max_events=100, max_bytes=1 << 20, grace_seconds=0)
+        stream = registry.create(_frames(2))
+        await stream._task
+        await asyncio.sleep(0.01)
+        assert registry.get(stream.stream_id) is None
+        assert registry.buffered_bytes == 0
+        assert registry.snapshot()["retained_streams"] == 0
+
+    asyncio.run(scenario())
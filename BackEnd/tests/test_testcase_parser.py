@@ -0,0 +1,103 @@
+"""
+Test TestcaseStreamParser: các format markdown của agent và parse tăng dần theo từng đoạn stream
+"""
+# Import theo module: tên class bắt đầu bằng "Test" sẽ bị pytest thu thập nhầm thành test class
+from Service import testcase_parser
+
+Parser = testcase_parser.TestcaseStreamParser
+
+FIELD_FORMAT = """Dưới đây là các testcase:
+
+### Testcase 1
+- Title: Đăng nhập thành công
+- Steps:
+  - Action: Nhập email và mật khẩu hợp lệ
+    Expected result: Các trường hiển thị giá trị đã nhập
+  - Action: Nhấn **Đăng nhập**
+    Expected result: Chuyển tới trang chủ
+
+### Testcase 2
+- Title: Sai mật khẩu
+- Steps:
+  - Action: Nhập mật khẩu sai
+    Expected result: Hiển thị thông báo lỗi
+"""
+
+NUMBERED_FORMAT = """**TC-01 - Tìm kiếm sản phẩm**
+Các bước thực hiện:
+1. Mở trang tìm kiếm
+2. Nhập từ khoá "áo" -> Kết quả mong đợi: Danh sách có sản phẩm chứa "áo"
+
+Test case 2: Tìm kiếm rỗng
+Bước 1: Để trống ô tìm kiếm → Không có request nào được gửi
+"""
+
+TABLE_FORMAT = """## TC3: Thêm vào giỏ hàng
+| # | Hành động | Kết quả mong đợi |
+|---|-----------|------------------|
+| 1 | Chọn sản phẩm | Trang chi tiết hiển thị |
+| 2 | Nhấn "Thêm vào giỏ" | Giỏ hàng tăng 1 |
+"""
+
+
+def _summary(testcases):
+    return [
+        (tc["ordinal"], tc["title"], [(s["step_no"], s["action"], s["expected_result"]) for s in tc["steps"]])
+        for tc in testcases
+    ]
+
+
+def test_parse_field_format():
+    assert _summary(Parser.parse(FIELD_FORMAT)) == [
+        (1, "Đăng nhập thành công", [
+            (1, "Nhập email và mật khẩu hợp lệ", "Các trường hiển thị giá trị đã nhập"),
+            (2, "Nhấn Đăng nhập", "Chuyển tới trang chủ"),
+        ]),
+        (2, "Sai mật khẩu", [(1, "Nhập mật khẩu sai", "Hiển thị thông báo lỗi")]),
+    ]
+
+
+def test_parse_numbered_steps_with_arrow():
+    assert _summary(Parser.parse(NUMBERED_FORMAT)) == [
+        (1, "Tìm kiếm sản phẩm", [
+            (1, "Mở trang tìm kiếm", ""),
+            (2, 'Nhập từ khoá "áo"', 'Danh sách có sản phẩm chứa "áo"'),
+        ]),
+        (2, "Tìm kiếm rỗng", [(1, "Để trống ô tìm kiếm", "Không có request nào được gửi")]),
+    ]
+
+
+def test_parse_markdown_table():
+    assert _summary(Parser.parse(TABLE_FORMAT)) == [
+        (1, "Thêm vào giỏ hàng", [
+            (1, "Chọn sản phẩm", "Trang chi tiết hiển thị"),
+            (2, 'Nhấn "Thêm vào giỏ"', "Giỏ hàng tăng 1"),
+        ]),
+    ]
+
+
+def test_testcase_without_steps_is_skipped():
+    text = "### Testcase 1: Chỉ có tiêu đề\n\n### Testcase 2: Có bước\nBước 1: Mở app -> App mở\n"
+    assert _summary(Parser.parse(text)) == [(1, "Có bước", [(1, "Mở app", "App mở")])]
+    assert Parser.parse("Không có testcase nào trong câu trả lời này.") == []
+
+
+def test_incremental_feed_matches_full_parse():
+    for text in (FIELD_FORMAT, NUMBERED_FORMAT, TABLE_FORMAT):
+        parser = Parser()
+        streamed = []
+        # Cắt stream thành các đoạn nhỏ, ranh giới rơi giữa dòng
+        for start in range(0, len(text), 7):
+            streamed.extend(parser.feed(text[start:start + 7]))
+        streamed.extend(parser.finish())
+        assert streamed == Parser.parse(text)
+
+
+def test_testcase_emitted_when_next_one_starts():
+    parser = Parser()
+    assert parser.feed("### Testcase 1: A\nBước 1: Mở -> Mở được\n") == []
+    completed = parser.feed("### Testcase 2: B\n")
+    assert _summary(completed) == [(1, "A", [(1, "Mở", "Mở được")])]
+    # Dòng cuối không có newline vẫn được xử lý khi kết thúc stream
+    assert parser.feed("Bước 1: Đóng -> Đóng được") == []
+    assert _summary(parser.finish()) == [(2, "B", [(1, "Đóng", "Đóng được")])]
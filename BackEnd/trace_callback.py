@@ -0,0 +1,92 @@
+"""
+Trace callback: span cho các bước graph, lời gọi LLM và tool của agent
+
+Tách khỏi tracing.py để import tracing (lúc khởi động app) không kéo theo langchain_core;
+module này chỉ được import khi có request được trace.
+"""
+
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tracing import Span, Trace
+
+
+class AgentTraceCallback(BaseCallbackHandler):
+    """
+    Callback LangChain tạo span cho các bước của graph (node), lời gọi LLM và tool
+
+    Các run trung gian (RunnableSequence, prompt,...) không tạo span riêng mà được gắn vào
+    span gần nhất phía trên, để cây span chỉ gồm các giai đoạn có ý nghĩa.
+    """
+
+    # Chạy ngay trong luồng gọi callback (không đẩy sang thread pool)
+    run_inline = True
+
+    def __init__(self, trace: Trace, parent: Span):
+        self.trace = trace
+        self.parent = parent
+        self._spans: Dict[UUID, Span] = {}
+        # run_id -> span_id của span cha gần nhất (cho các run không tạo span)
+        self._owners: Dict[UUID, str] = {}
+
+    def _parent_id(self, parent_run_id: Optional[UUID]) -> str:
+        if parent_run_id is None:
+            return self.parent.span_id
+        return self._owners.get(parent_run_id, self.parent.span_id)
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: Optional[str], **attributes: Any):
+        parent_id = self._parent_id(parent_run_id)
+        if name is None:
+            self._owners[run_id] = parent_id
+            return
+        span = self.trace.start_span(name, parent_id=parent_id, **attributes)
+        self._spans[run_id] = span
+        self._owners[run_id] = span.span_id
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **attributes: Any):
+        self._owners.pop(run_id, None)
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.attributes.update(attributes)
+            span.end(error=error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        name = kwargs.get("name")
+        if node and name == node:
+            self._start(run_id, parent_run_id, f"graph.{node}", step=(metadata or {}).get("langgraph_step"))
+        else:
+            self._start(run_id, parent_run_id, None)
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or kwargs.get("name") or "unknown"
+        self._start(run_id, parent_run_id, "llm.call", model=str(model), messages=sum(len(m) for m in messages))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm.call", prompts=len(prompts))
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        attributes = {key: usage[key] for key in ("prompt_tokens", "completion_tokens") if key in usage}
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._start(run_id, parent_run_id, f"tool.{name}")
+
+    def on_tool_end(self, output, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, error=error)
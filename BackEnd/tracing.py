@@ -0,0 +1,371 @@
+"""
+Tracing: span theo từng giai đoạn của một request agent, xuất ra file JSON/OTLP
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Tỷ lệ request được trace khi TRACING_ENABLED (request có debug header luôn được trace)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+# "json" (một trace mỗi dòng) hoặc "otlp" (OTLP/JSON, mỗi dòng một ExportTraceServiceRequest)
+TRACE_EXPORT_FORMAT = os.getenv("TRACE_EXPORT_FORMAT", "json").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+# Header bật trả về bảng thời gian từng giai đoạn trong event SSE "timing" cuối stream
+TRACE_DEBUG_HEADER = os.getenv("TRACE_DEBUG_HEADER", "X-Debug-Timing")
+# Số trace tối đa chờ ghi file; hàng đợi đầy thì trace mới bị bỏ thay vì chặn request
+TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "1000"))
+
+
+class Span:
+    """Một giai đoạn có thời điểm bắt đầu/kết thúc (ns, epoch) và thuộc tính"""
+
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any], start_ns: Optional[int] = None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def end(self, error: Optional[BaseException] = None, end_ns: Optional[int] = None):
+        if self.end_ns is None:
+            self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if error is not None and self.error is None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return round((end_ns - self.start_ns) / 1e6, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Span rỗng cho request không được trace"""
+
+    @property
+    def attributes(self) -> Dict[str, Any]:
+        # Dict mới mỗi lần để ghi thuộc tính vào span rỗng không có tác dụng
+        return {}
+
+    def end(self, error: Optional[BaseException] = None, end_ns: Optional[int] = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """
+    Các span của một request
+
+    Trace được truyền tường minh qua các tầng (endpoint -> ChatService -> async generator)
+    thay vì contextvar, vì generator của StreamingResponse được chạy ở task khác với task
+    tạo ra nó. Span lồng nhau theo stack của trace (các giai đoạn của một request chạy tuần
+    tự); callback của LangGraph gắn span vào cha theo run_id.
+    """
+
+    enabled = True
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None, export: bool = True):
+        self.trace_id = uuid.uuid4().hex
+        self.export = export
+        self.root = Span(name, None, dict(attributes or {}))
+        self.spans: List[Span] = [self.root]
+        self._stack: List[Span] = [self.root]
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Span:
+        return self._stack[-1]
+
+    def start_span(self, name: str, parent_id: Optional[str] = None, **attributes: Any) -> Span:
+        """Tạo span thủ công (không đưa vào stack), cha mặc định là span hiện tại"""
+        span = Span(name, parent_id or self.current.span_id, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Span cho một giai đoạn; các span tạo bên trong là con của nó"""
+        span = self.start_span(name, **attributes)
+        self._stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            span.end()
+            if self._stack and self._stack[-1] is span:
+                self._stack.pop()
+
+    def add_span(self, name: str, duration_seconds: float, **attributes: Any) -> Span:
+        """Span tổng hợp kết thúc tại thời điểm hiện tại (ví dụ tổng thời gian serialize các event)"""
+        end_ns = time.time_ns()
+        span = self.start_span(name, **attributes)
+        span.start_ns = end_ns - int(duration_seconds * 1e9)
+        span.end(end_ns=end_ns)
+        return span
+
+    def breakdown(self) -> Dict[str, Any]:
+        """Bảng thời gian từng giai đoạn (theo thứ tự bắt đầu, kèm độ sâu trong cây span)"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        depth = {self.root.span_id: 0}
+        stages = []
+        for span in spans:
+            if span is self.root:
+                continue
+            depth[span.span_id] = depth.get(span.parent_id, 0) + 1
+            stage = {
+                "name": span.name,
+                "depth": depth[span.span_id],
+                "start_ms": round((span.start_ns - self.root.start_ns) / 1e6, 3),
+                "duration_ms": span.duration_ms,
+            }
+            if span.attributes:
+                stage["attributes"] = span.attributes
+            if span.error:
+                stage["error"] = span.error
+            stages.append(stage)
+        return {"trace_id": self.trace_id, "total_ms": self.root.duration_ms, "stages": stages}
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start_ns": self.root.start_ns,
+            "duration_ms": self.root.duration_ms,
+            "attributes": self.root.attributes,
+            "spans": [span.to_dict() for span in spans if span is not self.root],
+        }
+
+
+class _NoopTrace:
+    """Trace rỗng: mọi thao tác không làm gì, để code được instrument không phải kiểm tra None"""
+
+    enabled = False
+    trace_id = None
+
+    def start_span(self, name: str, parent_id: Optional[str] = None, **attributes: Any) -> _NoopSpan:
+        return _NOOP_SPAN
+
+    def span(self, name: str, **attributes: Any) -> _NoopSpan:
+        return _NOOP_SPAN
+
+    def add_span(self, name: str, duration_seconds: float, **attributes: Any) -> _NoopSpan:
+        return _NOOP_SPAN
+
+
+NOOP_TRACE = _NoopTrace()
+
+
+class JsonFileSink:
+    """
+    Ghi mỗi trace thành một dòng JSON
+
+    export() chỉ đưa trace vào hàng đợi (gọi từ event loop khi stream kết thúc); serialize và
+    ghi file chạy trong một thread nền, gom các trace đang chờ vào một lần ghi.
+    """
+
+    def __init__(self, path: str, queue_size: int = TRACE_EXPORT_QUEUE_SIZE):
+        self.path = path
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize=max(1, queue_size))
+        self.stats = {"written": 0, "write_errors": 0}
+        self._thread = threading.Thread(target=self._writer, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def _line(self, trace: Trace) -> str:
+        return json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+
+    def export(self, trace: Trace) -> bool:
+        """Đưa trace vào hàng đợi ghi, trả về False nếu hàng đợi đầy (trace bị bỏ)"""
+        try:
+            self._queue.put_nowait(trace)
+            return True
+        except queue.Full:
+            return False
+
+    def _writer(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for trace in batch:
+                if trace is None:
+                    continue
+                try:
+                    lines.append(self._line(trace) + "\n")
+                except Exception:
+                    self.stats["write_errors"] += 1
+            if lines:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.writelines(lines)
+                    self.stats["written"] += len(lines)
+                except Exception:
+                    self.stats["write_errors"] += len(lines)
+            if any(trace is None for trace in batch):
+                return
+
+    def close(self, timeout: float = 5.0):
+        """Ghi nốt các trace còn trong hàng đợi rồi dừng thread nền"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+class OtlpFileSink(JsonFileSink):
+    """Ghi mỗi trace thành một dòng OTLP/JSON (định dạng file exporter của OpenTelemetry Collector)"""
+
+    @staticmethod
+    def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+        result = []
+        for key, value in attributes.items():
+            if isinstance(value, bool):
+                encoded = {"boolValue": value}
+            elif isinstance(value, int):
+                encoded = {"intValue": str(value)}
+            elif isinstance(value, float):
+                encoded = {"doubleValue": value}
+            else:
+                encoded = {"stringValue": str(value)}
+            result.append({"key": key, "value": encoded})
+        return result
+
+    def _line(self, trace: Trace) -> str:
+        with trace._lock:
+            trace_spans = list(trace.spans)
+        spans = []
+        for span in trace_spans:
+            otlp_span = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 2 if span is trace.root else 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": self._attributes(span.attributes),
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            spans.append(otlp_span)
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": self._attributes({"service.name": "testcase-agent"})},
+                "scopeSpans": [{"scope": {"name": "testcase-agent.tracing"}, "spans": spans}],
+            }]
+        }, ensure_ascii=False)
+
+
+class Tracer:
+    """Tạo trace cho request và xuất trace đã hoàn thành tới các sink đăng ký"""
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.sinks: List[Any] = []
+        self.stats = {"traces": 0, "exported": 0, "dropped": 0, "export_errors": 0}
+
+    def add_sink(self, sink: Any):
+        """
+        Đăng ký sink
+
+        Sink là object có method export(trace), được gọi trên event loop nên không được chặn;
+        export trả về False nếu trace bị bỏ. Method close() (nếu có) được gọi khi tắt ứng dụng.
+        """
+        self.sinks.append(sink)
+
+    def close(self):
+        """Ghi nốt các trace đang chờ của các sink"""
+        for sink in self.sinks:
+            close = getattr(sink, "close", None)
+            if close is not None:
+                close()
+
+    def start_trace(self, name: str, force: bool = False, **attributes: Any):
+        """
+        Bắt đầu trace cho một request
+
+        Args:
+            force: Luôn trace (ví dụ request có debug header) kể cả khi tracing tắt
+
+        Returns:
+            Trace, hoặc NOOP_TRACE nếu request không được trace
+        """
+        sampled = self.enabled and (self.sample_rate >= 1.0 or random.random() < self.sample_rate)
+        if not sampled and not force:
+            return NOOP_TRACE
+        self.stats["traces"] += 1
+        return Trace(name, attributes, export=sampled)
+
+    def finish(self, trace, error: Optional[BaseException] = None):
+        """Kết thúc root span và xuất trace"""
+        if not trace.enabled or trace.root.end_ns is not None:
+            return
+        trace.root.end(error=error)
+        if not trace.export:
+            return
+        for sink in self.sinks:
+            try:
+                if sink.export(trace) is False:
+                    self.stats["dropped"] += 1
+                else:
+                    self.stats["exported"] += 1
+            except Exception:
+                self.stats["export_errors"] += 1
+
+
+def _default_sinks() -> Sequence[Any]:
+    if not TRACING_ENABLED:
+        return []
+    if TRACE_EXPORT_FORMAT == "otlp":
+        return [OtlpFileSink(TRACE_FILE)]
+    return [JsonFileSink(TRACE_FILE)]
+
+
+# Singleton instance
+tracer = Tracer()
+for _sink in _default_sinks():
+    tracer.add_sink(_sink)
@@ -36,10 +36,15 @@ class APIClient {
     }
 
     /**
-     * Lấy tất cả requests
+     * Lấy một trang requests (keyset pagination)
+     * @returns {Promise<{items: Array, next_cursor: string|null}>}
      */
-    async getAllRequests() {
-        return await this.request('/requests');
+    async getRequestsPage(limit = 50, cursor = null) {
+        const params = new URLSearchParams({ limit });
+        if (cursor) {
+            params.append('cursor', cursor);
+        }
+        return await this.request(`/requests?${params}`);
     }
 
     /**
@@ -63,10 +68,21 @@ class APIClient {
     }
 
     /**
-     * Lấy messages của conversation
+     * Lấy tất cả messages của conversation (duyệt qua các trang)
      */
     async getMessages(conversationId) {
-        return await this.request(`/requests/${conversationId}/messages`);
+        const messages = [];
+        let cursor = null;
+        do {
+            const params = new URLSearchParams({ limit: 200 });
+            if (cursor) {
+                params.append('cursor', cursor);
+            }
+            const page = await this.request(`/requests/${conversationId}/messages?${params}`);
+            messages.push(...page.items);
+            cursor = page.next_cursor;
+        } while (cursor);
+        return messages;
     }
 
     /**
@@ -81,18 +97,23 @@ class APIClient {
     /**
      * Gửi request tới agent với streaming
      */
-    async sendToAgent(conversationId, title, pbiRequirement, fileAttachment = null) {
+    async sendToAgent(conversationId, title, pbiRequirement, fileAttachment = null, lastEventId = null) {
         const formData = new FormData();
         formData.append('conversation_id', conversationId);
         formData.append('title', title);
         formData.append('pbi_requirement', pbiRequirement);
         
-        if (fileAttachment) {
+        // Khi nối lại stream, server phát tiếp từ sau lastEventId nên không cần gửi lại file
+        const headers = {};
+        if (lastEventId) {
+            headers['Last-Event-ID'] = lastEventId;
+        } else if (fileAttachment) {
             formData.append('file_attachment', fileAttachment);
         }
 
         const response = await fetch(`${this.baseURL}/agent-testcase`, {
             method: 'POST',
+            headers: headers,
             body: formData
         });
 